@@ -0,0 +1,275 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+
+import map_tiler_engine as engine
+
+# --- Benchmark suite ---
+# Generates synthetic rasters locally (fixed seed, so every run converts the same pixels),
+# runs each conversion path over a matrix of sizes and resampling methods, and records
+# throughput (megapixels per second), peak memory and output size. Results can be saved as
+# a baseline and later runs compared against it to catch regressions.
+# osgeo and numpy are only needed to generate the inputs.
+
+DEFAULT_SIZES = [2048, 8192]
+# SRTMHGT cases are one-degree cells on the 3 and 1 arc-second SRTM grids, whatever --sizes
+# says: the SRTMHGT driver only writes these sizes.
+SRTM_SIZES = [1201, 3601]
+DEFAULT_RESAMPLINGS = ["average", "nearest", "bilinear"]
+# GDAL data type -> (numpy dtype, value range of the synthetic pixels)
+DATA_TYPES = {
+    "Byte": ("uint8", (0, 255)),
+    "UInt16": ("uint16", (0, 65535)),
+    "Int16": ("int16", (-400, 3000)),
+    "Float32": ("float32", (-400.0, 3000.0)),
+}
+SYNTHETIC_SEED = 1234
+STRIP_ROWS = 512
+# A case regresses when it is this much slower (or uses this much more memory) than the baseline.
+DEFAULT_TOLERANCE = 0.10
+
+
+def synthetic_raster_path(work_dir, size, bands, data_type, geographic):
+    kind = "dtm" if geographic else "map"
+    return os.path.join(work_dir, f"synthetic_{kind}_{size}_{bands}b_{data_type}.tif")
+
+
+def create_synthetic_raster(path, size, bands=3, data_type="Byte", geographic=False):
+    # Smooth gradients plus seeded noise, written in strips so large sizes fit in memory.
+    # geographic=True makes the one-degree EPSG:4326 cell N32E034 on the SRTM grid (samples on
+    # the degree lines, as SRTMHGT expects); otherwise the raster is a projected map with 1 m pixels.
+    import numpy as np
+    from osgeo import gdal, osr
+    gdal.UseExceptions()
+
+    gdal_type = gdal.GetDataTypeByName(data_type)
+    driver = gdal.GetDriverByName("GTiff")
+    dataset = driver.Create(path + ".tmp.tif", size, size, bands, gdal_type, ["TILED=YES", "COMPRESS=NONE", "BIGTIFF=IF_SAFER"])
+    srs = osr.SpatialReference()
+    if geographic:
+        srs.ImportFromEPSG(4326)
+        step = 1.0 / (size - 1)
+        dataset.SetGeoTransform((34.0 - step / 2, step, 0.0, 33.0 + step / 2, 0.0, -step))
+    else:
+        srs.ImportFromEPSG(32636)
+        dataset.SetGeoTransform((600000.0, 1.0, 0.0, 3600000.0, 0.0, -1.0))
+    dataset.SetProjection(srs.ExportToWkt())
+
+    numpy_type, (low, high) = DATA_TYPES[data_type]
+    columns = np.arange(size, dtype=np.float64)
+    for band_index in range(bands):
+        band = dataset.GetRasterBand(band_index + 1)
+        for row in range(0, size, STRIP_ROWS):
+            rows = min(STRIP_ROWS, size - row)
+            rng = np.random.default_rng((SYNTHETIC_SEED, band_index, row))
+            y = np.arange(row, row + rows, dtype=np.float64)[:, None]
+            wave = np.sin(columns[None, :] / (97.0 + 31 * band_index)) * np.cos(y / 131.0)
+            values = 0.5 + 0.35 * wave + 0.15 * rng.random((rows, size))
+            band.WriteArray((low + values * (high - low)).astype(numpy_type), 0, row)
+    dataset.FlushCache()
+    dataset = None
+    os.replace(path + ".tmp.tif", path)
+
+
+def tile_levels(size):
+    max_zoom = max(0, math.ceil(math.log2(size / 256.0)))
+    return f"0-{max_zoom}"
+
+
+def overview_levels(size):
+    factors = []
+    factor = 2
+    while size // factor >= 256:
+        factors.append(str(factor))
+        factor *= 2
+    return " ".join(factors or ["2"])
+
+
+def build_cases(conversion_types, sizes, resamplings, bands, data_type):
+    # One case per conversion type, size and resampling. SRTMHGT cells already on the SRTM
+    # grid are copied without resampling, so it gets one case per SRTM grid size.
+    cases = []
+    for conversion_type in conversion_types:
+        if conversion_type == "srtmhgt":
+            cases += [{"conversion_type": "srtmhgt", "size": size, "resampling": "", "bands": 1, "data_type": "Int16"} for size in SRTM_SIZES]
+            continue
+        for size, resampling in itertools.product(sizes, resamplings):
+            # gdal2tiles and the tile renderer expect 8-bit input.
+            case_type = "Byte" if conversion_type == "tiles" else data_type
+            cases.append({"conversion_type": conversion_type, "size": size, "resampling": resampling, "bands": bands, "data_type": case_type})
+    return cases
+
+
+def case_key(case, options):
+    parts = [case["conversion_type"], str(case["size"]), f"{case['bands']}b", case["data_type"]]
+    if case["resampling"]:
+        parts.append(case["resampling"])
+    if case["conversion_type"] == "overviews":
+        parts.append(options.overview_mode)
+    return "/".join(parts)
+
+
+def case_spec(case, input_file, output_dir, options):
+    spec = engine.ConversionSpec(input_file, case["conversion_type"], output_dir=output_dir)
+    if case["conversion_type"] == "tiles":
+        spec.levels = tile_levels(case["size"])
+        spec.resampling = case["resampling"]
+        spec.processes = options.processes
+    elif case["conversion_type"] == "overviews":
+        spec.levels = overview_levels(case["size"])
+        spec.resampling = case["resampling"]
+        spec.overview_mode = options.overview_mode
+    return spec
+
+
+def run_case(case, options, log):
+    geographic = case["conversion_type"] == "srtmhgt"
+    input_file = synthetic_raster_path(options.work_dir, case["size"], case["bands"], case["data_type"], geographic)
+    if not os.path.exists(input_file):
+        log(f"Generating {os.path.basename(input_file)}...\n")
+        create_synthetic_raster(input_file, case["size"], case["bands"], case["data_type"], geographic)
+
+    megapixels = case["size"] * case["size"] / 1e6
+    wall_times, stage_rss, output_size = [], [], 0
+    for _ in range(options.repeat):
+        output_dir = os.path.join(options.work_dir, "output")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+        result = engine.run_conversion(case_spec(case, input_file, output_dir, options), log=options.tool_log, write_report=False)
+        if not result.success:
+            raise RuntimeError(f"{case_key(case, options)} failed: {result.message}")
+        wall_times.append(result.wall_time)
+        stage_rss += [stage.peak_rss for stage in result.stages if stage.peak_rss is not None]
+        output_size = engine.path_size(result.output_path)
+        if not options.keep_output:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    # The median is less sensitive than the mean to a single slow run (cold cache, other load).
+    wall_time = statistics.median(wall_times)
+    return {
+        **case,
+        "megapixels": round(megapixels, 3),
+        "wall_time": round(wall_time, 3),
+        "wall_times": [round(value, 3) for value in wall_times],
+        "megapixels_per_second": round(megapixels / wall_time, 3) if wall_time > 0 else None,
+        "peak_rss": max(stage_rss) if stage_rss else None,
+        "output_size": output_size,
+    }
+
+
+def gdal_version():
+    try:
+        from osgeo import gdal
+        return gdal.__version__
+    except ImportError:
+        return None
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    # Returns (key, metric, baseline value, current value, change) for every regression.
+    baseline_results = baseline.get("results", {})
+    regressions = []
+    for key, current in results.items():
+        previous = baseline_results.get(key)
+        if previous is None:
+            continue
+        if previous.get("megapixels_per_second") and current.get("megapixels_per_second"):
+            change = current["megapixels_per_second"] / previous["megapixels_per_second"] - 1.0
+            if change < -tolerance:
+                regressions.append((key, "megapixels_per_second", previous["megapixels_per_second"], current["megapixels_per_second"], change))
+        if previous.get("peak_rss") and current.get("peak_rss"):
+            change = current["peak_rss"] / previous["peak_rss"] - 1.0
+            if change > tolerance:
+                regressions.append((key, "peak_rss", previous["peak_rss"], current["peak_rss"], change))
+    return regressions
+
+
+def format_row(key, result, previous=None):
+    throughput = result["megapixels_per_second"]
+    text = f"{key:<40} {result['wall_time']:>9.2f}s {throughput or 0:>10.2f} MP/s"
+    text += f" {(result['peak_rss'] or 0) / 2**20:>9.1f} MiB {result['output_size'] / 2**20:>10.1f} MiB"
+    if previous and previous.get("megapixels_per_second") and throughput:
+        text += f"  ({throughput / previous['megapixels_per_second'] - 1.0:+.1%} vs baseline)"
+    return text
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="map_tiler_benchmark", description="Benchmark the tiles, overviews and SRTMHGT conversions on synthetic rasters.")
+    parser.add_argument("--types", nargs="+", default=list(engine.CONVERSION_TYPES), choices=engine.CONVERSION_TYPES, help="Conversion types to run (default: all)")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="Raster edge lengths in pixels of the tiles and overviews cases; SRTMHGT always uses 1201 and 3601 (default: %(default)s)")
+    parser.add_argument("--resampling", nargs="+", default=DEFAULT_RESAMPLINGS, choices=engine.RESAMPLING_METHODS, help="Resampling methods (default: %(default)s)")
+    parser.add_argument("--bands", type=int, default=3, help="Bands of the synthetic map rasters (default: %(default)s)")
+    parser.add_argument("--datatype", default="Byte", choices=list(DATA_TYPES), help="Data type of the overview inputs; tiles always use Byte and SRTMHGT Int16 (default: %(default)s)")
+    parser.add_argument("--overview-mode", default="copy", choices=engine.OVERVIEW_MODES)
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1, help="Tile worker processes (default: number of cores)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median is reported (default: %(default)s)")
+    parser.add_argument("--work-dir", default=os.path.join(engine.SCRIPT_DIR, "benchmark_data"), help="Where synthetic inputs are cached and outputs written (default: %(default)s)")
+    parser.add_argument("--keep-output", action="store_true", help="Keep the output of the last run of each case")
+    parser.add_argument("--output", default="", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", default="", help="Compare against this results file and exit with 1 on regressions")
+    parser.add_argument("--save-baseline", default="", metavar="PATH", help="Save these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown / memory growth before a case counts as a regression (default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the GDAL tool output")
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    options.repeat = max(1, options.repeat)
+    os.makedirs(options.work_dir, exist_ok=True)
+    log = lambda text: print(text, end="", flush=True)
+    options.tool_log = log if options.verbose else None
+
+    baseline = {}
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    cases = build_cases(options.types, options.sizes, options.resampling, options.bands, options.datatype)
+    results = {}
+    print(f"{'case':<40} {'median':>10} {'throughput':>15} {'peak RSS':>13} {'output':>14}")
+    for case in cases:
+        key = case_key(case, options)
+        try:
+            results[key] = run_case(case, options, log)
+        except (RuntimeError, engine.ConversionError) as e:
+            print(f"{key:<40} error: {e}")
+            continue
+        print(format_row(key, results[key], baseline.get("results", {}).get(key)))
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count()},
+        "gdal_version": gdal_version(),
+        "repeat": options.repeat,
+        "results": results,
+    }
+    for path in (options.output, options.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {path}")
+
+    if len(results) < len(cases):
+        return 1
+    if baseline:
+        if baseline.get("host", {}).get("platform") != report["host"]["platform"] or baseline.get("gdal_version") != report["gdal_version"]:
+            print("[WARNING] The baseline was recorded on a different platform or GDAL version.")
+        regressions = compare_to_baseline(results, baseline, options.tolerance)
+        for key, metric, previous, current, change in regressions:
+            print(f"[REGRESSION] {key}: {metric} {previous} -> {current} ({change:+.1%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {options.tolerance:.0%} against {options.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+
+# --- Result cache ---
+# Remembers finished conversions by a fingerprint of the input's content and the settings
+# that shape the output, so re-running an unchanged file (a second click, a re-delivered
+# sheet) links the earlier output into place instead of converting again. Each entry keeps
+# hardlinks to the output files, so it costs no extra disk space while the output exists
+# (files on another drive are copied). The fingerprint hashes the file size and a fixed
+# number of evenly spread samples, so it is cheap for any input size; "verify" also hashes
+# the whole input and compares it with the hash taken when the entry was stored.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache")
+DEFAULT_MAX_GB = 20.0
+SAMPLE_COUNT = 16
+SAMPLE_SIZE = 64 * 1024
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+ENTRY_FILE = "entry.json"
+OUTPUT_NAME = "output"
+
+_gdal_versions = {}
+
+
+def file_fingerprint(path):
+    # Size plus SAMPLE_COUNT samples from the start to the end of the file.
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode("ascii"), digest_size=16)
+    with open(path, "rb") as f:
+        if size <= SAMPLE_COUNT * SAMPLE_SIZE:
+            digest.update(f.read())
+        else:
+            step = (size - SAMPLE_SIZE) / (SAMPLE_COUNT - 1)
+            for i in range(SAMPLE_COUNT):
+                f.seek(int(i * step))
+                digest.update(f.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def content_hash(paths):
+    # Full blake2b hash of the files, in order.
+    digest = hashlib.blake2b(digest_size=32)
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def gdal_version(gdalinfo_path=None, env=None):
+    # Version string of the GDAL build that runs the tools (the bindings when there are no tools).
+    if gdalinfo_path not in _gdal_versions:
+        version = "unknown"
+        try:
+            version = subprocess.run([gdalinfo_path, "--version"], capture_output=True, env=env, timeout=30, check=True).stdout.decode("utf-8", "replace").strip()
+        except (OSError, TypeError, subprocess.SubprocessError):
+            try:
+                from osgeo import gdal
+                version = gdal.VersionInfo("--version")
+            except ImportError:
+                pass
+        _gdal_versions[gdalinfo_path] = version
+    return _gdal_versions[gdalinfo_path]
+
+
+def cache_key(sources, params, gdal_build):
+    digest = hashlib.blake2b(digest_size=20)
+    for path in sources:
+        digest.update(file_fingerprint(path).encode("ascii"))
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    digest.update(gdal_build.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def list_files(path):
+    # Paths of the files of an output (the file itself, or every file below a directory),
+    # relative to it ("" for a single file).
+    if os.path.isfile(path):
+        return [""]
+    files = []
+    for root_dir, _, file_names in os.walk(path):
+        for file_name in file_names:
+            files.append(os.path.relpath(os.path.join(root_dir, file_name), path))
+    return sorted(files)
+
+
+def link_or_copy(source, destination):
+    # Hardlinks source to destination (replacing it), or copies it across drives.
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    tmp_path = f"{destination}.tmp-{os.getpid()}"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def link_tree(source, destination, files):
+    for relative_path in files:
+        link_or_copy(os.path.join(source, relative_path) if relative_path else source,
+                     os.path.join(destination, relative_path) if relative_path else destination)
+
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=int(DEFAULT_MAX_GB * 1024 ** 3)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def load_entry(self, key):
+        try:
+            with open(os.path.join(self.entry_dir(key), ENTRY_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_entry(self, key, entry):
+        path = os.path.join(self.entry_dir(key), ENTRY_FILE)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def lookup(self, key, sources, verify=False, log=print):
+        # The entry for key if its files are intact (and, when verifying, the whole input
+        # still hashes the same), else None. Broken entries are removed.
+        entry = self.load_entry(key)
+        if entry is None:
+            return None
+        output = os.path.join(self.entry_dir(key), OUTPUT_NAME)
+        for relative_path, size, mtime_ns in entry["files"]:
+            try:
+                stat = os.stat(os.path.join(output, relative_path) if relative_path else output)
+            except OSError:
+                stat = None
+            if stat is None or (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                log(f"Result cache: entry {key} was modified or deleted since it was stored; converting again.\n")
+                self.remove(key)
+                return None
+        if verify:
+            if not entry.get("input_hash"):
+                log("Result cache: the entry has no full input hash to verify; converting again.\n")
+                return None
+            if content_hash(sources) != entry["input_hash"]:
+                log("Result cache: the input differs from the cached one outside the sampled blocks; converting again.\n")
+                self.remove(key)
+                return None
+        return entry
+
+    def restore(self, key, entry, output_path):
+        # Links the cached output to output_path. A tiles directory is merged into an existing one.
+        output = os.path.join(self.entry_dir(key), OUTPUT_NAME)
+        files = [relative_path for relative_path, _, _ in entry["files"]]
+        if entry["is_dir"]:
+            os.makedirs(output_path, exist_ok=True)
+        link_tree(output, output_path, files)
+        entry["last_used"] = time.time()
+        self.write_entry(key, entry)
+
+    def store(self, key, output_path, params, sources=(), verify=False):
+        # Adds output_path to the cache and evicts the least recently used entries beyond
+        # max_bytes. Returns the entry's size in bytes.
+        files = list_files(output_path)
+        entry_dir = self.entry_dir(key)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        output = os.path.join(entry_dir, OUTPUT_NAME)
+        os.makedirs(entry_dir)
+        link_tree(output_path, output, files)
+        entry = {
+            "created": time.time(),
+            "last_used": time.time(),
+            "source": os.path.abspath(output_path),
+            "is_dir": os.path.isdir(output_path),
+            "params": params,
+            "input_hash": content_hash(sources) if verify else "",
+            "files": [],
+        }
+        size = 0
+        for relative_path in files:
+            stat = os.stat(os.path.join(output, relative_path) if relative_path else output)
+            entry["files"].append([relative_path, stat.st_size, stat.st_mtime_ns])
+            size += stat.st_size
+        entry["bytes"] = size
+        self.write_entry(key, entry)
+        self.evict(keep=key)
+        return size
+
+    def entries(self):
+        # [(key, entry)] of every readable entry, least recently used first.
+        if not os.path.isdir(self.directory):
+            return []
+        found = [(key, self.load_entry(key)) for key in os.listdir(self.directory)]
+        return sorted(((key, entry) for key, entry in found if entry is not None), key=lambda item: item[1]["last_used"])
+
+    def evict(self, keep=None, max_bytes=None):
+        # Removes least recently used entries until the cache fits. Returns the keys removed.
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(entry["bytes"] for _, entry in entries)
+        removed = []
+        for key, entry in entries:
+            if total <= max_bytes:
+                break
+            if key == keep:
+                continue
+            self.remove(key)
+            total -= entry["bytes"]
+            removed.append(key)
+        return removed
+
+    def remove(self, key):
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
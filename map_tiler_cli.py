@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import shlex
+import sys
+import time
+
+import map_tiler_engine as engine
+
+
+def add_common_arguments(parser):
+    parser.add_argument("input_file", nargs="+", help="Input raster file; several files or a directory are combined as a virtual mosaic")
+    parser.add_argument("-o", "--output-dir", default="", help="Base output directory (default: the input file's directory)")
+    parser.add_argument("--output-path", default="", help="Explicit output path, overriding the default naming")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON instead of the tool output")
+    parser.add_argument("--tuning", default="auto", help="GDAL tuning profile: auto, none or a saved profile name (default: %(default)s)")
+    parser.add_argument("--backend", default="subprocess", choices=engine.BACKENDS, help="Run gdal_translate/gdaladdo as command line tools, or in-process through the GDAL Python bindings (default: %(default)s)")
+    parser.add_argument("--cache", default="off", choices=engine.CACHE_MODES, help="Reuse the output of an identical earlier run (same input content, settings and GDAL build); \"verify\" also hashes the whole input first (default: %(default)s)")
+    parser.add_argument("--cache-dir", default="", help="Result cache directory (default: result_cache/ next to the scripts)")
+    parser.add_argument("--cache-max-gb", type=float, default=20.0, help="Size limit of the result cache; the least recently used entries are removed beyond it (default: %(default)s)")
+    parser.add_argument("--sample", dest="sample_interval", type=float, nargs="?", const=0.5, default=0.0, metavar="SECONDS",
+                        help="Sample CPU, memory, disk I/O and open files of every stage (every 0.5 s, or SECONDS), print the bottleneck and write <output>.samples.json")
+    parser.add_argument("--no-report", dest="write_report", action="store_false", help="Do not write the <output>.report.json run report")
+
+
+def parse_bbox(text):
+    try:
+        values = tuple(float(value) for value in text.split(","))
+    except ValueError:
+        values = ()
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("expected four comma-separated numbers: minx,miny,maxx,maxy")
+    return values
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="map_tiler_cli", description="Headless GDAL map converter (tiles, overviews, SRTMHGT).")
+    subparsers = parser.add_subparsers(dest="conversion_type", required=True)
+
+    tiles_parser = subparsers.add_parser("tiles", help="Generate web map tiles with gdal2tiles")
+    add_common_arguments(tiles_parser)
+    tiles_parser.add_argument("-z", "--levels", default=engine.DEFAULT_LEVELS["tiles"], help="Zoom levels, or \"auto\" for 0 to the native zoom of the input (default: %(default)s)")
+    tiles_parser.add_argument("-r", "--resampling", default=engine.DEFAULT_RESAMPLING["tiles"], choices=engine.RESAMPLING_METHODS)
+    tiles_parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1, help="Worker processes (default: number of cores)")
+    tiles_parser.add_argument("--output-format", dest="tile_output", default="directory", choices=engine.TILE_OUTPUTS, help="z/x/y folder of PNGs, or a single MBTiles file (default: %(default)s)")
+    tiles_parser.add_argument("--tile-format", default="png", choices=engine.TILE_FORMATS, help="Tile image format; JPEG tiles have no transparency and need GDAL 3.9+ with gdal2tiles (default: %(default)s)")
+    tiles_parser.add_argument("--quality", dest="tile_quality", type=int, default=75, help="JPEG/WebP quality, 1-100 (default: %(default)s)")
+    tiles_parser.add_argument("--uniform-tiles", default="write", choices=engine.UNIFORM_TILE_MODES, help="Single-colour tiles: write each, hardlink to one shared file per colour, or also skip fully transparent ones (default: %(default)s)")
+    tiles_parser.add_argument("--resume", action="store_true", help="Use the built-in renderer with a tile manifest; re-running continues an interrupted job")
+    tiles_parser.add_argument("--update-from", default="", metavar="PREVIOUS_SOURCE", help="Update the existing pyramid, re-rendering only tiles where the input differs from this previous version")
+    tiles_parser.add_argument("--work-dir", default="", help="Render through this shared work directory: --processes local worker processes are started, and workers on other hosts join with 'map_tiler_cli.py worker DIR'. The tiles match a local render")
+    tiles_parser.add_argument("--dirty-bbox", type=parse_bbox, default=None, metavar="MINX,MINY,MAXX,MAXY", help="Update the existing pyramid, re-rendering only tiles inside this box (source coordinates)")
+
+    overviews_parser = subparsers.add_parser("overviews", help="Write a GeoTIFF copy with internal overviews")
+    add_common_arguments(overviews_parser)
+    overviews_parser.add_argument("-l", "--levels", default=engine.DEFAULT_LEVELS["overviews"], help="Overview factors, or \"auto\" for 2, 4, 8, ... down to a 256 pixel top level (default: '%(default)s')")
+    overviews_parser.add_argument("-r", "--resampling", default=engine.DEFAULT_RESAMPLING["overviews"], choices=engine.RESAMPLING_METHODS)
+    overviews_parser.add_argument("--mode", dest="overview_mode", default="copy", choices=engine.OVERVIEW_MODES, help="copy + gdaladdo, a single-pass Cloud Optimized GeoTIFF, or an external .ovr next to the untouched source (or in --output-dir)")
+    overviews_parser.add_argument("--compression", default="DEFLATE", choices=engine.COMPRESSION_METHODS, help="COG or external overview compression")
+    overviews_parser.add_argument("--block-size", type=int, default=512, choices=engine.BLOCK_SIZES, help="COG or external overview block size")
+
+    srtm_parser = subparsers.add_parser("srtmhgt", help="Convert a DTM to SRTMHGT (.hgt)")
+    add_common_arguments(srtm_parser)
+    srtm_parser.add_argument("--split", dest="srtm_split", action="store_true", help="Write one .hgt per 1x1 degree cell the DTM covers into <name>_hgt/")
+    srtm_parser.add_argument("--resolution", dest="srtm_resolution", type=int, default=None, choices=engine.SRTM_RESOLUTIONS, help="Cell resolution in arc-seconds: 3 (1201x1201) or 1 (3601x3601) (default: the input's grid if it already has one of these sizes, else 3)")
+    srtm_parser.add_argument("-r", "--resampling", default=engine.DEFAULT_RESAMPLING["srtmhgt"], choices=engine.RESAMPLING_METHODS, help="Resampling onto the SRTM grid (default: %(default)s)")
+    srtm_parser.add_argument("--fill-voids", dest="srtm_fill_voids", action="store_true", help="Fill small voids from the surrounding elevations instead of keeping them as -32768")
+    srtm_parser.add_argument("--memory-mb", dest="srtm_memory_mb", type=int, default=256, help="Memory cap in MB for the preprocessing, shared by the --split workers (default: %(default)s)")
+    srtm_parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1, help="Worker processes for --split (default: number of cores)")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve tiles on demand from a GeoTIFF (ideally with overviews) on localhost")
+    serve_parser.add_argument("input_file", help="Input raster file")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: %(default)s)")
+    serve_parser.add_argument("--port", type=int, default=8080, help="Port (default: %(default)s)")
+    serve_parser.add_argument("-r", "--resampling", default="average", choices=engine.RESAMPLING_METHODS)
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Request worker threads (default: number of cores)")
+    serve_parser.add_argument("--cache-mb", type=int, default=256, help="In-memory tile cache size in MB (default: %(default)s)")
+    serve_parser.add_argument("--disk-cache", default="", metavar="DIR", help="Also keep rendered tiles in this directory across restarts")
+    serve_parser.add_argument("--tile-format", default="png", choices=engine.TILE_FORMATS, help="Tile image format (default: %(default)s)")
+    serve_parser.add_argument("--quality", type=int, default=75, help="JPEG/WebP quality, 1-100 (default: %(default)s)")
+    serve_parser.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+
+    worker_parser = subparsers.add_parser("worker", help="Render work units of a distributed tiles job (tiles --work-dir) until it is finished")
+    worker_parser.add_argument("work_dir", help="The job's shared work directory")
+
+    watch_parser = subparsers.add_parser("watch", help="Watch directories and convert every new map file that lands in them")
+    watch_parser.add_argument("directories", nargs="+", help="Directories to watch (not recursive)")
+    watch_parser.add_argument("--convert", required=True, metavar="'TYPE [OPTIONS]'", help="Conversion to run on each file, as its subcommand without the input, e.g. 'overviews --mode external -l auto'")
+    watch_parser.add_argument("--state-file", default="", help="JSON record of the converted files (default: .map_tiler_watch_<type>.json in the output or first watched directory)")
+    watch_parser.add_argument("--max-jobs", type=int, default=2, help="Conversions running at the same time (default: %(default)s)")
+    watch_parser.add_argument("--interval", type=float, default=5.0, help="Seconds between directory scans (default: %(default)s)")
+    watch_parser.add_argument("--settle", type=float, default=10.0, help="Seconds a file's size and modification time must stay unchanged before it is converted (default: %(default)s)")
+    watch_parser.add_argument("--retry-failed", action="store_true", help="Retry files whose conversion failed, even if they have not changed")
+    watch_parser.add_argument("-v", "--verbose", action="store_true", help="Also print the tools' output")
+
+    profile_parser = subparsers.add_parser("profile", help="List, save or delete named GDAL tuning profiles")
+    profile_subparsers = profile_parser.add_subparsers(dest="profile_command", required=True)
+    profile_subparsers.add_parser("list", help="Show the saved profiles")
+    save_parser = profile_subparsers.add_parser("save", help="Save a profile; unset fields keep the automatic choice")
+    save_parser.add_argument("name")
+    save_parser.add_argument("--cache-mb", type=int, default=None, help="GDAL_CACHEMAX in MB")
+    save_parser.add_argument("--threads", default=None, help="GDAL_NUM_THREADS (a number or ALL_CPUS)")
+    save_parser.add_argument("--co", action="append", default=[], metavar="KEY=VALUE", help="GeoTIFF creation option for the overview copy (repeatable)")
+    save_parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE", help="GDAL configuration option (repeatable)")
+    delete_parser = profile_subparsers.add_parser("delete", help="Delete a saved profile")
+    delete_parser.add_argument("name")
+
+    cache_parser = subparsers.add_parser("cache", help="List or clear the result cache")
+    cache_parser.add_argument("cache_command", choices=("list", "clear"))
+    cache_parser.add_argument("--cache-dir", default="", help="Result cache directory (default: result_cache/ next to the scripts)")
+
+    return parser
+
+
+def parse_options(pairs):
+    options = {}
+    for pair in pairs:
+        key, separator, value = pair.partition("=")
+        if not separator or not key:
+            raise ValueError(f"Expected KEY=VALUE, got '{pair}'.")
+        options[key.strip()] = value.strip()
+    return options
+
+
+def profile_from_args(args):
+    import map_tiler_tuning
+    try:
+        if args.profile_command == "save":
+            profile = map_tiler_tuning.TuningProfile(args.name, args.cache_mb, args.threads, parse_options(args.co), parse_options(args.config))
+            map_tiler_tuning.save_profile(profile)
+            print(f"Saved {profile.describe()}")
+        elif args.profile_command == "delete":
+            map_tiler_tuning.delete_profile(args.name)
+            print(f"Deleted tuning profile '{args.name}'.")
+        else:
+            profiles = map_tiler_tuning.load_profiles()
+            for profile in profiles.values():
+                print(profile.describe())
+            if not profiles:
+                print(f"No saved tuning profiles ({map_tiler_tuning.PROFILES_FILE}).")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def worker_from_args(args):
+    import map_tiler_distributed
+    try:
+        map_tiler_distributed.run_worker(args.work_dir, log=lambda text: print(text, end="", flush=True))
+    except map_tiler_distributed.JobError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def cache_from_args(args):
+    import map_tiler_cache
+    cache = map_tiler_cache.ResultCache(args.cache_dir or map_tiler_cache.DEFAULT_CACHE_DIR)
+    entries = cache.entries()
+    if args.cache_command == "clear":
+        for key, _ in entries:
+            cache.remove(key)
+        print(f"Removed {len(entries)} result cache entries from {cache.directory}.")
+        return 0
+    for key, entry in reversed(entries):
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"]))
+        print(f"{key}  {entry['bytes'] / 1024 ** 2:10.1f} MB  last used {last_used}  {entry['params']['conversion_type']}  {entry['source']}")
+    if not entries:
+        print(f"The result cache is empty ({cache.directory}).")
+    return 0
+
+
+def serve_from_args(args):
+    import map_tiler_pyramid
+    import map_tiler_server
+    try:
+        encoding = map_tiler_pyramid.TileEncoding(args.tile_format, args.quality)
+        map_tiler_server.serve(args.input_file, args.host, args.port, args.resampling, args.workers, args.cache_mb * 1024 * 1024, args.disk_cache, args.verbose, log=lambda text: print(text, end="", flush=True), encoding=encoding)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def watch_from_args(args):
+    import map_tiler_watch
+    # The --convert options are parsed as that subcommand, with the first watched directory
+    # standing in for the input until a file arrives.
+    convert_argv = shlex.split(args.convert)
+    if not convert_argv or convert_argv[0] not in engine.CONVERSION_TYPES:
+        print(f"Error: --convert must start with one of {', '.join(engine.CONVERSION_TYPES)}.", file=sys.stderr)
+        return 2
+    convert_args = build_parser().parse_args(convert_argv + [args.directories[0]])
+    if convert_args.output_path or len(convert_args.input_file) > 1:
+        print("Error: --convert takes neither input files nor --output-path; outputs are named after each file.", file=sys.stderr)
+        return 2
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            print(f"Error: Not a directory: {directory}", file=sys.stderr)
+            return 2
+
+    log = lambda text: print(text, end="", flush=True)
+    try:
+        watcher = map_tiler_watch.FolderWatcher(args.directories, spec_from_args(convert_args), args.state_file, args.max_jobs, args.interval, args.settle,
+                                                args.retry_failed, convert_args.write_report, log=log, tool_log=log if args.verbose else None)
+    except (OSError, ValueError) as e:
+        print(f"Error: Cannot read the state file: {e}", file=sys.stderr)
+        return 2
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("Stopping; waiting for the running conversions to finish.", flush=True)
+    watcher.wait_for_running()
+    return 0
+
+
+def spec_from_args(args):
+    options = vars(args).copy()
+    options.pop("json")
+    options.pop("write_report")
+    inputs = options.pop("input_file")
+    if len(inputs) > 1:
+        # The mosaic is named after the sheets' common directory.
+        options["input_files"] = inputs
+        options["input_file"] = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in inputs])
+    else:
+        options["input_file"] = inputs[0]
+    return engine.ConversionSpec(**options)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.conversion_type == "serve":
+        return serve_from_args(args)
+    if args.conversion_type == "profile":
+        return profile_from_args(args)
+    if args.conversion_type == "watch":
+        return watch_from_args(args)
+    if args.conversion_type == "cache":
+        return cache_from_args(args)
+    if args.conversion_type == "worker":
+        return worker_from_args(args)
+    spec = spec_from_args(args)
+
+    log = (lambda text: None) if args.json else (lambda text: print(text, end="", flush=True))
+    try:
+        result = engine.run_conversion(spec, log=log, write_report=args.write_report)
+    except engine.ConversionError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    if args.json:
+        print(json.dumps(result.to_dict(), indent=2))
+    else:
+        print(f"\n{result.message} ({result.wall_time:.1f}s)")
+    return 0 if result.success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import map_tiler_pyramid as pyramid
+
+# --- Distributed tiling ---
+# A coordinator splits the tile pyramid into work units and describes them in a shared work
+# directory. Any number of worker processes, on this host or on other hosts that mount the
+# same directory (and see the input and output under the same paths), claim units, render
+# them and mark them done. There is no server: every state change is a file operation that
+# is atomic on local and network filesystems.
+#
+#   job.json               the job: input, output, levels, tile settings and the units
+#   leases/<unit>.<n>      attempt n of a unit, created with O_EXCL so only one worker wins
+#                          it; the holder touches it while it works
+#   done/<unit>            written when the unit is finished (with its tile statistics)
+#   failed/<unit>.<n>      written when attempt n raised an error
+#   logs/                  output of the workers the coordinator started itself
+#   arrays/                with JPEG or lossy WebP tiles, the pixels of the tiles that reduce
+#                          units build their parents from (removed when the job is finished)
+#
+# A lease whose file has not been touched for lease_seconds (the worker crashed or lost
+# its host) or whose attempt failed is re-issued as attempt n + 1. Tiles are written
+# atomically, so a unit rendered twice produces the same files. A unit that lists other
+# units under "after" is only claimed once they are done.
+
+JOB_FILE = "job.json"
+LEASE_SECONDS = 120
+POLL_INTERVAL = 2.0
+MAX_ATTEMPTS = 3
+# With child-tile reduction the units are subtrees rooted at the first zoom with at least
+# this many tiles; the levels above them, and every level without child reduction, are
+# split into blocks of BLOCK_TILES x BLOCK_TILES tiles. With child reduction those blocks
+# are reduced from their stored child tiles, like the local renderer builds them, once the
+# units writing the children are done.
+TARGET_UNITS = 4096
+BLOCK_TILES = 16
+ARRAYS_DIR_NAME = "arrays"
+
+
+class JobError(RuntimeError):
+    pass
+
+
+def plan_units(grid, min_zoom, max_zoom, resampling):
+    # Units in an order where every unit comes after the units it waits for.
+    units = []
+    lowest_block_zoom = max_zoom
+    root_zoom = None
+    if max_zoom > min_zoom and resampling in pyramid.CHILD_REDUCTIONS:
+        root_zoom = min_zoom
+        while root_zoom < max_zoom and grid.tile_count(root_zoom) < TARGET_UNITS:
+            root_zoom += 1
+        for x, y in grid.tiles(root_zoom):
+            units.append({"id": f"s{root_zoom}_{x}_{y}", "kind": "subtree", "z": root_zoom, "x": x, "y": y, "tiles": subtree_tile_count(grid, root_zoom, x, y, max_zoom)})
+        lowest_block_zoom = root_zoom - 1
+    for z in range(lowest_block_zoom, min_zoom - 1, -1):
+        columns, rows = grid.tile_counts(z)
+        for x0 in range(0, columns, BLOCK_TILES):
+            for y0 in range(0, rows, BLOCK_TILES):
+                x1, y1 = min(columns, x0 + BLOCK_TILES), min(rows, y0 + BLOCK_TILES)
+                unit = {"id": f"b{z}_{x0}_{y0}", "kind": "block", "z": z, "x0": x0, "y0": y0, "x1": x1, "y1": y1, "tiles": (x1 - x0) * (y1 - y0)}
+                if root_zoom is not None:
+                    unit["kind"] = "reduce"
+                    unit["after"] = child_units(grid, z, x0, y0, x1, y1, root_zoom)
+                units.append(unit)
+    return units
+
+
+def child_units(grid, z, x0, y0, x1, y1, root_zoom):
+    # Ids of the units that write the child tiles (zoom z + 1) of a block.
+    columns, rows = grid.tile_counts(z + 1)
+    cx0, cy0, cx1, cy1 = 2 * x0, 2 * y0, min(columns, 2 * x1), min(rows, 2 * y1)
+    if z + 1 == root_zoom:
+        return [f"s{root_zoom}_{x}_{y}" for x in range(cx0, cx1) for y in range(cy0, cy1)]
+    return [f"b{z + 1}_{bx}_{by}" for bx in range(cx0 - cx0 % BLOCK_TILES, cx1, BLOCK_TILES) for by in range(cy0 - cy0 % BLOCK_TILES, cy1, BLOCK_TILES)]
+
+
+def blocked_units(units, state):
+    # Units that cannot finish: failed MAX_ATTEMPTS times, or waiting for such a unit.
+    blocked = set()
+    for unit in units:
+        if unit["id"] not in state.done and (state.given_up(unit["id"]) or any(unit_id in blocked for unit_id in unit.get("after", ()))):
+            blocked.add(unit["id"])
+    return blocked
+
+
+def subtree_tile_count(grid, z, x, y, max_zoom):
+    count = 0
+    for level in range(z, max_zoom + 1):
+        columns, rows = grid.tile_counts(level)
+        scale = 2 ** (level - z)
+        count += max(0, min(columns, (x + 1) * scale) - x * scale) * max(0, min(rows, (y + 1) * scale) - y * scale)
+    return count
+
+
+def job_params(input_file, output_dir, min_zoom, max_zoom, resampling, uniform_tiles, encoding):
+    return {
+        "input_file": os.path.abspath(input_file),
+        "output_dir": os.path.abspath(output_dir),
+        "levels": [min_zoom, max_zoom],
+        "resampling": resampling,
+        "uniform_tiles": uniform_tiles,
+        "tile_format": encoding.tile_format,
+        "tile_quality": encoding.quality,
+    }
+
+
+def create_job(work_dir, input_file, output_dir, levels="0-16", resampling="average", uniform_tiles="write", encoding=pyramid.PNG_ENCODING, log=print):
+    # Writes job.json, or checks that an existing job in work_dir has the same settings (the
+    # job then continues with the units that are not done yet). Returns the job dict.
+    min_zoom, max_zoom = pyramid.parse_zoom_levels(levels)
+    params = job_params(input_file, output_dir, min_zoom, max_zoom, resampling, uniform_tiles, encoding)
+    existing = load_job(work_dir) if os.path.exists(os.path.join(work_dir, JOB_FILE)) else None
+    if existing is not None:
+        changed = sorted(key for key in params if existing.get(key) != params[key])
+        if changed:
+            raise JobError(f"{work_dir} holds a job with different settings ({', '.join(changed)}). Use a new work directory or delete it.")
+        log(f"Continuing the job in {work_dir}\n")
+        return existing
+
+    dataset = pyramid.open_source(input_file)
+    pyramid.check_source(dataset)
+    grid = pyramid.TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+    job = {**params, "lease_seconds": LEASE_SECONDS, "units": plan_units(grid, min_zoom, max_zoom, resampling)}
+    for name in ("leases", "done", "failed", "logs"):
+        os.makedirs(os.path.join(work_dir, name), exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    pyramid.write_file_atomic(os.path.join(work_dir, JOB_FILE), json.dumps(job, indent=1).encode("utf-8"))
+    log(f"Created job in {work_dir}: {len(job['units'])} work units, {sum(unit['tiles'] for unit in job['units']):,} tiles\n")
+    return job
+
+
+def load_job(work_dir):
+    try:
+        with open(os.path.join(work_dir, JOB_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise JobError(f"No readable job in {work_dir}: {e}")
+
+
+class JobState:
+    # One listing of the work directory: which units are done, leased, failed.
+    def __init__(self, work_dir, lease_seconds):
+        self.work_dir = work_dir
+        # Names with ".tmp-" are markers still being written.
+        self.done = {name for name in os.listdir(os.path.join(work_dir, "done")) if ".tmp-" not in name}
+        self.failures = {}
+        for name in os.listdir(os.path.join(work_dir, "failed")):
+            unit_id, _, attempt = name.rpartition(".")
+            if attempt.isdigit():
+                self.failures.setdefault(unit_id, set()).add(int(attempt))
+        # unit -> (latest attempt, its lease file's age in seconds)
+        self.leases = {}
+        now = time.time()
+        for name in os.listdir(os.path.join(work_dir, "leases")):
+            unit_id, _, attempt = name.rpartition(".")
+            if not attempt.isdigit() or int(attempt) < self.leases.get(unit_id, (-1, 0))[0]:
+                continue
+            try:
+                age = now - os.stat(os.path.join(work_dir, "leases", name)).st_mtime
+            except OSError:
+                continue
+            self.leases[unit_id] = (int(attempt), age)
+        self.lease_seconds = lease_seconds
+
+    def given_up(self, unit_id):
+        return len(self.failures.get(unit_id, ())) >= MAX_ATTEMPTS
+
+    def next_attempt(self, unit_id):
+        # The attempt a worker may claim now, or None while a live lease holds the unit.
+        if unit_id in self.done or self.given_up(unit_id):
+            return None
+        if unit_id not in self.leases:
+            return 0
+        attempt, age = self.leases[unit_id]
+        if attempt in self.failures.get(unit_id, ()) or age > self.lease_seconds:
+            return attempt + 1
+        return None
+
+    def live_leases(self):
+        return sum(1 for unit_id, (attempt, age) in self.leases.items()
+                   if unit_id not in self.done and age <= self.lease_seconds and attempt not in self.failures.get(unit_id, ()))
+
+
+def claim(work_dir, unit_id, attempt, worker_id):
+    # Path of the lease file if this worker won the attempt, else None.
+    path = os.path.join(work_dir, "leases", f"{unit_id}.{attempt}")
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(f"{worker_id}\n")
+    return path
+
+
+def keep_alive(lease_path, interval, stop):
+    while not stop.wait(interval):
+        try:
+            os.utime(lease_path)
+        except OSError:
+            pass
+
+
+def render_unit(job, unit, encoding, arrays=None):
+    # Returns the unit's uniform tile statistics. With arrays (a TileArrays), the pixels of the
+    # tiles that reduce units read are kept there, so parents never come from decoded tiles.
+    if unit["kind"] == "subtree":
+        keep_root = arrays is not None and unit["z"] > job["levels"][0]
+        _, stats, root = pyramid.render_subtree(job["input_file"], job["output_dir"], unit["z"], unit["x"], unit["y"], job["levels"][1], job["resampling"], job["uniform_tiles"], encoding, return_root=keep_root)
+        if keep_root:
+            arrays.save(unit["z"], unit["x"], unit["y"], root)
+        return stats
+    tiles = [(x, y) for x in range(unit["x0"], unit["x1"]) for y in range(unit["y0"], unit["y1"])]
+    if unit["kind"] == "reduce":
+        dataset = pyramid.open_source(job["input_file"])
+        grid = pyramid.TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+        stats = pyramid.new_tile_stats()
+        pyramid.reduce_stored_tiles(dataset, grid, job["output_dir"], unit["z"], tiles, job["resampling"], None, job["uniform_tiles"], stats, encoding, arrays=arrays)
+        return stats
+    _, _, stats = pyramid.render_tiles(job["input_file"], job["output_dir"], unit["z"], tiles, job["resampling"], job["uniform_tiles"], encoding)
+    return stats
+
+
+def run_worker(work_dir, worker_id=None, log=print):
+    # Claims and renders units until every unit is done (or has failed MAX_ATTEMPTS times).
+    # Returns the number of units this worker finished.
+    job = load_job(work_dir)
+    encoding = pyramid.TileEncoding(job["tile_format"], job["tile_quality"])
+    arrays = pyramid.TileArrays(os.path.join(work_dir, ARRAYS_DIR_NAME)) if encoding.lossy else None
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    lease_seconds = job["lease_seconds"]
+    # Workers start at different places so they rarely race for the same lease.
+    start = random.randrange(len(job["units"])) if job["units"] else 0
+    units = job["units"][start:] + job["units"][:start]
+    finished = 0
+    log(f"Worker {worker_id}: {len(units)} units in {work_dir}\n")
+    while True:
+        state = JobState(work_dir, lease_seconds)
+        blocked = blocked_units(job["units"], state)
+        remaining = [unit for unit in units if unit["id"] not in state.done and unit["id"] not in blocked]
+        if not remaining:
+            break
+        claimed = False
+        for unit in remaining:
+            if any(unit_id not in state.done for unit_id in unit.get("after", ())):
+                continue
+            attempt = state.next_attempt(unit["id"])
+            if attempt is None or os.path.exists(os.path.join(work_dir, "done", unit["id"])):
+                continue
+            lease_path = claim(work_dir, unit["id"], attempt, worker_id)
+            if lease_path is None:
+                continue
+            claimed = True
+            if attempt:
+                log(f"Re-issuing {unit['id']} (attempt {attempt + 1})\n")
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=keep_alive, args=(lease_path, lease_seconds / 4.0, stop), daemon=True)
+            heartbeat.start()
+            started = time.time()
+            try:
+                stats = render_unit(job, unit, encoding, arrays)
+            except Exception as e:
+                log(f"Unit {unit['id']} failed: {e}\n")
+                record = {"worker": worker_id, "error": str(e)}
+                pyramid.write_file_atomic(os.path.join(work_dir, "failed", f"{unit['id']}.{attempt}"), json.dumps(record).encode("utf-8"))
+                continue
+            finally:
+                stop.set()
+                heartbeat.join()
+            record = {"worker": worker_id, "attempt": attempt, "tiles": unit["tiles"], "stats": stats, "wall_time": round(time.time() - started, 3)}
+            pyramid.write_file_atomic(os.path.join(work_dir, "done", unit["id"]), json.dumps(record).encode("utf-8"))
+            finished += 1
+            log(f"Unit {unit['id']}: {unit['tiles']} tiles in {record['wall_time']:.1f}s\n")
+        if not claimed:
+            # Everything left is leased by other workers; wait for them to finish or expire.
+            time.sleep(POLL_INTERVAL)
+    log(f"Worker {worker_id}: finished {finished} units\n")
+    return finished
+
+
+def start_local_workers(work_dir, count):
+    # Worker processes on this host, started like remote ones through map_tiler_cli.py.
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_tiler_cli.py")
+    workers = []
+    for i in range(count):
+        log_file = open(os.path.join(work_dir, "logs", f"{socket.gethostname()}-local-{i + 1}.log"), "a", encoding="utf-8")
+        workers.append(subprocess.Popen([sys.executable, cli, "worker", work_dir], stdout=log_file, stderr=subprocess.STDOUT))
+        log_file.close()
+    return workers
+
+
+def coordinate(work_dir, input_file, output_dir, levels="0-16", resampling="average", uniform_tiles="write", encoding=pyramid.PNG_ENCODING, local_workers=1, log=print, progress=None):
+    # Creates (or continues) the job, starts local_workers workers and waits until every unit
+    # is done. Other hosts join with "map_tiler_cli.py worker <work_dir>". Returns a summary dict.
+    job = create_job(work_dir, input_file, output_dir, levels, resampling, uniform_tiles, encoding, log)
+    total_tiles = sum(unit["tiles"] for unit in job["units"])
+    units_by_id = {unit["id"]: unit for unit in job["units"]}
+    workers = start_local_workers(work_dir, local_workers)
+    log(f"Started {len(workers)} local workers; add workers on other hosts with:\n    python map_tiler_cli.py worker {os.path.abspath(work_dir)}\n")
+    reported = -1
+    completed = False
+    try:
+        while True:
+            state = JobState(work_dir, job["lease_seconds"])
+            given_up = sorted(blocked_units(job["units"], state))
+            done_tiles = sum(units_by_id[unit_id]["tiles"] for unit_id in state.done if unit_id in units_by_id)
+            if progress is not None and total_tiles:
+                progress(done_tiles / total_tiles)
+            if len(state.done) != reported:
+                reported = len(state.done)
+                log(f"Units done: {len(state.done)} of {len(units_by_id)} ({state.live_leases()} in progress)\n")
+            if len(state.done) + len(given_up) >= len(units_by_id):
+                completed = True
+                break
+            if workers and all(worker.poll() is not None for worker in workers) and not state.live_leases():
+                raise JobError(f"All local workers stopped with {len(units_by_id) - len(state.done)} units left; see {os.path.join(work_dir, 'logs')}.")
+            time.sleep(POLL_INTERVAL)
+    finally:
+        # Finished workers notice within a poll interval that nothing is left.
+        deadline = time.time() + (2 * POLL_INTERVAL if completed else 0)
+        for worker in workers:
+            try:
+                worker.wait(max(0.0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                worker.terminate()
+                worker.wait()
+
+    if given_up:
+        failed = [unit_id for unit_id in given_up if state.given_up(unit_id)]
+        raise JobError(f"{len(failed)} units failed {MAX_ATTEMPTS} times (e.g. {failed[0]}), {len(given_up) - len(failed)} more could not start without them; see {os.path.join(work_dir, 'failed')}.")
+    dataset = pyramid.open_source(input_file)
+    grid = pyramid.TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+    # The workers report the tiles they skipped; the coordinator writes the one empty tile index.
+    empty = pyramid.EmptyTiles(output_dir, grid)
+    summary = {"units": len(units_by_id), "tiles": total_tiles, **pyramid.new_tile_stats()}
+    for unit_id in state.done:
+        with open(os.path.join(work_dir, "done", unit_id), encoding="utf-8") as f:
+            stats = json.load(f)["stats"]
+        empty.add(stats)
+        pyramid.add_tile_stats(summary, stats)
+    empty.checkpoint()
+    pyramid.TileArrays(os.path.join(work_dir, ARRAYS_DIR_NAME)).clear()
+    min_zoom, max_zoom = job["levels"]
+    pyramid.write_tilemapresource(output_dir, dataset, grid, min_zoom, max_zoom, encoding)
+    log(f"Tiles rendered: {total_tiles:,} in {len(units_by_id)} work units\n")
+    pyramid.log_tile_stats(summary, uniform_tiles, log)
+    return summary
@@ -0,0 +1,912 @@
+import codecs
+import json
+import locale
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field, replace
+
+import map_tiler_mosaic
+import map_tiler_tuning
+from map_tiler_progress import ProgressParser, ProgressTracker
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- GUI-free conversion engine ---
+# Used by both Tk front-ends, the batch queue and map_tiler_cli.py. Keep the imports
+# at the top of this module to the standard library so short CLI runs start fast.
+
+CONVERSION_TYPES = ("tiles", "overviews", "srtmhgt")
+RESAMPLING_METHODS = ["average", "nearest", "bilinear", "lanczos", "cubic", "cubicspline"]
+# "external" leaves the source untouched and writes the overviews to a sidecar .ovr (next to
+# the source, or with a VRT pointing at it in the output directory when that is elsewhere).
+OVERVIEW_MODES = ("copy", "cog", "external")
+# Tiles: a z/x/y folder of PNGs, or a single MBTiles (SQLite) file.
+TILE_OUTPUTS = ("directory", "mbtiles")
+# Tiles: uniform (single-colour or fully transparent) tiles are written normally, hardlinked to
+# one shared file per colour, or - when fully transparent - not written at all.
+UNIFORM_TILE_MODES = ("write", "link", "skip")
+# Tiles: image format; "jpeg" and "webp" take a 1-100 quality. JPEG tiles have no transparency.
+TILE_FORMATS = ("png", "jpeg", "webp", "webp-lossless")
+COMPRESSION_METHODS = ["DEFLATE", "LZW", "ZSTD", "JPEG", "NONE"]
+BLOCK_SIZES = [256, 512, 1024]
+DEFAULT_LEVELS = {"tiles": "0-16", "overviews": "2 4 8 16", "srtmhgt": ""}
+# Resampling proposed by the CLI and the GUI: elevations are interpolated onto the SRTM grid.
+DEFAULT_RESAMPLING = {"tiles": "average", "overviews": "average", "srtmhgt": "bilinear"}
+# Levels value that lets map_tiler_planner choose them from the input (native max zoom, overviews
+# down to a thumbnail).
+AUTO_LEVELS = "auto"
+# How gdal_translate / gdaladdo stages run: the command line tools, or the GDAL Python bindings
+# in a pool of worker processes kept warm between jobs (see map_tiler_inprocess).
+BACKENDS = ("subprocess", "inprocess")
+# Result cache modes (see map_tiler_cache).
+CACHE_MODES = ("off", "on", "verify")
+# SRTMHGT sample spacing in arc-seconds (3 -> 1201x1201 cells, 1 -> 3601x3601). A spec's
+# srtm_resolution of None keeps the input's grid when it already has one of these sizes.
+SRTM_RESOLUTIONS = [3, 1]
+
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(SCRIPT_DIR, "bin")
+
+
+class ConversionError(ValueError):
+    # Raised for an invalid ConversionSpec. The message is meant to be shown to the user.
+    pass
+
+
+@dataclass
+class ConversionSpec:
+    # A raster file, or a directory whose map files are combined as a virtual mosaic.
+    input_file: str
+    conversion_type: str = "tiles"
+    # Base directory for the output; defaults to the input file's directory.
+    output_dir: str = ""
+    # Explicit final output (tiles directory, GeoTIFF or .hgt path). Overrides the naming convention.
+    output_path: str = ""
+    levels: str = ""
+    resampling: str = "average"
+    processes: int = field(default_factory=lambda: os.cpu_count() or 1)
+    overview_mode: str = "copy"
+    compression: str = "DEFLATE"
+    block_size: int = 512
+    # Tiles only: render with the built-in renderer, keeping a manifest so an interrupted run can resume.
+    resume: bool = False
+    # Tiles only: update an existing pyramid in place, re-rendering just the tiles touched by a
+    # change. The change is found by comparing with the previous source, or given as a bounding
+    # box (minx, miny, maxx, maxy) in the source's coordinates.
+    update_from: str = ""
+    dirty_bbox: tuple = None
+    # Tiles only: "directory" or "mbtiles" (rendered by the built-in renderer into one file).
+    tile_output: str = "directory"
+    # Tiles only: one of UNIFORM_TILE_MODES; anything but "write" uses the built-in renderer.
+    uniform_tiles: str = "write"
+    # Tiles only: one of TILE_FORMATS, and the quality for "jpeg" and "webp".
+    tile_format: str = "png"
+    tile_quality: int = 75
+    # SRTMHGT only: split the DTM into one .hgt per 1x1 degree cell it covers (written in
+    # parallel with `processes` workers) instead of converting it as a single cell.
+    srtm_split: bool = False
+    srtm_resolution: int = None
+    # SRTMHGT only: fill small voids from the surrounding elevations (off by default, voids
+    # stay -32768), and the memory cap in MB for the streamed preprocessing (shared by the
+    # split's workers).
+    srtm_fill_voids: bool = False
+    srtm_memory_mb: int = 256
+    # GDAL tuning: "auto" (cache, threads and creation options chosen from the input and the
+    # host), "none" (GDAL defaults) or the name of a profile saved with map_tiler_tuning.
+    tuning: str = "auto"
+    # Virtual mosaic of these sheets (input_file is then the directory that names the mosaic).
+    input_files: list = None
+    # Tiles only: render through this shared work directory (see map_tiler_distributed).
+    # `processes` local workers are started; workers on other hosts may join the job.
+    work_dir: str = ""
+    # One of BACKENDS. "inprocess" falls back to the tools when the bindings are not installed.
+    backend: str = "subprocess"
+    # Result cache: "off", "on" (reuse the output of an identical earlier run) or "verify"
+    # (also hash the whole input before reusing). See map_tiler_cache.
+    cache: str = "off"
+    cache_dir: str = ""
+    cache_max_gb: float = 20.0
+    # Sample the CPU, memory, disk I/O and open files of every stage at this interval in
+    # seconds (see map_tiler_sampling); 0 turns sampling off.
+    sample_interval: float = 0.0
+
+    def __post_init__(self):
+        if not self.levels:
+            self.levels = DEFAULT_LEVELS.get(self.conversion_type, "")
+
+
+@dataclass
+class Stage:
+    name: str
+    command: list
+    description: str = ""
+    # In-process stages call action(log, progress) instead of running command; it returns an exit code.
+    action: object = None
+    # (name, args) of the equivalent map_tiler_inprocess operation, for the in-process backend.
+    operation: tuple = None
+    # Number of 0...100 progress runs the tool prints (gdal2tiles: base tiles, then overviews).
+    progress_passes: int = 1
+    # Extra environment variables (GDAL configuration options) for this stage.
+    env: dict = None
+    returncode: int = None
+    wall_time: float = 0.0
+    # Resource usage; None where the platform cannot measure it.
+    cpu_time: float = None
+    peak_rss: int = None
+    bytes_written: int = None
+    # Backend the stage actually ran on.
+    backend: str = ""
+    # Resource sampling summary and time series (rows of map_tiler_sampling.COLUMNS), or None.
+    resources: dict = None
+    samples: list = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "command": self.command,
+            "returncode": self.returncode,
+            "wall_time": round(self.wall_time, 3),
+            "cpu_time": None if self.cpu_time is None else round(self.cpu_time, 3),
+            "peak_rss": self.peak_rss,
+            "bytes_written": self.bytes_written,
+            "env": self.env,
+            "backend": self.backend,
+            "resources": self.resources,
+        }
+
+
+@dataclass
+class ConversionResult:
+    spec: ConversionSpec
+    output_path: str
+    stages: list
+    success: bool = False
+    message: str = ""
+    started_at: float = field(default_factory=time.time)
+    report_path: str = ""
+    # Settings of the applied tuning profile, or None.
+    tuning: dict = None
+    # The output was linked from the result cache instead of being converted.
+    cache_hit: bool = False
+    # Resource time series written by the sampler, or "".
+    samples_path: str = ""
+
+    @property
+    def wall_time(self):
+        return sum(stage.wall_time for stage in self.stages)
+
+    def to_dict(self):
+        return {
+            "input_file": self.spec.input_file,
+            "conversion_type": self.spec.conversion_type,
+            "output_path": self.output_path,
+            "success": self.success,
+            "message": self.message,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started_at)),
+            "wall_time": round(self.wall_time, 3),
+            "tuning": self.tuning,
+            "cache_hit": self.cache_hit,
+            "samples_path": self.samples_path,
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+
+def find_gdal_tool(name):
+    # Prefer the portable tools in bin/ (Windows builds), then whatever is on PATH
+    # (headless Linux nodes). Falls back to the bin/ path so the error names it.
+    file_name = name + ".exe" if os.name == "nt" else name
+    candidate = os.path.join(BIN_DIR, file_name)
+    if os.path.isfile(candidate):
+        return candidate
+    return shutil.which(name) or candidate
+
+
+def gdal_env():
+    env = os.environ.copy()
+    gdal_data_path = os.path.join(BIN_DIR, "gdal-data")
+    if os.path.isdir(gdal_data_path) or "GDAL_DATA" not in env:
+        env['GDAL_DATA'] = gdal_data_path
+    return env
+
+
+def get_output_path(spec):
+    if spec.output_path:
+        return spec.output_path
+    base_output_dir = spec.output_dir or os.path.dirname(os.path.abspath(spec.input_file))
+    base_name = os.path.splitext(os.path.basename(spec.input_file))[0]
+    if spec.conversion_type == "tiles":
+        if spec.tile_output == "mbtiles":
+            return os.path.join(base_output_dir, f"{base_name}.mbtiles")
+        return os.path.join(base_output_dir, f"{base_name}_tiles")
+    if spec.conversion_type == "overviews" and spec.overview_mode == "external":
+        import map_tiler_overviews
+        cache_dir = external_cache_dir(spec)
+        dataset_path = map_tiler_overviews.cache_vrt_path(spec.input_file, cache_dir) if cache_dir else spec.input_file
+        return map_tiler_overviews.ovr_path_for(dataset_path)
+    if spec.conversion_type == "overviews":
+        suffix = "_cog.tif" if spec.overview_mode == "cog" else "_with_overviews.tif"
+        return os.path.join(base_output_dir, base_name + suffix)
+    if spec.srtm_split:
+        return os.path.join(base_output_dir, f"{base_name}_hgt")
+    return os.path.join(base_output_dir, base_name + ".hgt")
+
+
+def external_cache_dir(spec):
+    # Directory for the VRT and .ovr of external overviews, or "" for a sidecar next to the source.
+    input_dir = os.path.dirname(os.path.abspath(spec.input_file))
+    if spec.output_dir and os.path.abspath(spec.output_dir) != input_dir:
+        return spec.output_dir
+    return ""
+
+
+def plan_levels(input_file):
+    # map_tiler_planner.LevelPlan of a raster file, or None when it cannot be read.
+    import map_tiler_planner
+    if not os.path.isfile(input_file):
+        return None
+    return map_tiler_planner.plan_levels(input_file, find_gdal_tool("gdalinfo"), gdal_env())
+
+
+def resolve_levels(spec):
+    # spec.levels, with AUTO_LEVELS replaced by the planner's proposal.
+    import map_tiler_planner
+    if spec.levels != AUTO_LEVELS:
+        return spec.levels
+    plan = plan_levels(spec.input_file)
+    if plan is None:
+        raise ConversionError(f"Could not read the size of {spec.input_file} to choose the levels automatically; enter them instead.")
+    return map_tiler_planner.auto_levels(plan, spec.conversion_type)
+
+
+def resolve_tuning(spec):
+    # The TuningProfile for spec.tuning, or None for "none".
+    try:
+        return map_tiler_tuning.resolve_profile(spec, find_gdal_tool("gdalinfo"), gdal_env())
+    except (OSError, ValueError) as e:
+        raise ConversionError(f"Tuning profile: {e}")
+
+
+def check_options(spec):
+    # Raises ConversionError for invalid option values; touches no files, so a GUI can call
+    # it on its main thread.
+    if spec.conversion_type not in CONVERSION_TYPES:
+        raise ConversionError(f"Unsupported conversion type: {spec.conversion_type}")
+    if spec.backend not in BACKENDS:
+        raise ConversionError(f"Unsupported execution backend: {spec.backend}")
+    if spec.cache not in CACHE_MODES:
+        raise ConversionError(f"Unsupported result cache mode: {spec.cache}")
+
+
+def check_spec(spec):
+    # Raises ConversionError for invalid options or a missing input, before anything reads
+    # the input. Returns the mosaic's sheets, or None for a single input file.
+    check_options(spec)
+    sheets = mosaic_sheets(spec)
+    if sheets is None and (not spec.input_file or not os.path.exists(spec.input_file)):
+        raise ConversionError(f"Input file does not exist: {spec.input_file}")
+
+    if sheets is not None and spec.levels == AUTO_LEVELS:
+        raise ConversionError("Automatic levels need a single input file; enter the levels for a mosaic.")
+    return sheets
+
+
+def plan_stages(spec, profile=None):
+    # Returns ([Stage, ...], final_output_path). Raises ConversionError for invalid options.
+    # profile is the TuningProfile to apply; it is resolved from spec.tuning when not given.
+    sheets = check_spec(spec)
+    if profile is None:
+        profile = resolve_tuning(spec)
+    if sheets is not None:
+        # The mosaic VRT replaces the input for every later stage.
+        mosaic_stage, vrt_path = plan_mosaic_stage(spec, sheets)
+        stages, output_path = plan_conversion_stages(replace(spec, input_file=vrt_path, input_files=None), profile)
+        stages.insert(0, mosaic_stage)
+    else:
+        stages, output_path = plan_conversion_stages(spec, profile)
+    if profile is not None:
+        for stage in stages:
+            stage.env = {**profile.environment(), **(stage.env or {})}
+    return stages, output_path
+
+
+def mosaic_sheets(spec):
+    # The sheets of a mosaic input, or None for a single input file.
+    if spec.input_files:
+        sheets = list(spec.input_files)
+    elif spec.input_file and os.path.isdir(spec.input_file):
+        sheets = map_tiler_mosaic.list_mosaic_sources(spec.input_file)
+    else:
+        return None
+    if not sheets:
+        raise ConversionError(f"No map files found in: {spec.input_file}")
+    missing = [sheet for sheet in sheets if not os.path.isfile(sheet)]
+    if missing:
+        raise ConversionError(f"Input file does not exist: {missing[0]}")
+    return sheets
+
+
+def plan_mosaic_stage(spec, sheets):
+    # Combines the sheets into <name>_mosaic.vrt in the output directory: a small XML file
+    # that references the sheets, so nothing is merged or copied.
+    base_output_dir = spec.output_dir or os.path.abspath(spec.input_file or os.path.dirname(sheets[0]))
+    vrt_path = os.path.join(base_output_dir, map_tiler_mosaic.mosaic_name(spec.input_file or os.path.dirname(sheets[0])) + ".vrt")
+    # Tiles get an alpha band so the gaps between sheets stay transparent; an extra band
+    # would break the single-band SRTMHGT output and change the overview copy.
+    add_alpha = spec.conversion_type == "tiles"
+    gdalbuildvrt = find_gdal_tool("gdalbuildvrt")
+
+    def build(log, progress):
+        map_tiler_mosaic.build_mosaic(sheets, vrt_path, spec.resampling, add_alpha, gdalbuildvrt, gdal_env(), log=log)
+        return 0
+
+    command = ["map_tiler_mosaic", f"--sheets={len(sheets)}", *(["-addalpha"] if add_alpha else []), vrt_path]
+    return Stage("virtual mosaic", command, action=build), vrt_path
+
+
+def plan_conversion_stages(spec, profile):
+    if spec.conversion_type in ("tiles", "overviews"):
+        spec = replace(spec, levels=resolve_levels(spec))
+    output_path = get_output_path(spec)
+    input_file = spec.input_file
+
+    if spec.conversion_type == "tiles" or spec.srtm_split:
+        if not str(spec.processes).strip().isdigit() or int(spec.processes) < 1:
+            raise ConversionError("'Worker Processes' must be a positive integer (e.g., '8').")
+
+    if spec.conversion_type == "tiles":
+
+        if spec.tile_output not in TILE_OUTPUTS:
+            raise ConversionError(f"Unsupported tile output: {spec.tile_output}")
+        if spec.uniform_tiles not in UNIFORM_TILE_MODES:
+            raise ConversionError(f"Unsupported uniform tile mode: {spec.uniform_tiles}")
+        if spec.tile_format not in TILE_FORMATS:
+            raise ConversionError(f"Unsupported tile format: {spec.tile_format}")
+        if not str(spec.tile_quality).strip().isdigit() or not 1 <= int(spec.tile_quality) <= 100:
+            raise ConversionError("'Quality' must be a whole number from 1 to 100.")
+        if spec.work_dir and (spec.tile_output == "mbtiles" or spec.update_from or spec.dirty_bbox):
+            raise ConversionError("Distributed tiling writes a new tiles folder; it cannot write MBTiles or update an existing pyramid.")
+        if spec.tile_output == "mbtiles":
+            return plan_mbtiles_stages(spec, output_path), output_path
+        if spec.resume or spec.update_from or spec.dirty_bbox or spec.uniform_tiles != "write" or spec.work_dir:
+            return plan_builtin_tile_stages(spec, output_path), output_path
+
+        # gdal2tiles splits the base zoom tiles into chunks, renders them in a
+        # process pool and then builds the lower zooms from them. The tiles are
+        # identical to a single-process run.
+        command = [
+            find_gdal_tool("gdal2tiles"),
+            '-p', 'raster',
+            '-z', spec.levels,
+            f'--resampling={spec.resampling}',
+            f'--processes={int(spec.processes)}',
+            *gdal2tiles_format_args(spec),
+            input_file,
+            output_path
+        ]
+        return [Stage("gdal2tiles", command, progress_passes=2)], output_path
+
+    if spec.conversion_type == "overviews":
+        # External overviews work for any raster GDAL can read; the other modes write a GeoTIFF copy.
+        if spec.overview_mode != "external" and not input_file.lower().endswith(('.tif', '.tiff', '.vrt')):
+            raise ConversionError("For 'Add Internal Overviews', the input file MUST be a GeoTIFF (.tif/.tiff).")
+
+        levels_list = spec.levels.split()
+        if not levels_list or not all(part.isdigit() for part in levels_list):
+            raise ConversionError("For 'Add Internal Overviews', 'Levels' must be space-separated integers (e.g., '2 4 8 16').")
+
+        if spec.overview_mode == "cog":
+            # The COG driver builds power-of-two overviews itself, so the levels
+            # only decide how many of them are written.
+            expected_levels = [str(2 ** (i + 1)) for i in range(len(levels_list))]
+            if levels_list != expected_levels:
+                raise ConversionError(f"For 'Cloud Optimized GeoTIFF' output, 'Levels' must be consecutive powers of two starting at 2 (e.g., '{' '.join(expected_levels)}').")
+
+            cog_options = [
+                '-of', 'COG',
+                '-co', f'COMPRESS={spec.compression}',
+                '-co', f'BLOCKSIZE={spec.block_size}',
+                '-co', f'OVERVIEW_RESAMPLING={spec.resampling}',
+                '-co', f'OVERVIEW_COUNT={len(levels_list)}',
+                '-co', 'NUM_THREADS=ALL_CPUS',
+                '-co', 'BIGTIFF=IF_SAFER',
+            ]
+            if spec.compression in ("DEFLATE", "LZW", "ZSTD"):
+                cog_options += ['-co', 'PREDICTOR=YES']
+            return [translate_stage("gdal_translate COG", cog_options, input_file, output_path, f"Writing Cloud Optimized GeoTIFF with internal overviews to: {output_path}\n")], output_path
+
+        if spec.overview_mode == "external":
+            return plan_external_overview_stages(spec, levels_list, output_path), output_path
+
+        if spec.overview_mode != "copy":
+            raise ConversionError(f"Unsupported overview output: {spec.overview_mode}")
+
+        addo_command = [
+            find_gdal_tool("gdaladdo"),
+            '-r', spec.resampling,
+            output_path,
+            *levels_list
+        ]
+        return [
+            translate_stage("gdal_translate copy", profile.creation_args() if profile else [], input_file, output_path, f"Copying GeoTIFF to: {output_path}\n"),
+            Stage("gdaladdo", addo_command, f"GeoTIFF copied successfully.\nAdding overviews to: {output_path}\n",
+                  operation=("addo", (output_path, spec.resampling, [int(level) for level in levels_list]))),
+        ], output_path
+
+    # srtmhgt
+    if spec.srtm_split:
+        return plan_srtm_split_stages(spec, output_path), output_path
+
+    import map_tiler_inprocess
+    if map_tiler_inprocess.bindings_available():
+        return plan_srtm_cell_stages(spec, input_file, output_path), output_path
+    return [translate_stage("gdal_translate", ["-of", "SRTMHGT"], input_file, output_path)], output_path
+
+
+def translate_stage(name, options, input_file, output_path, description=""):
+    # A gdal_translate stage that either backend can run.
+    command = [find_gdal_tool("gdal_translate"), *options, input_file, output_path]
+    return Stage(name, command, description, operation=("translate", (input_file, output_path, list(options))))
+
+
+def plan_external_overview_stages(spec, levels_list, output_path):
+    # Built level from level in-process with the GDAL bindings; without them gdaladdo -ro
+    # writes the same sidecar (GDAL then decides which level each one is computed from).
+    import map_tiler_inprocess
+    import map_tiler_overviews
+    cache_dir = external_cache_dir(spec)
+    description = f"Writing external overviews (the source is not copied) to: {output_path}\n"
+    if map_tiler_inprocess.bindings_available():
+        def build(log, progress):
+            map_tiler_overviews.build_external_overviews(spec.input_file, levels_list, spec.resampling, cache_dir, spec.compression, spec.block_size, log=log, progress=progress)
+            return 0
+
+        command = ["map_tiler_overviews", '-r', spec.resampling, f'--compression={spec.compression}', f'--block-size={spec.block_size}', *([f'--cache-dir={cache_dir}'] if cache_dir else []), spec.input_file, *levels_list]
+        return [Stage("external overviews", command, description, action=build)]
+
+    info = map_tiler_tuning.inspect_input(spec.input_file, find_gdal_tool("gdalinfo"), gdal_env())
+    env = map_tiler_overviews.overview_options(spec.compression, spec.block_size, info["data_type"], info["bands"])
+    stages = []
+    dataset_path = spec.input_file
+    if cache_dir:
+        dataset_path = map_tiler_overviews.cache_vrt_path(spec.input_file, cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        stages.append(translate_stage("gdal_translate VRT", ["-of", "VRT"], os.path.abspath(spec.input_file), dataset_path, f"Writing cache VRT pointing at the source: {dataset_path}\n"))
+    addo_command = [find_gdal_tool("gdaladdo"), '-ro', '-r', spec.resampling, dataset_path, *levels_list]
+    stages.append(Stage("gdaladdo -ro", addo_command, description, env=env))
+    return stages
+
+
+def gdal2tiles_format_args(spec):
+    # PNG is gdal2tiles' default; JPEG tiles need GDAL 3.9 or later.
+    if spec.tile_format == "webp":
+        return ['--tiledriver=WEBP', f'--webp-quality={int(spec.tile_quality)}']
+    if spec.tile_format == "webp-lossless":
+        return ['--tiledriver=WEBP', '--webp-lossless']
+    if spec.tile_format == "jpeg":
+        return ['--tiledriver=JPEG', f'--jpeg-quality={int(spec.tile_quality)}']
+    return []
+
+
+def tile_encoding(spec):
+    import map_tiler_pyramid
+    return map_tiler_pyramid.TileEncoding(spec.tile_format, int(spec.tile_quality))
+
+
+def plan_mbtiles_stages(spec, output_path):
+    # The whole pyramid in one SQLite file, rendered by map_tiler_pyramid's workers and
+    # written by map_tiler_mbtiles. Re-running with an existing file resumes it.
+    import map_tiler_mbtiles
+    import map_tiler_pyramid
+    if spec.update_from or spec.dirty_bbox:
+        raise ConversionError("Incremental updates are only supported for the tiles folder output.")
+    try:
+        map_tiler_pyramid.parse_zoom_levels(spec.levels)
+    except ValueError as e:
+        raise ConversionError(str(e))
+    processes = int(spec.processes)
+    encoding = tile_encoding(spec)
+
+    def render(log, progress):
+        map_tiler_mbtiles.render_mbtiles(spec.input_file, output_path, spec.levels, spec.resampling, processes, log=log, progress=progress, uniform_tiles=spec.uniform_tiles, encoding=encoding)
+        return 0
+
+    command = ["map_tiler_mbtiles", '-z', spec.levels, f'--resampling={spec.resampling}', f'--processes={processes}', f'--tile-format={encoding.tile_format}', f'--quality={encoding.quality}', spec.input_file, output_path]
+    return [Stage("mbtiles writer", command, f"Rendering tiles into MBTiles file: {output_path}\n", action=render)]
+
+
+def plan_srtm_split_stages(spec, output_path):
+    # One .hgt per degree cell, warped and written in-process by map_tiler_srtm.
+    import map_tiler_srtm
+    if spec.srtm_resolution is not None and spec.srtm_resolution not in SRTM_RESOLUTIONS:
+        raise ConversionError(f"SRTMHGT resolution must be one of {SRTM_RESOLUTIONS} arc-seconds.")
+    processes = int(spec.processes)
+
+    def split(log, progress):
+        map_tiler_srtm.split_to_hgt(spec.input_file, output_path, spec.srtm_resolution, spec.resampling, processes, log=log, progress=progress,
+                                    fill=spec.srtm_fill_voids, memory_mb=int(spec.srtm_memory_mb))
+        return 0
+
+    command = ["map_tiler_srtm", *srtm_args(spec), f'--processes={processes}', spec.input_file, output_path]
+    return [Stage("hgt cell splitter", command, f"Splitting into 1x1 degree SRTMHGT cells in: {output_path}\n", action=split)]
+
+
+def srtm_args(spec):
+    resolution = "native" if spec.srtm_resolution is None else spec.srtm_resolution
+    return [f'--resolution={resolution}', f'--resampling={spec.resampling}', *(['--fill-voids'] if spec.srtm_fill_voids else [])]
+
+
+def plan_srtm_cell_stages(spec, input_file, output_path):
+    # A single .hgt, preprocessed the same way as the split's cells (needs the GDAL bindings;
+    # without them gdal_translate converts the DTM as it is). A DTM already on the chosen
+    # grid is copied as it is unless its voids are to be filled.
+    import map_tiler_srtm
+    if spec.srtm_resolution is not None and spec.srtm_resolution not in SRTM_RESOLUTIONS:
+        raise ConversionError(f"SRTMHGT resolution must be one of {SRTM_RESOLUTIONS} arc-seconds.")
+    native = map_tiler_srtm.native_resolution(input_file)
+    if native is not None and spec.srtm_resolution in (None, native) and not spec.srtm_fill_voids:
+        return [translate_stage("gdal_translate", ["-of", "SRTMHGT"], input_file, output_path)]
+
+    def convert(log, progress):
+        try:
+            map_tiler_srtm.convert_to_hgt(input_file, output_path, spec.srtm_resolution, spec.resampling, spec.srtm_fill_voids, int(spec.srtm_memory_mb), log=log, progress=progress)
+        except ValueError as e:
+            raise ConversionError(str(e))
+        return 0
+
+    command = ["map_tiler_srtm", *srtm_args(spec), input_file, output_path]
+    return [Stage("hgt preprocessing", command, f"Preprocessing the DTM into SRTMHGT: {output_path}\n", action=convert)]
+
+
+def plan_builtin_tile_stages(spec, output_path):
+    # Tiles rendered in-process by map_tiler_pyramid (resumable and incremental modes).
+    import map_tiler_pyramid
+    try:
+        map_tiler_pyramid.parse_zoom_levels(spec.levels)
+    except ValueError as e:
+        raise ConversionError(str(e))
+    processes = int(spec.processes)
+    encoding = tile_encoding(spec)
+    command = ["map_tiler_pyramid", '-z', spec.levels, f'--resampling={spec.resampling}', f'--processes={processes}', f'--tile-format={encoding.tile_format}', f'--quality={encoding.quality}']
+
+    if spec.update_from or spec.dirty_bbox:
+        if spec.update_from and not os.path.exists(spec.update_from):
+            raise ConversionError(f"Previous source file does not exist: {spec.update_from}")
+        if spec.dirty_bbox is not None and len(spec.dirty_bbox) != 4:
+            raise ConversionError("The dirty bounding box must be 'minx,miny,maxx,maxy'.")
+        if not os.path.isdir(output_path):
+            raise ConversionError(f"An incremental update needs the existing tiles directory: {output_path}")
+
+        def update(log, progress):
+            map_tiler_pyramid.update_pyramid(spec.input_file, output_path, spec.levels, spec.resampling, processes, previous_file=spec.update_from, dirty_bbox=spec.dirty_bbox, log=log, progress=progress, uniform_tiles=spec.uniform_tiles, encoding=encoding)
+            return 0
+
+        command += ['--update', spec.input_file, output_path]
+        return [Stage("incremental tile update", command, "Re-rendering the changed tiles with the built-in renderer\n", action=update)]
+
+    if spec.work_dir:
+        import map_tiler_distributed
+
+        def coordinate(log, progress):
+            map_tiler_distributed.coordinate(spec.work_dir, spec.input_file, output_path, spec.levels, spec.resampling, spec.uniform_tiles, encoding, processes, log=log, progress=progress)
+            return 0
+
+        command += [f'--work-dir={spec.work_dir}', spec.input_file, output_path]
+        return [Stage("distributed tiles", command, f"Coordinating the tile job in {spec.work_dir} with {processes} local workers\n", action=coordinate)]
+
+    def render(log, progress):
+        map_tiler_pyramid.render_pyramid(spec.input_file, output_path, spec.levels, spec.resampling, processes, log=log, progress=progress, uniform_tiles=spec.uniform_tiles, encoding=encoding)
+        return 0
+
+    command += [spec.input_file, output_path]
+    return [Stage("tile renderer", command, "Rendering tiles with the resumable built-in renderer\n", action=render)]
+
+
+def path_size(path):
+    # Bytes used by a file, or by all files below a directory.
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root_dir, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.path.getsize(os.path.join(root_dir, file_name))
+            except OSError:
+                pass
+    return total
+
+
+def max_rss_bytes(rusage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+
+
+def run_stage(stage, env, log, progress=None, output_path="", backend="subprocess", sample_interval=0.0):
+    # Runs one stage, streaming its output to log() and its 0..1 progress to progress().
+    # Returns the exit code and records wall time, CPU time, peak RSS and bytes written,
+    # and with a sample_interval the resource time series.
+    import map_tiler_sampling
+    if progress is None:
+        progress = lambda fraction: None
+    size_before = path_size(output_path) if output_path and os.path.exists(output_path) else 0
+    # An action runs in this process, which it may share with other jobs; tools and pool tasks
+    # are sampled as their own process once it is known.
+    sampler = map_tiler_sampling.StageSampler(stage.name, sample_interval, process_wide=stage.action is not None) if sample_interval else None
+    started = time.perf_counter()
+    if sampler is not None:
+        sampler.start()
+    try:
+        if stage.action is not None:
+            stage.backend = "action"
+            run_action(stage, log, progress)
+        elif backend == "inprocess" and stage.operation is not None and run_inprocess(stage, log, progress, sampler):
+            pass
+        else:
+            stage.backend = "subprocess"
+            run_process(stage, {**env, **(stage.env or {})}, log, progress, sampler)
+    finally:
+        stage.wall_time = time.perf_counter() - started
+        if sampler is not None:
+            stage.resources = sampler.stop()
+            stage.samples = sampler.rows
+        if output_path and os.path.exists(output_path):
+            stage.bytes_written = max(0, path_size(output_path) - size_before)
+    return stage.returncode
+
+
+def run_action(stage, log, progress):
+    # In-process stages (and the worker processes they start) read the stage's GDAL settings
+    # from the environment, so set them for the duration of the action.
+    saved_env = {key: os.environ.get(key) for key in stage.env or {}}
+    os.environ.update(stage.env or {})
+    try:
+        measure_action(stage, log, progress)
+    finally:
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def measure_action(stage, log, progress):
+    usage_before = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)] if resource else None
+    process_time_before = time.process_time()
+    try:
+        stage.returncode = stage.action(log, progress)
+    except Exception as e:
+        log(f"Error: {e}\n")
+        stage.returncode = 1
+    if usage_before is not None:
+        usage_after = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+        stage.cpu_time = sum(after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime for before, after in zip(usage_before, usage_after))
+        # ru_maxrss is a lifetime peak, so this is an upper bound for the stage.
+        stage.peak_rss = max(max_rss_bytes(usage) for usage in usage_after)
+    else:
+        stage.cpu_time = time.process_time() - process_time_before
+
+
+def run_inprocess(stage, log, progress, sampler=None):
+    # Runs the stage's operation on the warm GDAL worker pool. Returns False (nothing run)
+    # when the bindings are missing or the pool broke, so the caller falls back to the tool.
+    import map_tiler_inprocess
+    if not map_tiler_inprocess.bindings_available():
+        log("GDAL Python bindings not found; running the command line tool instead.\n")
+        return False
+    log(f"Running in-process (GDAL bindings):\n{' '.join(stage.command[1:])}\n\n")
+    try:
+        on_start = None if sampler is None else lambda pid: sampler.attach(pid, new_process=False)
+        stage.returncode, stage.cpu_time, stage.peak_rss = map_tiler_inprocess.run_operation(*stage.operation, config=stage.env, log=log, progress=progress, on_start=on_start)
+    except map_tiler_inprocess.WorkerPoolError as e:
+        log(f"{e} Running the command line tool instead.\n")
+        return False
+    stage.backend = "inprocess"
+    return True
+
+
+def run_process(stage, env, log, progress, sampler=None):
+    log(f"Running command:\n{' '.join(stage.command)}\n\n")
+    # The bundled .exe tools have always been started through the shell on Windows.
+    process = subprocess.Popen(stage.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=os.name == "nt", env=env)
+    if sampler is not None:
+        sampler.attach(process.pid)
+    # Forward whatever the tool has written so far instead of waiting for whole lines, so
+    # the pipe never fills up and GDAL's "0...10...20" progress shows up as it happens.
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+    parser = ProgressParser(stage.progress_passes)
+    while True:
+        chunk = process.stdout.read1(OUTPUT_CHUNK_SIZE)
+        if not chunk:
+            break
+        text = decoder.decode(chunk).replace("\r\n", "\n")
+        log(text)
+        if parser.feed(text):
+            progress(parser.fraction)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        log(tail)
+
+    if hasattr(os, "wait4"):
+        # wait4 reports the CPU time and peak RSS of the tool (including the worker
+        # processes it reaped, e.g. gdal2tiles --processes).
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stage.cpu_time = rusage.ru_utime + rusage.ru_stime
+        stage.peak_rss = max_rss_bytes(rusage)
+    else:
+        process.wait()
+    stage.returncode = process.returncode
+
+
+def report_path_for(output_path):
+    return os.path.normpath(output_path) + ".report.json"
+
+
+def write_run_report(result):
+    # Machine-readable record of the run next to the output: spec, host and per-stage metrics.
+    report = result.to_dict()
+    report["spec"] = asdict(result.spec)
+    report["host"] = {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+    report_path = report_path_for(result.output_path)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    result.report_path = report_path
+    return report_path
+
+
+def run_conversion(spec, log=None, progress=None, write_report=True):
+    # Runs every stage of the conversion, stopping at the first failure.
+    # progress, if given, is called with a ProgressTracker (fraction, eta, stage_name).
+    # Raises ConversionError for an invalid spec; tool failures are reported in the result.
+    if log is None:
+        log = lambda text: None
+    # The tuning profile inspects the input, so a missing input is reported as such first.
+    check_spec(spec)
+    profile = resolve_tuning(spec)
+    stages, output_path = plan_stages(spec, profile)
+    cache, cache_key, sources, entry = open_result_cache(spec, log)
+    if entry is not None:
+        def restore(log, progress):
+            cache.restore(cache_key, entry, output_path)
+            return 0
+
+        stages = [Stage("result cache", ["map_tiler_cache", "--restore", cache_key, output_path], f"Reusing the output of an identical earlier run (result cache entry {cache_key})\n", action=restore)]
+    result = ConversionResult(spec, output_path, stages, cache_hit=entry is not None)
+    if profile is not None:
+        result.tuning = asdict(profile)
+        log(profile.describe() + "\n")
+    if entry is None:
+        log_level_estimate(spec, log)
+
+    if spec.conversion_type == "tiles" and spec.tile_output == "directory" and not os.path.exists(output_path):
+        os.makedirs(output_path)
+        log(f"Created output directory: {output_path}\n")
+
+    tracker = ProgressTracker([stage.name for stage in stages], progress)
+    try:
+        run_stages(result, log, tracker)
+        if result.cache_hit and result.success:
+            result.message += "\n(reused from the result cache)"
+        elif cache is not None and result.success:
+            try:
+                size = cache.store(cache_key, output_path, cache_params(spec), sources, verify=spec.cache == "verify")
+                log(f"Result cache: stored {size:,} bytes as entry {cache_key}\n")
+            except OSError as e:
+                log(f"Could not store the result in the cache: {e}\n")
+    finally:
+        tracker.finish()
+        if spec.sample_interval:
+            write_resource_samples(result, log)
+        if write_report and os.path.isdir(os.path.dirname(os.path.abspath(output_path))):
+            try:
+                log(f"Run report: {write_run_report(result)}\n")
+            except OSError as e:
+                log(f"Could not write run report: {e}\n")
+    return result
+
+
+def write_resource_samples(result, log):
+    import map_tiler_sampling
+    for line in map_tiler_sampling.describe_run(result.stages):
+        log(f"Resources: {line}\n")
+    if not any(stage.samples is not None for stage in result.stages) or not os.path.isdir(os.path.dirname(os.path.abspath(result.output_path))):
+        return
+    try:
+        result.samples_path = map_tiler_sampling.write_samples(map_tiler_sampling.samples_path_for(result.output_path), result.stages, result.spec.sample_interval)
+        log(f"Resource samples: {result.samples_path}\n")
+    except OSError as e:
+        log(f"Could not write the resource samples: {e}\n")
+
+
+def cache_params(spec):
+    # The settings that shape the output; paths, worker counts and the backend do not.
+    params = asdict(spec)
+    for key in ("input_file", "input_files", "output_dir", "output_path", "processes", "backend", "resume", "work_dir", "srtm_memory_mb", "cache", "cache_dir", "cache_max_gb", "sample_interval"):
+        params.pop(key)
+    params["levels"] = resolve_levels(spec)
+    return params
+
+
+def open_result_cache(spec, log):
+    # (ResultCache, key, input files, cached entry or None), or all None when the cache is
+    # off or does not apply (updates change an existing output; external overviews write
+    # next to the input).
+    import map_tiler_cache
+    if spec.cache == "off" or spec.update_from or spec.dirty_bbox is not None \
+            or (spec.conversion_type == "overviews" and spec.overview_mode == "external"):
+        return None, None, None, None
+    cache = map_tiler_cache.ResultCache(spec.cache_dir or map_tiler_cache.DEFAULT_CACHE_DIR, int(spec.cache_max_gb * 1024 ** 3))
+    sources = mosaic_sheets(spec) or [spec.input_file]
+    try:
+        key = map_tiler_cache.cache_key(sources, cache_params(spec), map_tiler_cache.gdal_version(find_gdal_tool("gdalinfo"), gdal_env()))
+        entry = cache.lookup(key, sources, verify=spec.cache == "verify", log=log)
+    except OSError as e:
+        log(f"Result cache unavailable: {e}\n")
+        return None, None, None, None
+    return cache, key, sources, entry
+
+
+def log_level_estimate(spec, log):
+    # Input size, native zoom and the estimated output, before the first stage starts.
+    import map_tiler_planner
+    if spec.conversion_type not in ("tiles", "overviews"):
+        return
+    plan = plan_levels(spec.input_file)
+    if plan is not None:
+        log(f"Input: {map_tiler_planner.describe_estimate(plan, spec.conversion_type, resolve_levels(spec), spec.tile_format, spec.overview_mode)}\n")
+
+
+def resource_sample_interval(spec, log):
+    import map_tiler_sampling
+    if spec.sample_interval and map_tiler_sampling.open_reader() is None:
+        log("Resource sampling needs psutil (or /proc on Linux); running without it.\n")
+        return 0.0
+    return spec.sample_interval
+
+
+def run_stages(result, log, tracker):
+    spec, output_path = result.spec, result.output_path
+    env = gdal_env()
+    sample_interval = resource_sample_interval(spec, log)
+    for index, stage in enumerate(result.stages):
+        tracker.start_stage(index)
+        if stage.description:
+            log(stage.description)
+        try:
+            returncode = run_stage(stage, env, log, tracker.update_stage, output_path, spec.backend, sample_interval)
+        except OSError as e:
+            result.message = f"Error: could not start {os.path.basename(stage.command[0])} ({e}). Ensure the executable exists and the path is correct."
+            return
+        log(f"[{stage.name}] finished in {stage.wall_time:.1f}s\n")
+        if returncode != 0:
+            if stage.name == "gdal_translate copy":
+                result.message = f"Error copying GeoTIFF. Exit code: {returncode}"
+            else:
+                result.message = f"Error in conversion ({stage.name}). Exit code: {returncode}"
+            return
+
+    result.success = True
+    if spec.conversion_type == "tiles" and spec.tile_output == "mbtiles":
+        result.message = f"Conversion completed successfully! Tiles written to MBTiles file:\n{output_path}"
+    elif spec.conversion_type == "tiles":
+        result.message = f"Conversion completed successfully! Tiles created in:\n{output_path}"
+    elif spec.conversion_type == "overviews" and spec.overview_mode == "external":
+        result.message = f"External overviews written successfully (source unchanged):\n{output_path}\nOpen {output_path[:-len('.ovr')]} to use them."
+    elif spec.conversion_type == "overviews":
+        result.message = f"Internal overviews added successfully to new GeoTIFF:\n{output_path}"
+    elif spec.srtm_split:
+        result.message = f"SRTMHGT cells created successfully in:\n{output_path}"
+    else:
+        result.message = f"SRTMHGT file created successfully:\n{output_path}"
@@ -1,8 +1,12 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 import os
-import subprocess
 import threading # To run the command in the background so the GUI doesn't freeze
+from map_tiler_engine import ConversionSpec, ConversionError, RESAMPLING_METHODS, run_conversion
+from map_tiler_log import LogSpool
+
+OUTPUT_POLL_INTERVAL_MS = 100 # How often queued tool output is drawn
+OUTPUT_MAX_LINES = 2000 # Lines kept in the output area
 
 class MapTilerApp:
     def __init__(self, master):
@@ -53,10 +57,16 @@ class MapTilerApp:
         # Resampling Method
         tk.Label(self.options_frame, text="Resampling Method:").pack(side="left", padx=5)
         self.resampling_method_var = tk.StringVar(master, value="average")
-        self.resampling_options = ["average", "nearest", "bilinear", "lanczos"]
+        self.resampling_options = RESAMPLING_METHODS
         self.resampling_menu = tk.OptionMenu(self.options_frame, self.resampling_method_var, *self.resampling_options)
         self.resampling_menu.pack(side="left", padx=5)
 
+        # Worker Processes (gdal2tiles renders the base zoom in a process pool)
+        tk.Label(self.options_frame, text="Processes:").pack(side="left", padx=5)
+        self.processes_var = tk.StringVar(master, value=str(os.cpu_count() or 1))
+        self.processes_entry = tk.Entry(self.options_frame, textvariable=self.processes_var, width=5)
+        self.processes_entry.pack(side="left", padx=5)
+
         # --- Conversion Button ---
         self.convert_button = tk.Button(master, text="Convert Map to Pyramids", command=self.start_conversion)
         self.convert_button.pack(pady=10)
@@ -68,6 +78,10 @@ class MapTilerApp:
         self.output_text = scrolledtext.ScrolledText(master, wrap=tk.WORD, height=8, width=70, state="disabled")
         self.output_text.pack(pady=5, padx=10, fill="both", expand=True)
 
+        # Tool output is queued by the conversion thread and drawn here in batches
+        self.log_spool = LogSpool()
+        self.poll_output_text()
+
     def browse_input_file(self):
         file_path = filedialog.askopenfilename(
             title="Select Map File",
@@ -103,15 +117,25 @@ class MapTilerApp:
         self.clear_output_text()
 
     def clear_output_text(self):
+        self.log_spool.clear()
         self.output_text.config(state="normal")
         self.output_text.delete(1.0, tk.END)
         self.output_text.config(state="disabled")
 
     def update_output_text(self, text):
-        self.output_text.config(state="normal")
-        self.output_text.insert(tk.END, text)
-        self.output_text.see(tk.END) # Auto-scroll to end
-        self.output_text.config(state="disabled")
+        self.log_spool.write(text) # Thread-safe; shown by poll_output_text
+
+    def poll_output_text(self):
+        text = self.log_spool.drain()
+        if text:
+            self.output_text.config(state="normal")
+            self.output_text.insert(tk.END, text)
+            excess_lines = int(self.output_text.index("end-1c").split(".")[0]) - OUTPUT_MAX_LINES
+            if excess_lines > 0:
+                self.output_text.delete("1.0", f"{excess_lines + 1}.0") # Bounded scrollback; full log is in the log file
+            self.output_text.see(tk.END) # Auto-scroll to end
+            self.output_text.config(state="disabled")
+        self.master.after(OUTPUT_POLL_INTERVAL_MS, self.poll_output_text)
 
     def start_conversion(self):
         if not self.input_file_path or not os.path.exists(self.input_file_path):
@@ -135,6 +159,12 @@ class MapTilerApp:
 
 
         self.clear_output_text()
+        log_path = os.path.normpath(chosen_output_dir) + ".log"
+        try:
+            self.log_spool.open(log_path)
+            self.update_output_text(f"Full log: {log_path}\n")
+        except OSError as e:
+            self.update_output_text(f"Could not create log file {log_path}: {e}\n")
         self.status_label.config(text="Starting conversion...", fg="orange")
         self.convert_button.config(state="disabled") # Prevents double clicks
 
@@ -143,90 +173,41 @@ class MapTilerApp:
         self.conversion_thread.start()
 
     def run_gdal2tiles(self, output_base_dir):
-        input_file = self.input_file_path
-        
-        # gdal2tiles.exe automatically creates a subfolder like 'filename_tiles'
-        # inside the provided output directory. So, we provide the base directory.
-        final_output_path_for_gdal = output_base_dir 
-
-        # The check for existing directory and deletion logic is now handled by gdal2tiles.exe itself.
-        # It prompts the user for overwrite by default if the exact output_dir already exists.
-        # However, for consistency and clear user control within the GUI,
-        # we can still offer a prompt *before* gdal2tiles.exe runs,
-        # if the *exact* final output directory name is known and exists.
-        # For simplicity, we'll let gdal2tiles.exe handle the overwrite prompt for its specific output folder.
-
-
-        zoom_levels = self.zoom_level_var.get()
-        resampling_method = self.resampling_method_var.get()
-
-        # --- Define Paths to GDAL Executables within the project's 'bin' folder ---
-        # Get the directory where the current script (map_tiler_gui.py) is located
-        script_dir = os.path.dirname(__file__)
-        
-        # Construct the full paths to the GDAL executables in the 'bin' folder
-        gdal2tiles_exe_path = os.path.join(script_dir, "bin", "gdal2tiles.exe") 
-
-        # --- VERY IMPORTANT: Set the GDAL_DATA environment variable ---
-        # gdal2tiles, gdaladdo, gdal_translate often need GDAL_DATA to find projection files, etc.
-        # This variable points to the 'gdal-data' folder, typically inside OSGeo4W installation.
-        # You'll need to copy this folder into your 'bin' directory, or find its path.
-        # A common location for GDAL_DATA would be: C:\OSGeo4W\share\gdal (or similar)
-        # For simplicity, let's assume you've copied 'gdal-data' into your 'bin' folder.
-        # Or, if you know the fixed path, you can use it directly:
-        # gdal_data_path = r"C:\OSGeo4W\share\gdal" 
-        
-        # If you copy the 'gdal-data' folder into your 'bin' directory:
-        gdal_data_path = os.path.join(script_dir, "bin", "gdal-data") 
-
-         # Create a copy of the current environment variables
-        env = os.environ.copy()
-        # Add or update GDAL_DATA
-        env['GDAL_DATA'] = gdal_data_path
-        # Optionally, you might also need to add the 'bin' directory to PATH if there are shared DLLs
-        # env['PATH'] = os.path.join(script_dir, "bin") + os.pathsep + env['PATH']
-
-        command = [
-            gdal2tiles_exe_path, # Execute gdal2tiles.exe directly
-            '-p', 'raster',
-            '-z', zoom_levels,
-            f'--resampling={resampling_method}',
-            input_file,
-            final_output_path_for_gdal # Pass the chosen base output directory
-        ]
-
-        self.update_output_text(f"Running command:\n{' '.join(command)}\n\n")
+        processes = self.processes_var.get().strip()
+
+        # gdal2tiles writes the tiles straight into the chosen output directory.
+        spec = ConversionSpec(
+            input_file=self.input_file_path,
+            conversion_type="tiles",
+            output_path=output_base_dir,
+            levels=self.zoom_level_var.get(),
+            resampling=self.resampling_method_var.get(),
+            processes=int(processes) if processes.isdigit() else processes,
+        )
 
         try:
-            # Execute the command and capture output in real-time
-            # shell=True is sometimes required when directly running an EXE
-            # It's important to add env=os.environ.copy() to ensure GDAL's
-            # environment variables are loaded correctly (like GDAL_DATA).
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True, shell=True, env=os.environ.copy())
-            
-            for line in process.stdout:
-                self.update_output_text(line)
-            process.wait() # Wait for the process to finish
-
-            if process.returncode == 0:
-                # Construct the expected final output directory name created by gdal2tiles.exe
-                base_name = os.path.splitext(os.path.basename(input_file))[0]
-                actual_tiles_output = os.path.join(output_base_dir, f"{base_name}_tiles")
-
-                self.status_label.config(text=f"Conversion completed successfully! Tiles in: {actual_tiles_output}", fg="green")
-                messagebox.showinfo("Success", f"Conversion completed successfully!\nTiles created in directory:\n{actual_tiles_output}")
-            else:
-                self.status_label.config(text=f"Error in conversion. Exit code: {process.returncode}", fg="red")
-                messagebox.showerror("Error", f"Error in conversion. Check output.\nExit code: {process.returncode}")
-
-        except FileNotFoundError:
-            self.status_label.config(text="Error: gdal2tiles.exe not found at the specified path. Ensure full and valid path.", fg="red")
-            messagebox.showerror("Error", "gdal2tiles.exe not found. Ensure the full path you entered in the code is correct (e.g.: C:\\OSGeo4W\\apps\\Python312\\Scripts\\gdal2tiles.exe).")
+            result = run_conversion(spec, log=self.update_output_text)
+            self.master.after(0, self.finish_conversion, result)
         except Exception as e:
-            self.status_label.config(text=f"An unexpected error occurred: {e}", fg="red")
-            messagebox.showerror("General Error", f"An unexpected error occurred: {e}")
+            self.master.after(0, self.finish_conversion, None, e)
         finally:
-            self.convert_button.config(state="normal") # Re-enable the button
+            self.log_spool.flush()
+
+    def finish_conversion(self, result, error=None):
+        # Back on the Tk main loop: only this thread touches the widgets.
+        if result is not None and result.success:
+            self.status_label.config(text=f"Conversion completed successfully! Tiles in: {result.output_path}", fg="green")
+            messagebox.showinfo("Success", f"Conversion completed successfully!\nTiles created in directory:\n{result.output_path}")
+        elif result is not None:
+            self.status_label.config(text=result.message, fg="red")
+            messagebox.showerror("Error", f"{result.message}\nCheck output.")
+        elif isinstance(error, ConversionError):
+            self.status_label.config(text=f"Error: {error}", fg="red")
+            messagebox.showerror("Error", str(error))
+        else:
+            self.status_label.config(text=f"An unexpected error occurred: {error}", fg="red")
+            messagebox.showerror("General Error", f"An unexpected error occurred: {error}")
+        self.convert_button.config(state="normal") # Re-enable the button
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -2,16 +2,32 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 from tkinter import ttk 
 import os
-import subprocess
 import threading
+import time
 import shutil
+from map_tiler_engine import ConversionSpec, ConversionError, RESAMPLING_METHODS, COMPRESSION_METHODS, DEFAULT_LEVELS, DEFAULT_RESAMPLING, AUTO_LEVELS, check_options, plan_levels, run_conversion
+from map_tiler_planner import auto_levels, describe_estimate
+from map_tiler_log import LogSpool
+from map_tiler_progress import format_duration
+from map_tiler_tuning import profile_names
+from map_tiler_jobs import Job, JobScheduler, run_job, QUEUED, RUNNING, DONE, FAILED
+
+# Output console: batches are drained from the log spool every OUTPUT_POLL_INTERVAL_MS and
+# only the last OUTPUT_MAX_LINES lines are kept on screen.
+OUTPUT_POLL_INTERVAL_MS = 100
+OUTPUT_MAX_LINES = 2000
+# Preferred window size; the height is capped to the screen.
+WINDOW_WIDTH = 750
+WINDOW_HEIGHT = 1000
+
 
 class MapTilerApp:
     def __init__(self, master):
         self.master = master
         master.title("GDAL Map Converter")
-        master.geometry("750x800") 
-        master.resizable(False, False)
+        # Sized to the screen; the options scroll and the log pane can be resized.
+        master.geometry(f"{WINDOW_WIDTH}x{min(WINDOW_HEIGHT, master.winfo_screenheight() - 80)}")
+        master.minsize(600, 450)
 
         s = ttk.Style()
         s.theme_use('clam') 
@@ -33,17 +49,29 @@ class MapTilerApp:
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
 
         self.input_file_path = "" # Will store the actual selected file path
+        self.input_mosaic_files = [] # Sheets of a virtual mosaic (input_file_path is then their folder)
         
         # --- FIXED: Initialize output_base_dir_var to an empty string ---
         self.output_base_dir_var = tk.StringVar(master, value="") 
         self.conversion_type_var = tk.StringVar(master, value="tiles")
 
-        self.status_label = ttk.Label(master, text="Initializing GUI...", foreground="blue", font=self.status_font_config)
-        self.output_text = scrolledtext.ScrolledText(master, wrap=tk.WORD, height=15, width=70, state="disabled", font=self.output_font_config, background="#f0f0f0")
+        self.log_spool = LogSpool()
+
+        # Options on top (scrollable), buttons, progress and the log below; the split can be dragged.
+        panes = ttk.PanedWindow(master, orient="vertical")
+        panes.pack(fill="both", expand=True)
+        options_area = ttk.Frame(panes)
+        run_area = ttk.Frame(panes)
+        panes.add(options_area, weight=3)
+        panes.add(run_area, weight=2)
+        form = self.build_scroll_area(options_area)
+
+        self.status_label = ttk.Label(run_area, text="Initializing GUI...", foreground="blue", font=self.status_font_config)
+        self.output_text = scrolledtext.ScrolledText(run_area, wrap=tk.WORD, height=8, width=70, state="disabled", font=self.output_font_config, background="#f0f0f0")
 
 
         # --- Top Frame - Input File Selection ---
-        self.input_frame = ttk.LabelFrame(master, text="Input Map File", padding=(10, 10, 10, 10)) 
+        self.input_frame = ttk.LabelFrame(form, text="Input Map File", padding=(10, 10, 10, 10)) 
         self.input_frame.pack(pady=10, padx=15, fill="x") 
 
         tk.Label(self.input_frame, text="Please select a map file (GeoTIFF, JPG, PNG etc.):", font=('Helvetica', 10)).pack(pady=5)
@@ -56,10 +84,15 @@ class MapTilerApp:
         self.set_input_file_display("No file selected", is_file=False) # Changed initial hint
 
 
-        ttk.Button(self.input_frame, text="Select Map File...", command=self.browse_input_file, style='Accent.TButton').pack(pady=5) 
+        input_buttons_frame = ttk.Frame(self.input_frame)
+        input_buttons_frame.pack(pady=5)
+        ttk.Button(input_buttons_frame, text="Select Map File...", command=self.browse_input_file, style='Accent.TButton').pack(side="left", padx=5)
+        # Several sheets, or a folder of them, are read as one virtual mosaic (no merged copy).
+        ttk.Button(input_buttons_frame, text="Select Sheets (Mosaic)...", command=self.browse_mosaic_files).pack(side="left", padx=5)
+        ttk.Button(input_buttons_frame, text="Select Sheet Folder...", command=self.browse_mosaic_dir).pack(side="left", padx=5)
 
         # --- Conversion Type Selection ---
-        self.conversion_type_frame = ttk.LabelFrame(master, text="Conversion Type", padding=(10, 10, 10, 10))
+        self.conversion_type_frame = ttk.LabelFrame(form, text="Conversion Type", padding=(10, 10, 10, 10))
         self.conversion_type_frame.pack(pady=10, padx=15, fill="x")
 
         self.tiles_radio = ttk.Radiobutton(self.conversion_type_frame, text="Generate Web Map Tiles (Creates new folder with tiles)", variable=self.conversion_type_var, value="tiles", command=self.toggle_options_visibility)
@@ -75,7 +108,7 @@ class MapTilerApp:
 
         
         # --- Output Directory Selection ---
-        self.output_frame = ttk.LabelFrame(master, text="Base Output Directory", padding=(10, 10, 10, 10)) 
+        self.output_frame = ttk.LabelFrame(form, text="Base Output Directory", padding=(10, 10, 10, 10)) 
         self.output_frame.pack(pady=10, padx=15, fill="x")
 
         tk.Label(self.output_frame, text="Select a base directory to save the output:", font=('Helvetica', 10)).pack(pady=5)
@@ -91,7 +124,7 @@ class MapTilerApp:
         ttk.Button(self.output_frame, text="Select Base Output Directory...", command=self.browse_output_dir, style='Accent.TButton').pack(pady=5)
 
         # --- Options Frame - Conversion Options ---
-        self.options_frame = ttk.LabelFrame(master, text="Conversion Options", padding=(10, 10, 10, 10))
+        self.options_frame = ttk.LabelFrame(form, text="Conversion Options", padding=(10, 10, 10, 10))
         self.options_frame.pack(pady=10, padx=15, fill="x")
 
         levels_inner_frame = ttk.Frame(self.options_frame)
@@ -101,47 +134,331 @@ class MapTilerApp:
         self.zoom_level_var = tk.StringVar(master, value="0-16")
         self.levels_entry = ttk.Entry(levels_inner_frame, textvariable=self.zoom_level_var, width=20) 
         self.levels_entry.pack(side="left", padx=5, expand=True, fill="x")
+        # Levels proposed from the input's size (native max zoom, overviews down to a thumbnail)
+        # with the estimated output; the field is only refilled while it holds a proposal.
+        self.level_plan = None
+        self.level_plan_file = None
+        self.auto_filled_levels = set(DEFAULT_LEVELS.values())
+        self.level_estimate_label = ttk.Label(self.options_frame, text="", foreground="gray")
+        self.level_estimate_label.pack(fill="x", padx=5)
+        self.zoom_level_var.trace_add("write", lambda *args: self.update_level_estimate())
 
         resampling_inner_frame = ttk.Frame(self.options_frame)
         resampling_inner_frame.pack(fill="x", pady=5)
         ttk.Label(resampling_inner_frame, text="Resampling Method:").pack(side="left", padx=5)
-        self.resampling_method_var = tk.StringVar(master, value="average")
-        self.resampling_options = ["average", "nearest", "bilinear", "lanczos", "cubic", "cubicspline"] 
-        self.resampling_menu = ttk.OptionMenu(resampling_inner_frame, self.resampling_method_var, self.resampling_options[0], *self.resampling_options)
+        # Like the levels, the method follows the conversion type until the user picks one.
+        self.auto_resampling = DEFAULT_RESAMPLING["tiles"]
+        self.resampling_method_var = tk.StringVar(master, value=self.auto_resampling)
+        self.resampling_options = RESAMPLING_METHODS
+        self.resampling_menu = ttk.OptionMenu(resampling_inner_frame, self.resampling_method_var, self.auto_resampling, *self.resampling_options)
         self.resampling_menu.pack(side="left", padx=5, expand=True, fill="x")
 
+        processes_inner_frame = ttk.Frame(self.options_frame)
+        processes_inner_frame.pack(fill="x", pady=5)
+        ttk.Label(processes_inner_frame, text="Worker Processes (tiles):").pack(side="left", padx=5)
+        self.processes_var = tk.StringVar(master, value=str(os.cpu_count() or 1))
+        self.processes_entry = ttk.Entry(processes_inner_frame, textvariable=self.processes_var, width=20)
+        self.processes_entry.pack(side="left", padx=5, expand=True, fill="x")
+        self.resume_var = tk.BooleanVar(master, value=False)
+        self.resume_check = ttk.Checkbutton(processes_inner_frame, text="Resumable (built-in renderer)", variable=self.resume_var)
+        self.resume_check.pack(side="left", padx=5)
+
+        tile_output_inner_frame = ttk.Frame(self.options_frame)
+        tile_output_inner_frame.pack(fill="x", pady=5)
+        ttk.Label(tile_output_inner_frame, text="Tile Output:").pack(side="left", padx=5)
+        self.tile_output_labels = {"directory": "Folder of PNG files (z/x/y)", "mbtiles": "Single MBTiles file"}
+        self.tile_output_var = tk.StringVar(master, value=self.tile_output_labels["directory"])
+        self.tile_output_menu = ttk.OptionMenu(tile_output_inner_frame, self.tile_output_var, self.tile_output_labels["directory"], *self.tile_output_labels.values())
+        self.tile_output_menu.pack(side="left", padx=5, expand=True, fill="x")
+        ttk.Label(tile_output_inner_frame, text="Uniform Tiles:").pack(side="left", padx=5)
+        self.uniform_tiles_labels = {"write": "Write each", "link": "Share one file", "skip": "Share, skip empty"}
+        self.uniform_tiles_var = tk.StringVar(master, value=self.uniform_tiles_labels["write"])
+        self.uniform_tiles_menu = ttk.OptionMenu(tile_output_inner_frame, self.uniform_tiles_var, self.uniform_tiles_labels["write"], *self.uniform_tiles_labels.values())
+        self.uniform_tiles_menu.pack(side="left", padx=5, expand=True, fill="x")
+
+        # Tile image format; JPEG and WebP take a quality (1-100).
+        tile_format_inner_frame = ttk.Frame(self.options_frame)
+        tile_format_inner_frame.pack(fill="x", pady=5)
+        ttk.Label(tile_format_inner_frame, text="Tile Format:").pack(side="left", padx=5)
+        self.tile_format_labels = {"png": "PNG", "jpeg": "JPEG (no transparency)", "webp": "WebP", "webp-lossless": "WebP lossless"}
+        self.tile_format_var = tk.StringVar(master, value=self.tile_format_labels["png"])
+        self.tile_format_menu = ttk.OptionMenu(tile_format_inner_frame, self.tile_format_var, self.tile_format_labels["png"], *self.tile_format_labels.values(), command=lambda _: self.toggle_options_visibility())
+        self.tile_format_menu.pack(side="left", padx=5, expand=True, fill="x")
+        ttk.Label(tile_format_inner_frame, text="Quality:").pack(side="left", padx=5)
+        self.tile_quality_var = tk.StringVar(master, value="75")
+        self.tile_quality_spinbox = ttk.Spinbox(tile_format_inner_frame, from_=1, to=100, textvariable=self.tile_quality_var, width=5)
+        self.tile_quality_spinbox.pack(side="left", padx=5)
+
+        # Overview output: "copy" = gdal_translate copy + gdaladdo (two passes),
+        # "cog" = tiled, compressed Cloud Optimized GeoTIFF written in a single gdal_translate pass.
+        overview_mode_inner_frame = ttk.Frame(self.options_frame)
+        overview_mode_inner_frame.pack(fill="x", pady=5)
+        ttk.Label(overview_mode_inner_frame, text="Overview Output:").pack(side="left", padx=5)
+        self.overview_mode_labels = {"copy": "Copy + gdaladdo", "cog": "Cloud Optimized GeoTIFF (single pass)", "external": "External .ovr (no copy)"}
+        self.overview_mode_var = tk.StringVar(master, value=self.overview_mode_labels["copy"])
+        self.overview_mode_menu = ttk.OptionMenu(overview_mode_inner_frame, self.overview_mode_var, self.overview_mode_labels["copy"], *self.overview_mode_labels.values(), command=lambda _: self.toggle_options_visibility())
+        self.overview_mode_menu.pack(side="left", padx=5, expand=True, fill="x")
+
+        cog_inner_frame = ttk.Frame(self.options_frame)
+        cog_inner_frame.pack(fill="x", pady=5)
+        ttk.Label(cog_inner_frame, text="Compression:").pack(side="left", padx=5)
+        self.compression_var = tk.StringVar(master, value="DEFLATE")
+        self.compression_options = COMPRESSION_METHODS
+        self.compression_menu = ttk.OptionMenu(cog_inner_frame, self.compression_var, self.compression_options[0], *self.compression_options)
+        self.compression_menu.pack(side="left", padx=5, expand=True, fill="x")
+        ttk.Label(cog_inner_frame, text="Block Size:").pack(side="left", padx=5)
+        self.block_size_var = tk.StringVar(master, value="512")
+        self.block_size_options = ["256", "512", "1024"]
+        self.block_size_menu = ttk.OptionMenu(cog_inner_frame, self.block_size_var, "512", *self.block_size_options)
+        self.block_size_menu.pack(side="left", padx=5, expand=True, fill="x")
+
+        # SRTMHGT: one .hgt per 1x1 degree cell for DTMs larger than a single cell.
+        srtm_inner_frame = ttk.Frame(self.options_frame)
+        srtm_inner_frame.pack(fill="x", pady=5)
+        self.srtm_split_var = tk.BooleanVar(master, value=False)
+        self.srtm_split_check = ttk.Checkbutton(srtm_inner_frame, text="Split into 1x1 degree .hgt cells", variable=self.srtm_split_var, command=self.toggle_options_visibility)
+        self.srtm_split_check.pack(side="left", padx=5)
+        ttk.Label(srtm_inner_frame, text="Cell Grid:").pack(side="left", padx=5)
+        # None keeps the input's grid when it is 1201x1201 or 3601x3601 (3 arc-seconds otherwise).
+        self.srtm_resolution_labels = {None: "Input grid (else 1201)", 3: "3 arc-second (1201)", 1: "1 arc-second (3601)"}
+        self.srtm_resolution_var = tk.StringVar(master, value=self.srtm_resolution_labels[None])
+        self.srtm_resolution_menu = ttk.OptionMenu(srtm_inner_frame, self.srtm_resolution_var, self.srtm_resolution_labels[None], *self.srtm_resolution_labels.values())
+        self.srtm_resolution_menu.pack(side="left", padx=5, expand=True, fill="x")
+        self.srtm_fill_voids_var = tk.BooleanVar(master, value=False)
+        self.srtm_fill_voids_check = ttk.Checkbutton(srtm_inner_frame, text="Fill voids", variable=self.srtm_fill_voids_var)
+        self.srtm_fill_voids_check.pack(side="left", padx=5)
+
+        # GDAL cache, threads and creation options: chosen automatically, GDAL defaults, or a saved profile.
+        tuning_inner_frame = ttk.Frame(self.options_frame)
+        tuning_inner_frame.pack(fill="x", pady=5)
+        ttk.Label(tuning_inner_frame, text="GDAL Tuning:").pack(side="left", padx=5)
+        self.tuning_var = tk.StringVar(master, value="auto")
+        self.tuning_options = profile_names()
+        self.tuning_menu = ttk.OptionMenu(tuning_inner_frame, self.tuning_var, "auto", *self.tuning_options)
+        self.tuning_menu.pack(side="left", padx=5, expand=True, fill="x")
+        # gdal_translate/gdaladdo as bundled tools, or through the GDAL Python bindings in warm worker processes.
+        ttk.Label(tuning_inner_frame, text="Run GDAL:").pack(side="left", padx=5)
+        self.backend_labels = {"subprocess": "Bundled tools", "inprocess": "In-process (Python bindings)"}
+        self.backend_var = tk.StringVar(master, value=self.backend_labels["subprocess"])
+        self.backend_menu = ttk.OptionMenu(tuning_inner_frame, self.backend_var, self.backend_labels["subprocess"], *self.backend_labels.values())
+        self.backend_menu.pack(side="left", padx=5, expand=True, fill="x")
+        # Link the output of an identical earlier run instead of converting again.
+        cache_inner_frame = ttk.Frame(self.options_frame)
+        cache_inner_frame.pack(fill="x", pady=5)
+        ttk.Label(cache_inner_frame, text="Result Cache:").pack(side="left", padx=5)
+        self.cache_labels = {"off": "Off", "on": "Reuse identical runs", "verify": "Reuse after full input check"}
+        self.cache_var = tk.StringVar(master, value=self.cache_labels["off"])
+        self.cache_menu = ttk.OptionMenu(cache_inner_frame, self.cache_var, self.cache_labels["off"], *self.cache_labels.values())
+        self.cache_menu.pack(side="left", padx=5, expand=True, fill="x")
+
 
         # --- Conversion Button ---
-        self.convert_button = ttk.Button(master, text="Start Conversion", command=self.start_conversion, style='Accent.TButton', width=20)
-        self.convert_button.pack(pady=15)
+        buttons_frame = ttk.Frame(run_area)
+        buttons_frame.pack(pady=10)
+        self.convert_button = ttk.Button(buttons_frame, text="Start Conversion", command=self.start_conversion, style='Accent.TButton', width=20)
+        self.convert_button.pack(side="left", padx=5)
+
+        self.batch_window = None
+        ttk.Button(buttons_frame, text="Batch Queue...", command=self.open_batch_window, width=20).pack(side="left", padx=5)
 
         # --- Output Area for Status (packed at the bottom) ---
         self.status_label.pack(pady=5) 
+        self.progress_var = tk.DoubleVar(value=0.0)
+        self.progress_bar = ttk.Progressbar(run_area, variable=self.progress_var, maximum=100.0, length=500)
+        self.progress_bar.pack(pady=2, padx=15, fill="x")
+        self.progress_label = ttk.Label(run_area, text="")
+        self.progress_label.pack()
+        # Latest (fraction, eta, stage) from the conversion thread; applied by poll_output_text.
+        self.progress_state = None
         self.output_text.pack(pady=5, padx=15, fill="both", expand=True) 
 
         self.toggle_options_visibility()
         self.status_label.config(text="Ready. Please select an input file.")
+        self.poll_output_text()
+
+    def build_scroll_area(self, parent):
+        # A frame inside a canvas with a vertical scrollbar; returns the frame to fill.
+        canvas = tk.Canvas(parent, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(parent, orient="vertical", command=canvas.yview)
+        canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        canvas.pack(side="left", fill="both", expand=True)
+        form = ttk.Frame(canvas)
+        form_window = canvas.create_window((0, 0), window=form, anchor="nw")
+        form.bind("<Configure>", lambda event: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.bind("<Configure>", lambda event: canvas.itemconfigure(form_window, width=event.width))
+
+        # The wheel scrolls the options only while the pointer is over them (the log scrolls itself).
+        def scroll(event):
+            if not str(event.widget).startswith(str(canvas)):
+                return
+            canvas.yview_scroll(-1 if event.num == 4 or event.delta > 0 else 1, "units")
 
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            canvas.bind_all(sequence, scroll, add="+")
+        return form
 
     def toggle_options_visibility(self):
         conversion_type = self.conversion_type_var.get()
         print(f"[DEBUG] toggle_options_visibility called for conversion_type = {conversion_type}")
+        self.fill_resampling(conversion_type)
         if conversion_type == "tiles":
             self.levels_label.config(text="Zoom Levels (e.g.: 0-16):")
             self.levels_entry.config(state="normal")
             self.resampling_menu.config(state="normal")
-            if not self.zoom_level_var.get() or self.zoom_level_var.get() == "2 4 8 16":
-                self.zoom_level_var.set("0-16")
+            self.processes_entry.config(state="normal")
+            self.resume_check.config(state="normal")
+            self.tile_output_menu.config(state="normal")
+            self.uniform_tiles_menu.config(state="normal")
+            self.tile_format_menu.config(state="normal")
+            self.tile_quality_spinbox.config(state="normal" if self.get_tile_format() in ("jpeg", "webp") else "disabled")
+            self.overview_mode_menu.config(state="disabled")
+            self.compression_menu.config(state="disabled")
+            self.block_size_menu.config(state="disabled")
+            self.srtm_split_check.config(state="disabled")
+            self.srtm_resolution_menu.config(state="disabled")
+            self.srtm_fill_voids_check.config(state="disabled")
+            self.fill_levels("tiles")
         elif conversion_type == "overviews":
             self.levels_label.config(text="Overview Levels (e.g.: 2 4 8 16):")
             self.levels_entry.config(state="normal")
             self.resampling_menu.config(state="normal")
-            if not self.zoom_level_var.get() or self.zoom_level_var.get() == "0-16":
-                self.zoom_level_var.set("2 4 8 16")
+            self.processes_entry.config(state="disabled")
+            self.resume_check.config(state="disabled")
+            self.tile_output_menu.config(state="disabled")
+            self.uniform_tiles_menu.config(state="disabled")
+            self.tile_format_menu.config(state="disabled")
+            self.tile_quality_spinbox.config(state="disabled")
+            self.overview_mode_menu.config(state="normal")
+            cog_state = "normal" if self.get_overview_mode() in ("cog", "external") else "disabled"
+            self.compression_menu.config(state=cog_state)
+            self.block_size_menu.config(state=cog_state)
+            self.srtm_split_check.config(state="disabled")
+            self.srtm_resolution_menu.config(state="disabled")
+            self.srtm_fill_voids_check.config(state="disabled")
+            self.fill_levels("overviews")
         else:  # srtmhgt
             self.levels_label.config(text="(No zoom levels for SRTMHGT)")
             self.levels_entry.config(state="disabled")
-            self.resampling_menu.config(state="disabled")
+            # Cells not already on the SRTM grid are warped onto it; only a split uses worker processes.
+            split_state = "normal" if self.srtm_split_var.get() else "disabled"
+            self.resampling_menu.config(state="normal")
+            self.processes_entry.config(state=split_state)
+            self.resume_check.config(state="disabled")
+            self.tile_output_menu.config(state="disabled")
+            self.uniform_tiles_menu.config(state="disabled")
+            self.tile_format_menu.config(state="disabled")
+            self.tile_quality_spinbox.config(state="disabled")
+            self.overview_mode_menu.config(state="disabled")
+            self.compression_menu.config(state="disabled")
+            self.block_size_menu.config(state="disabled")
+            self.srtm_split_check.config(state="normal")
+            self.srtm_resolution_menu.config(state="normal")
+            self.srtm_fill_voids_check.config(state="normal")
+        self.update_level_estimate()
+
+    def fill_levels(self, conversion_type):
+        current = self.zoom_level_var.get()
+        if current and current not in self.auto_filled_levels:
+            return  # entered by the user
+        levels = auto_levels(self.level_plan, conversion_type) if self.level_plan else DEFAULT_LEVELS[conversion_type]
+        self.auto_filled_levels.add(levels)
+        self.zoom_level_var.set(levels)
+
+    def fill_resampling(self, conversion_type):
+        if self.resampling_method_var.get() != self.auto_resampling:
+            return  # chosen by the user
+        self.auto_resampling = DEFAULT_RESAMPLING[conversion_type]
+        self.resampling_method_var.set(self.auto_resampling)
+
+    def update_level_estimate(self):
+        conversion_type = self.conversion_type_var.get()
+        if self.level_plan is None or conversion_type not in ("tiles", "overviews"):
+            self.level_estimate_label.config(text="")
+            return
+        self.level_estimate_label.config(text=describe_estimate(self.level_plan, conversion_type, self.zoom_level_var.get(), self.get_tile_format(), self.get_overview_mode()))
+
+    def set_level_plan(self, input_file):
+        # Reads the input's size (gdalinfo, up to a minute on a slow share; cached) on a worker
+        # thread and refills the levels from it once it is known.
+        self.level_plan = None
+        self.level_plan_file = input_file
+        self.toggle_options_visibility()
+        if input_file:
+            self.level_estimate_label.config(text="Reading the input's size...")
+            threading.Thread(target=self.read_level_plan, args=(input_file,), daemon=True).start()
+
+    def read_level_plan(self, input_file):
+        plan = plan_levels(input_file)
+        self.master.after(0, self.apply_level_plan, input_file, plan)
+
+    def apply_level_plan(self, input_file, plan):
+        if input_file != self.level_plan_file:
+            return  # another input was selected in the meantime
+        self.level_plan = plan
+        self.toggle_options_visibility()
+
+    def get_overview_mode(self):
+        label = self.overview_mode_var.get()
+        return next((mode for mode, mode_label in self.overview_mode_labels.items() if mode_label == label), "copy")
+
+    def get_tile_output(self):
+        label = self.tile_output_var.get()
+        return next((output for output, output_label in self.tile_output_labels.items() if output_label == label), "directory")
+
+    def get_tile_format(self):
+        label = self.tile_format_var.get()
+        return next((tile_format for tile_format, format_label in self.tile_format_labels.items() if format_label == label), "png")
+
+    def get_uniform_tiles(self):
+        label = self.uniform_tiles_var.get()
+        return next((mode for mode, mode_label in self.uniform_tiles_labels.items() if mode_label == label), "write")
+
+    def get_srtm_resolution(self):
+        label = self.srtm_resolution_var.get()
+        return next((resolution for resolution, resolution_label in self.srtm_resolution_labels.items() if resolution_label == label), None)
+
+    def get_backend(self):
+        label = self.backend_var.get()
+        return next((backend for backend, backend_label in self.backend_labels.items() if backend_label == label), "subprocess")
+
+    def get_cache_mode(self):
+        label = self.cache_var.get()
+        return next((mode for mode, mode_label in self.cache_labels.items() if mode_label == label), "off")
+
+    def get_levels(self, input_files=None):
+        # The proposal for the selected file becomes "auto", so every batch file gets its own.
+        levels = self.zoom_level_var.get()
+        conversion_type = self.conversion_type_var.get()
+        if self.level_plan is not None and not input_files and conversion_type in ("tiles", "overviews") and levels == auto_levels(self.level_plan, conversion_type):
+            return AUTO_LEVELS
+        return levels
+
+    def get_conversion_spec(self, input_file, base_output_dir, input_files=None):
+        processes = self.processes_var.get().strip()
+        return ConversionSpec(
+            input_file=input_file,
+            input_files=input_files or None,
+            conversion_type=self.conversion_type_var.get(),
+            output_dir=base_output_dir,
+            levels=self.get_levels(input_files),
+            resampling=self.resampling_method_var.get(),
+            processes=int(processes) if processes.isdigit() else processes,
+            overview_mode=self.get_overview_mode(),
+            compression=self.compression_var.get(),
+            block_size=int(self.block_size_var.get()),
+            resume=self.resume_var.get(),
+            tile_output=self.get_tile_output(),
+            uniform_tiles=self.get_uniform_tiles(),
+            tile_format=self.get_tile_format(),
+            tile_quality=self.tile_quality_var.get().strip(),
+            srtm_split=self.srtm_split_var.get(),
+            srtm_resolution=self.get_srtm_resolution(),
+            srtm_fill_voids=self.srtm_fill_voids_var.get(),
+            tuning=self.tuning_var.get(),
+            backend=self.get_backend(),
+            cache=self.get_cache_mode(),
+        )
 
     def browse_input_file(self):
         initial_dir = None
@@ -161,6 +478,7 @@ class MapTilerApp:
                 return 
             
             self.set_input_file_display(file_path, is_file=True)
+            self.set_level_plan(file_path)
             
             # --- NEW: Set output directory to input file's directory ---
             input_file_directory = os.path.dirname(file_path)
@@ -172,6 +490,32 @@ class MapTilerApp:
             self.clear_output_text() 
 
 
+    def browse_mosaic_files(self):
+        file_paths = filedialog.askopenfilenames(
+            title="Select Map Sheets",
+            initialdir=self.script_dir,
+            filetypes=(("Map files", "*.tif;*.tiff;*.jpg;*.jpeg;*.png;*.jp2"), ("All files", "*.*"))
+        )
+        if file_paths:
+            file_paths = list(file_paths)
+            directory = os.path.commonpath([os.path.dirname(path) for path in file_paths])
+            self.set_mosaic_input(directory, file_paths, f"{len(file_paths)} sheets in {directory}")
+
+    def browse_mosaic_dir(self):
+        dir_path = filedialog.askdirectory(title="Select Folder of Map Sheets", initialdir=self.script_dir)
+        if dir_path:
+            self.set_mosaic_input(dir_path, [], f"All map files in {dir_path}")
+
+    def set_mosaic_input(self, directory, file_paths, display_text):
+        self.set_input_file_display(display_text, is_file=False)
+        self.input_file_path = directory
+        self.input_mosaic_files = file_paths
+        self.set_level_plan(None)
+        self.output_base_dir_var.set(directory)
+        self.set_output_dir_display(directory)
+        self.status_label.config(text=f"Mosaic input selected. Output directory set to: {os.path.basename(directory)}")
+        self.clear_output_text()
+
     def browse_output_dir(self):
         initial_dir = None
         # Prioritize the directory of the selected input file
@@ -197,6 +541,7 @@ class MapTilerApp:
     def set_input_file_display(self, path, is_file=False):
         self.input_path_entry.config(state="normal")
         self.input_path_entry.delete(0, tk.END)
+        self.input_mosaic_files = []
 
         if is_file:
             self.input_file_path = path
@@ -217,19 +562,49 @@ class MapTilerApp:
 
 
     def clear_output_text(self):
+        self.log_spool.clear()
         self.output_text.config(state="normal")
         self.output_text.delete(1.0, tk.END)
         self.output_text.config(state="disabled")
 
     def update_output_text(self, text):
-        self.output_text.config(state="normal")
-        self.output_text.insert(tk.END, text)
-        self.output_text.see(tk.END) 
-        self.output_text.config(state="disabled")
+        # Safe to call from any thread: the text is queued (and spilled to the log file)
+        # and shown by poll_output_text on the Tk main loop.
+        self.log_spool.write(text)
+
+    def poll_output_text(self):
+        text = self.log_spool.drain()
+        if text:
+            self.output_text.config(state="normal")
+            self.output_text.insert(tk.END, text)
+            # Keep only the last OUTPUT_MAX_LINES lines on screen; the full log is in the log file.
+            excess_lines = int(self.output_text.index("end-1c").split(".")[0]) - OUTPUT_MAX_LINES
+            if excess_lines > 0:
+                self.output_text.delete("1.0", f"{excess_lines + 1}.0")
+            self.output_text.see(tk.END) 
+            self.output_text.config(state="disabled")
+        progress_state, self.progress_state = self.progress_state, None
+        if progress_state is not None:
+            fraction, eta, stage_name, elapsed = progress_state
+            self.progress_var.set(fraction * 100.0)
+            stage_text = f" - {stage_name}" if stage_name else ""
+            self.progress_label.config(text=f"{fraction:.0%}{stage_text} - elapsed {format_duration(elapsed)}, remaining {format_duration(eta)}")
+        self.master.after(OUTPUT_POLL_INTERVAL_MS, self.poll_output_text)
+
+    def update_progress(self, tracker):
+        # Called from the conversion thread; only the latest snapshot is kept.
+        self.progress_state = (tracker.fraction, tracker.eta, tracker.stage_name, tracker.elapsed)
+
+    def open_log_file(self, log_path):
+        try:
+            self.log_spool.open(log_path)
+            self.update_output_text(f"Full log: {log_path}\n")
+        except OSError as e:
+            self.update_output_text(f"Could not create log file {log_path}: {e}\n")
 
     def start_conversion(self):
         if not self.input_file_path or not os.path.exists(self.input_file_path):
-            messagebox.showerror("Error", "Please select a valid input map file first.")
+            messagebox.showerror("Error", "Please select a valid input map file (or mosaic sheets) first.")
             return
         
         chosen_base_output_dir = self.output_base_dir_var.get()
@@ -239,190 +614,177 @@ class MapTilerApp:
             messagebox.showerror("Error", "Please select a valid base output directory.")
             return
         
-        input_file_base_name = os.path.splitext(os.path.basename(self.input_file_path))[0]
-        
-        conversion_type = self.conversion_type_var.get()
+        spec = self.get_conversion_spec(self.input_file_path, chosen_base_output_dir, self.input_mosaic_files)
 
-        print(f"[DEBUG] start_conversion triggered. Selected conversion_type: {conversion_type}")
-        
-        if conversion_type == "tiles":
-            actual_output_dir = os.path.join(chosen_base_output_dir, f"{input_file_base_name}_tiles")
-            if not os.path.exists(actual_output_dir):
-                try:
-                    os.makedirs(actual_output_dir)
-                    self.update_output_text(f"Created output directory: {actual_output_dir}\n")
-                except Exception as e:
-                    messagebox.showerror("Error", f"Could not create output directory for tiles: {actual_output_dir}\nError: {e}")
-                    return
-        elif conversion_type == "overviews":
-            print("[INFO] Using existing output directory for internal overviews...")
-            actual_output_dir = chosen_base_output_dir
-
-        elif conversion_type == "srtmhgt":
-            print("[INFO] Using existing output directory for SRTMHGT conversion...")
-            actual_output_dir = chosen_base_output_dir
+        print(f"[DEBUG] start_conversion triggered. Selected conversion_type: {spec.conversion_type}")
 
-        else:
-            messagebox.showerror("Error", f"Unsupported conversion type: {conversion_type}")
+        # Only the option values are checked here; planning reads the input (gdalinfo, up to a
+        # minute on a slow share), so it runs on the conversion thread and reports to the log.
+        try:
+            check_options(spec)
+        except ConversionError as e:
+            messagebox.showerror("Error", str(e))
             return
 
         self.clear_output_text()
+        input_base_name = os.path.splitext(os.path.basename(spec.input_file))[0]
+        self.open_log_file(os.path.join(chosen_base_output_dir, f"{input_base_name}_{spec.conversion_type}.log"))
         self.status_label.config(text="Starting conversion...", foreground="orange")
+        self.progress_var.set(0.0)
+        self.progress_label.config(text="")
         self.convert_button.config(state="disabled") 
 
-        self.conversion_thread = threading.Thread(target=self.run_gdal_command, args=(conversion_type, actual_output_dir,))
+        self.conversion_thread = threading.Thread(target=self.run_gdal_command, args=(spec,))
         self.conversion_thread.start()
 
-    def run_gdal_command(self, conversion_type, actual_output_dir): 
-        print(f"[DEBUG] run_gdal_command executing. Type: {conversion_type}, Output: {actual_output_dir}")
-        input_file = self.input_file_path
-        resampling_method = self.resampling_method_var.get()
-        levels_input = self.zoom_level_var.get()
-
-        command = []
-        final_output_display_path = "" 
-
-        script_dir = os.path.dirname(__file__)
-        
-        gdal2tiles_exe_path = os.path.join(script_dir, "bin", "gdal2tiles.exe") 
-        gdaladdo_exe_path = os.path.join(script_dir, "bin", "gdaladdo.exe") 
-        gdal_translate_exe_path = os.path.join(script_dir, "bin", "gdal_translate.exe")
-
-        gdal_data_path = os.path.join(script_dir, "bin", "gdal-data") 
-        
-        env = os.environ.copy()
-        env['GDAL_DATA'] = gdal_data_path
-
-        if conversion_type == "tiles":
-            print("[INFO] Running gdal2tiles command...")
-            command = [
-                gdal2tiles_exe_path,
-                '-p', 'raster',
-                '-z', levels_input, 
-                f'--resampling={resampling_method}',
-                input_file,
-                actual_output_dir 
-            ]
-            final_output_display_path = actual_output_dir 
-
-        elif conversion_type == "overviews":
-            print("[INFO] Running gdaladdo command for internal overviews...")
-            if not input_file.lower().endswith(('.tif', '.tiff')):
-                self.update_output_text("Error: For overviews, the input file MUST be a GeoTIFF (.tif/.tiff).\n")
-                messagebox.showerror("Error", "For 'Add Internal Overviews', the input file MUST be a GeoTIFF (.tif/.tiff).")
-                self.status_label.config(text="Conversion failed.", foreground="red")
-                self.convert_button.config(state="normal")
-                return
-
-            levels_list = levels_input.split()
-            if not all(part.isdigit() for part in levels_list):
-                self.update_output_text("Error: For overviews, 'Levels' must be space-separated integers (e.g., '2 4 8 16').\n")
-                messagebox.showerror("Error", "For 'Add Internal Overviews', 'Levels' must be space-separated integers (e.g., '2 4 8 16').")
-                self.status_label.config(text="Conversion failed.", foreground="red")
-                self.convert_button.config(state="normal")
-                return
-
-            base_name = os.path.splitext(os.path.basename(input_file))[0]
-            output_geotiff_name = f"{base_name}_with_overviews.tif"
-            output_geotiff_path = os.path.join(actual_output_dir, output_geotiff_name) 
-            final_output_display_path = output_geotiff_path
-
-            self.update_output_text(f"Copying GeoTIFF to: {output_geotiff_path}\n")
-            translate_command = [
-                gdal_translate_exe_path,
-                input_file,
-                output_geotiff_path
-            ]
-            
-            try:
-                process_translate = subprocess.Popen(translate_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True, shell=True, env=env)
-                for line in process_translate.stdout:
-                    self.update_output_text(line)
-                process_translate.wait()
-
-                if process_translate.returncode != 0:
-                    self.status_label.config(text=f"Error copying GeoTIFF. Exit code: {process_translate.returncode}", foreground="red")
-                    messagebox.showerror("Error", f"Error copying GeoTIFF. Check output.\nExit code: {process_translate.returncode}")
-                    self.convert_button.config(state="normal")
-                    return
-
-                self.update_output_text(f"GeoTIFF copied successfully.\n")
-
-            except FileNotFoundError:
-                self.status_label.config(text=f"Error: gdal_translate.exe not found at ({gdal_translate_exe_path}).", foreground="red")
-                messagebox.showerror("Error", f"gdal_translate.exe not found. Ensure the full path is correct.")
-                self.convert_button.config(state="normal")
-                return
-            except Exception as e:
-                self.status_label.config(text=f"An error occurred during copying: {e}", foreground="red")
-                messagebox.showerror("Error", f"An unexpected error occurred during copying: {e}")
-                self.convert_button.config(state="normal")
-                return
-            
-            self.update_output_text(f"Adding overviews to: {output_geotiff_path}\n")
-            command = [
-                gdaladdo_exe_path,
-                '-r', resampling_method,
-                output_geotiff_path, 
-                *levels_list 
-            ]
-
-        elif conversion_type == "srtmhgt":
-            print("[INFO] Running gdal_translate command for SRTMHGT conversion...")
-            base_name = os.path.splitext(os.path.basename(input_file))[0]
-            output_file_name = base_name + ".hgt"
-            output_file_path = os.path.join(actual_output_dir, output_file_name)
-            final_output_display_path = output_file_path
-
-            command = [
-                gdal_translate_exe_path,
-                "-of", "SRTMHGT",
-                input_file,
-                output_file_path
-            ]
-            
-        self.update_output_text(f"Running command:\n{' '.join(command)}\n\n")
-
+    def run_gdal_command(self, spec): 
+        print(f"[DEBUG] run_gdal_command executing. Type: {spec.conversion_type}, Input: {spec.input_file}")
         try:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True, shell=True, env=env)
-            
-            for line in process.stdout:
-                self.update_output_text(line)
-            process.wait() 
-
-            for line in process.stdout:
-                cleaned_line = line.strip() # Remove leading/trailing whitespace, including newline
-                if cleaned_line: # Only print if there's actual content
-                    self.update_output_text(cleaned_line + "\n") # Add one newline explicitly
-
-            process.wait()
-
-            if process.returncode == 0:
-                success_message = ""
-                if conversion_type == "tiles":
-                    success_message = f"Conversion completed successfully! Tiles created in:\n{final_output_display_path}"
-                else: # overviews
-                    success_message = f"Internal overviews added successfully to new GeoTIFF:\n{final_output_display_path}"
-                
-                # Now the success message should appear as intended
-                self.status_label.config(text=success_message, foreground="green")
-                messagebox.showinfo("Success", success_message)
-            else:
-                self.status_label.config(text=f"Error in conversion. Exit code: {process.returncode}", foreground="red")
-                messagebox.showerror("Error", f"Error in conversion. Check output.\nExit code: {process.returncode}")
-
-        except FileNotFoundError:
-            exe_name = "gdal2tiles.exe" if conversion_type == "tiles" else "gdaladdo.exe"
-            error_msg = f"Error: {exe_name} not found at the specified path. Ensure the executable exists and the path is correct."
-            self.status_label.config(text=error_msg, foreground="red")
-            messagebox.showerror("Error", error_msg)
+            result = run_conversion(spec, log=self.update_output_text, progress=self.update_progress)
+            self.master.after(0, self.finish_conversion, result.success, result.message)
+
+        except ConversionError as e:
+            self.update_output_text(f"Error: {e}\n")
+            self.master.after(0, self.finish_conversion, False, str(e))
         except Exception as e:
-            self.status_label.config(text=f"An unexpected error occurred: {e}", foreground="red")
-            messagebox.showerror("General Error", f"An unexpected error occurred: {e}")
+            self.master.after(0, self.finish_conversion, False, f"An unexpected error occurred: {e}", "General Error")
         finally:
-            self.master.after(0, lambda: self.convert_button.config(state="normal"))
+            self.log_spool.flush()
             print("[INFO] Conversion thread completed.")
 
+    def finish_conversion(self, success, message, error_title="Error"):
+        # Runs on the Tk main loop once the conversion thread is done.
+        if success:
+            self.status_label.config(text=message, foreground="green")
+            messagebox.showinfo("Success", message)
+        else:
+            self.status_label.config(text=message, foreground="red")
+            messagebox.showerror(error_title, f"{message}\nCheck output.")
+        self.convert_button.config(state="normal")
+
+    # --- Batch Queue ---
+    def open_batch_window(self):
+        if self.batch_window is None or not self.batch_window.winfo_exists():
+            self.batch_window = BatchQueueWindow(self)
+        self.batch_window.lift()
+
+    def create_batch_job(self, input_file):
+        # Snapshot the current options so later edits in the main window do not affect queued jobs.
+        base_output_dir = self.output_base_dir_var.get()
+        if not base_output_dir or not os.path.isdir(base_output_dir):
+            base_output_dir = os.path.dirname(input_file)
+        return Job(self.get_conversion_spec(input_file, base_output_dir))
+
+    def run_batch_job(self, job):
+        # Scheduler runner: log each job's tool output to the console, prefixed with its file name.
+        name = os.path.basename(job.input_file)
+        return run_job(job, log=lambda text: self.update_output_text(f"[{name}] {text}"))
+
+
+class BatchQueueWindow(tk.Toplevel):
+    map_file_extensions = ('.tif', '.tiff', '.jpg', '.jpeg', '.png', '.jp2')
+
+    def __init__(self, app):
+        super().__init__(app.master)
+        self.app = app
+        self.title("Batch Conversion Queue")
+        self.geometry("750x450")
+
+        self.scheduler = None
+        self.max_jobs_var = tk.StringVar(self, value="2")
+
+        controls_frame = ttk.Frame(self, padding=(10, 10, 10, 0))
+        controls_frame.pack(fill="x")
+        ttk.Button(controls_frame, text="Add Files...", command=self.add_files).pack(side="left", padx=5)
+        ttk.Button(controls_frame, text="Add Directory...", command=self.add_directory).pack(side="left", padx=5)
+        ttk.Label(controls_frame, text="Concurrent Jobs:").pack(side="left", padx=5)
+        ttk.Entry(controls_frame, textvariable=self.max_jobs_var, width=5).pack(side="left", padx=5)
+        self.start_button = ttk.Button(controls_frame, text="Start Queue", command=self.start_queue, style='Accent.TButton')
+        self.start_button.pack(side="right", padx=5)
+
+        ttk.Label(self, text="New jobs use the conversion type and options currently selected in the main window.").pack(pady=5)
+
+        columns = ("file", "type", "state", "message")
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=14)
+        for column, heading, width in zip(columns, ("File", "Type", "State", "Details"), (220, 80, 80, 330)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor="w")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=5)
+
+        self.summary_label = ttk.Label(self, text="Queue is empty.", font=app.status_font_config)
+        self.summary_label.pack(pady=5)
+
+    def add_files(self):
+        file_paths = filedialog.askopenfilenames(
+            parent=self,
+            title="Select Map Files",
+            initialdir=self.app.script_dir,
+            filetypes=(("Map files", "*.tif;*.tiff;*.jpg;*.jpeg;*.png;*.jp2"), ("All files", "*.*"))
+        )
+        self.add_inputs(file_paths)
+
+    def add_directory(self):
+        dir_path = filedialog.askdirectory(parent=self, title="Select Directory of Map Files", initialdir=self.app.script_dir)
+        if not dir_path:
+            return
+        file_paths = []
+        for root_dir, _, file_names in os.walk(dir_path):
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith(self.map_file_extensions):
+                    file_paths.append(os.path.join(root_dir, file_name))
+        self.add_inputs(file_paths)
+
+    def add_inputs(self, file_paths):
+        skipped = 0
+        for file_path in file_paths:
+            if self.app.conversion_type_var.get() == "overviews" and not file_path.lower().endswith(('.tif', '.tiff')):
+                skipped += 1
+                continue
+            job = self.app.create_batch_job(file_path)
+            self.tree.insert("", tk.END, iid=str(job.job_id), values=(os.path.basename(file_path), job.conversion_type, job.state, ""))
+            self.get_scheduler().add(job)
+        if skipped:
+            messagebox.showwarning("Warning", f"Skipped {skipped} non-GeoTIFF file(s): 'Add Internal Overviews' requires .tif/.tiff input.", parent=self)
+        self.update_summary()
+
+    def get_scheduler(self):
+        if self.scheduler is None:
+            self.scheduler = JobScheduler(self.app.run_batch_job, on_change=self.on_job_change)
+        return self.scheduler
+
+    def start_queue(self):
+        max_jobs = self.max_jobs_var.get().strip()
+        if not max_jobs.isdigit() or int(max_jobs) < 1:
+            messagebox.showerror("Error", "'Concurrent Jobs' must be a positive integer.", parent=self)
+            return
+        scheduler = self.get_scheduler()
+        if scheduler.jobs:
+            log_dir = self.app.output_base_dir_var.get()
+            if not log_dir or not os.path.isdir(log_dir):
+                log_dir = os.path.dirname(scheduler.jobs[0].input_file)
+            self.app.open_log_file(os.path.join(log_dir, time.strftime("batch_%Y%m%d_%H%M%S.log")))
+        scheduler.max_jobs = int(max_jobs)
+        scheduler.start()
+        self.update_summary()
+
+    def on_job_change(self, job):
+        # Called from scheduler threads; hand the update over to the Tk main loop.
+        self.after(0, self.refresh_job, job)
+
+    def refresh_job(self, job):
+        if self.tree.exists(str(job.job_id)):
+            details = job.message
+            if job.started_at is not None:
+                details = f"{job.elapsed:.1f}s  {details}"
+            self.tree.item(str(job.job_id), values=(os.path.basename(job.input_file), job.conversion_type, job.state, details))
+        self.update_summary()
+
+    def update_summary(self):
+        if self.scheduler is None:
+            return
+        counts = self.scheduler.counts()
+        self.summary_label.config(text=f"Queued: {counts[QUEUED]}   Running: {counts[RUNNING]}   Done: {counts[DONE]}   Failed: {counts[FAILED]}")
+
 
 if __name__ == "__main__":
     root = tk.Tk()
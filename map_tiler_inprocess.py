@@ -0,0 +1,215 @@
+import importlib.util
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- In-process GDAL backend ---
+# Runs gdal_translate and gdaladdo stages through the GDAL Python bindings instead of
+# starting the command line tool for every stage. The work happens in a pool of worker
+# processes that stays up between jobs, so the interpreter start, driver registration and
+# projection database setup are paid once per worker instead of once per stage. A worker
+# crash cannot take the GUI down with it. Progress and GDAL messages come back through a
+# queue and are handed to the stage's log() and progress() callbacks.
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Seconds to wait for a task's last messages after its result has arrived.
+EVENT_FLUSH_TIMEOUT = 5.0
+# A progress event is only sent when the fraction has moved by at least this much.
+PROGRESS_STEP = 0.005
+
+LOG, PROGRESS, DONE, STARTED = "log", "progress", "done", "started"
+
+_pool = None
+_events = None
+_dispatcher = None
+_listeners = {}
+_lock = threading.Lock()
+_task_ids = itertools.count(1)
+
+
+class WorkerPoolError(RuntimeError):
+    # The warm pool died while running a task (e.g. a crash inside GDAL).
+    pass
+
+
+def bindings_available():
+    # Cheap check that does not import GDAL into the calling process.
+    return importlib.util.find_spec("osgeo") is not None
+
+
+# --- Worker side ---
+
+_worker_events = None
+
+
+def _init_worker(events):
+    global _worker_events
+    _worker_events = events
+    from osgeo import gdal, osr
+    gdal.UseExceptions()
+    gdal.AllRegister()
+    # Looking up a CRS opens the projection database, which a fresh tool process pays for
+    # on every run.
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+
+
+def _translate(source, destination, options, callback):
+    from osgeo import gdal
+    dataset = gdal.Translate(destination, source, options=gdal.TranslateOptions(options=list(options), callback=callback))
+    if dataset is None:
+        raise RuntimeError(f"gdal.Translate could not write {destination}")
+    dataset = None  # closing the dataset flushes it to disk
+
+
+def _build_overviews(path, resampling, levels, callback):
+    from osgeo import gdal
+    dataset = gdal.Open(path, gdal.GA_Update)
+    dataset.BuildOverviews(resampling.upper(), [int(level) for level in levels], callback=callback)
+    dataset = None
+
+
+OPERATIONS = {"translate": _translate, "addo": _build_overviews}
+
+
+def _run_task(task_id, operation, args, config):
+    # Runs one operation with the stage's GDAL configuration options.
+    # Returns (returncode, cpu_time, peak_rss).
+    from osgeo import gdal
+    # The worker runs nothing else until the task is done, so the caller can sample it.
+    _worker_events.put((task_id, STARTED, os.getpid()))
+    usage_before = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+    process_time_before = time.process_time()
+    last_sent = [-1.0]
+
+    def callback(complete, message, data):
+        if complete - last_sent[0] >= PROGRESS_STEP or complete >= 1.0:
+            last_sent[0] = complete
+            _worker_events.put((task_id, PROGRESS, complete))
+        return 1
+
+    def error_handler(error_class, error_number, message):
+        level = {gdal.CE_Warning: "Warning", gdal.CE_Failure: "ERROR", gdal.CE_Fatal: "FATAL"}.get(error_class)
+        if level is not None:
+            _worker_events.put((task_id, LOG, f"{level} {error_number}: {message}\n"))
+
+    saved_config = {key: gdal.GetConfigOption(key) for key in config}
+    for key, value in config.items():
+        gdal.SetConfigOption(key, str(value))
+    gdal.PushErrorHandler(error_handler)
+    returncode = 0
+    try:
+        OPERATIONS[operation](*args, callback=callback)
+    except Exception as e:
+        _worker_events.put((task_id, LOG, f"Error: {e}\n"))
+        returncode = 1
+    finally:
+        gdal.PopErrorHandler()
+        for key, value in saved_config.items():
+            gdal.SetConfigOption(key, value)
+        _worker_events.put((task_id, DONE, None))
+
+    if usage_before is not None:
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        cpu_time = usage_after.ru_utime + usage_after.ru_stime - usage_before.ru_utime - usage_before.ru_stime
+        # ru_maxrss is the worker's lifetime peak: an upper bound for the task.
+        peak_rss = usage_after.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    else:
+        cpu_time, peak_rss = time.process_time() - process_time_before, None
+    return returncode, cpu_time, peak_rss
+
+
+# --- Caller side ---
+
+def warm_pool(workers=DEFAULT_WORKERS):
+    # The shared worker pool, started on first use. "spawn" keeps the workers independent
+    # of the threads of the calling process (the GUI, the batch scheduler).
+    global _pool, _events, _dispatcher
+    with _lock:
+        if _pool is None:
+            context = multiprocessing.get_context("spawn")
+            _events = context.Queue()
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(_events,))
+            _dispatcher = threading.Thread(target=_dispatch_events, args=(_events,), daemon=True)
+            _dispatcher.start()
+        return _pool
+
+
+def shutdown_pool():
+    pool, events = _discard_pool()
+    if pool is not None:
+        pool.shutdown(wait=True)
+        events.put(None)
+        _dispatcher.join()
+
+
+def _discard_pool(expected=None):
+    # Forgets the current pool (only if it is still `expected`, when given); the next task
+    # starts a new one.
+    global _pool, _events
+    with _lock:
+        if _pool is None or (expected is not None and _pool is not expected):
+            return None, None
+        pool, events = _pool, _events
+        _pool, _events = None, None
+        return pool, events
+
+
+def _dispatch_events(events):
+    while True:
+        try:
+            event = events.get()
+        except (EOFError, OSError):  # the queue was closed at interpreter exit
+            return
+        if event is None:
+            return
+        task_id, kind, value = event
+        with _lock:
+            listener = _listeners.get(task_id)
+        if listener is None:
+            continue
+        log, progress, done, on_start = listener
+        if kind == LOG:
+            log(value)
+        elif kind == PROGRESS:
+            progress(value)
+        elif kind == STARTED:
+            if on_start is not None:
+                on_start(value)
+        else:
+            done.set()
+
+
+def run_operation(operation, args, config=None, log=print, progress=None, on_start=None):
+    # Runs operation on the warm pool and blocks until it finishes; on_start(pid) is called
+    # with the worker that picked it up. Returns (returncode, cpu_time, peak_rss); raises
+    # WorkerPoolError if the pool broke.
+    pool = warm_pool()
+    task_id = next(_task_ids)
+    done = threading.Event()
+    with _lock:
+        _listeners[task_id] = (log, progress or (lambda fraction: None), done, on_start)
+    try:
+        future = pool.submit(_run_task, task_id, operation, args, dict(config or {}))
+        try:
+            outcome = future.result()
+        except BrokenProcessPool as e:
+            _, events = _discard_pool(pool)
+            if events is not None:
+                events.put(None)
+            raise WorkerPoolError(f"The GDAL worker process stopped unexpectedly ({e}).")
+        done.wait(EVENT_FLUSH_TIMEOUT)
+        return outcome
+    finally:
+        with _lock:
+            _listeners.pop(task_id, None)
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+import itertools
+
+import map_tiler_engine as engine
+
+# --- Job states shown in the batch queue ---
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+    def __init__(self, spec, cpu_cost=None, io_bound=None):
+        self.job_id = next(_job_ids)
+        self.spec = spec
+        # cpu_cost is the number of cores the job keeps busy (e.g. gdal2tiles --processes).
+        # io_bound jobs (full GeoTIFF copies, SRTMHGT exports) mostly wait on the disk.
+        # Split SRTMHGT jobs warp their cells in a process pool, like tiles.
+        parallel = spec.conversion_type == "tiles" or spec.srtm_split
+        if cpu_cost is None:
+            cpu_cost = int(spec.processes) if parallel and str(spec.processes).isdigit() else 1
+        if io_bound is None:
+            io_bound = not parallel
+        self.cpu_cost = max(1, int(cpu_cost))
+        self.io_bound = io_bound
+        self.state = QUEUED
+        self.message = ""
+        self.output_path = ""
+        self.result = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def input_file(self):
+        return self.spec.input_file
+
+    @property
+    def conversion_type(self):
+        return self.spec.conversion_type
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobScheduler:
+    # Runs queued jobs on worker threads. A job only starts when it fits all three limits:
+    # the number of concurrent jobs, the CPU budget (sum of cpu_cost) and the number of
+    # disk-bound jobs. A job larger than the whole CPU budget still runs, but alone.
+    def __init__(self, runner=None, max_jobs=2, cpu_budget=None, io_slots=2, on_change=None):
+        self.runner = runner or run_job
+        self.max_jobs = max(1, int(max_jobs))
+        self.cpu_budget = max(1, int(cpu_budget or os.cpu_count() or 1))
+        self.io_slots = max(1, int(io_slots))
+        self.on_change = on_change
+
+        self.jobs = []
+        self._pending = []
+        self._running = []
+        self._condition = threading.Condition()
+        self._dispatcher = None
+        self._stopping = False
+
+    def add(self, job):
+        with self._condition:
+            self.jobs.append(job)
+            self._pending.append(job)
+            self._condition.notify_all()
+        self._notify(job)
+        return job
+
+    def start(self):
+        with self._condition:
+            if self._dispatcher is not None and self._dispatcher.is_alive():
+                return
+            self._stopping = False
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+            self._dispatcher.start()
+
+    def stop(self):
+        # Pending jobs stay queued; running jobs are allowed to finish.
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+    def wait(self):
+        with self._condition:
+            while self._pending or self._running:
+                self._condition.wait()
+
+    def counts(self):
+        with self._condition:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self.jobs:
+                counts[job.state] += 1
+            return counts
+
+    def _fits(self, job):
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_jobs:
+            return False
+        if sum(j.cpu_cost for j in self._running) + job.cpu_cost > self.cpu_budget:
+            return False
+        if job.io_bound and sum(1 for j in self._running if j.io_bound) >= self.io_slots:
+            return False
+        return True
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                job = None
+                while not self._stopping:
+                    job = next((j for j in self._pending if self._fits(j)), None)
+                    if job is not None:
+                        break
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                self._pending.remove(job)
+                self._running.append(job)
+                job.state = RUNNING
+                job.started_at = time.time()
+            self._notify(job)
+            threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _run_job(self, job):
+        try:
+            # The runner returns True on success and may set job.message / job.output_path.
+            job.state = DONE if self.runner(job) else FAILED
+        except Exception as e:
+            job.state = FAILED
+            job.message = str(e)
+        finally:
+            job.finished_at = time.time()
+            with self._condition:
+                self._running.remove(job)
+                self._condition.notify_all()
+            self._notify(job)
+
+    def _notify(self, job):
+        if self.on_change is not None:
+            self.on_change(job)
+
+
+def run_job(job, log=None, write_report=True):
+    # Default scheduler runner: runs the job's spec through the conversion engine.
+    try:
+        job.result = engine.run_conversion(job.spec, log=log, write_report=write_report)
+    except engine.ConversionError as e:
+        job.message = str(e)
+        return False
+    job.output_path = job.result.output_path
+    job.message = job.result.message.replace("\n", " ")
+    return job.result.success
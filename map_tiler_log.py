@@ -0,0 +1,87 @@
+import os
+import threading
+from collections import deque
+
+# Text held for the display at most; when a tool writes faster than the owner drains, the
+# oldest text is dropped from the display (the log file still gets everything).
+MAX_PENDING_CHARS = 1024 * 1024
+# Text handed out per drain(), so one poll never inserts more than the display can take.
+MAX_DRAIN_CHARS = 64 * 1024
+
+
+class LogSpool:
+    # Thread-safe sink for tool output. Any thread may write(); the owner (e.g. the Tk main
+    # loop) drains the queued text in batches on its own schedule, so a chatty GDAL tool
+    # never waits on the display. Everything written is also appended to a log file.
+    def __init__(self, max_pending_chars=MAX_PENDING_CHARS):
+        self._chunks = deque()
+        self._pending_chars = 0
+        self._max_pending_chars = max_pending_chars
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._file = None
+        self.log_path = ""
+        # Lines dropped from the display so far, and since the last drain.
+        self.dropped_lines = 0
+        self._dropped_since_drain = 0
+
+    def open(self, log_path):
+        # Starts spilling the full log to log_path (closing any previous log file).
+        self.close()
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        with self._file_lock:
+            self._file = open(log_path, "w", encoding="utf-8", errors="replace")
+            self.log_path = log_path
+
+    def close(self):
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def write(self, text):
+        with self._lock:
+            self._chunks.append(text)
+            self._pending_chars += len(text)
+            while self._pending_chars > self._max_pending_chars and len(self._chunks) > 1:
+                dropped = self._chunks.popleft()
+                self._pending_chars -= len(dropped)
+                lines = dropped.count("\n") or 1
+                self.dropped_lines += lines
+                self._dropped_since_drain += lines
+        with self._file_lock:
+            if self._file is not None:
+                self._file.write(text)
+
+    def flush(self):
+        with self._file_lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def clear(self):
+        # Discards the text not shown yet.
+        with self._lock:
+            self._chunks.clear()
+            self._pending_chars = 0
+            self._dropped_since_drain = 0
+
+    def drain(self, max_chars=MAX_DRAIN_CHARS):
+        # Returns the queued text (at most about max_chars of it) as one string, preceded by a
+        # note when lines were dropped since the last drain.
+        chunks = []
+        size = 0
+        with self._lock:
+            while self._chunks and size < max_chars:
+                chunk = self._chunks.popleft()
+                if size + len(chunk) > max_chars:
+                    # The rest of a long chunk waits for the next drain.
+                    chunk, rest = chunk[:max_chars - size], chunk[max_chars - size:]
+                    self._chunks.appendleft(rest)
+                chunks.append(chunk)
+                size += len(chunk)
+            self._pending_chars -= size
+            dropped, self._dropped_since_drain = self._dropped_since_drain, 0
+        if dropped:
+            log_hint = f"; the log file {self.log_path} has them" if self.log_path else ""
+            chunks.insert(0, f"[... {dropped} lines not shown{log_hint} ...]\n")
+        return "".join(chunks)
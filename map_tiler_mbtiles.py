@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import map_tiler_pyramid as pyramid
+
+# --- MBTiles container output ---
+# Writes the pyramid of the built-in renderer into one SQLite file instead of a z/x/y tree
+# of small PNGs. Tile images are stored once per distinct content (keyed by their hash) in
+# "images" and referenced from "map", so large uniform areas cost a single blob. The
+# standard "tiles" table of the MBTiles spec is a view over the two. Rows use the TMS
+# order (y=0 at the bottom), which is what MBTiles expects and what the renderer produces.
+
+# Tiles written per SQLite transaction.
+TILES_PER_TRANSACTION = 1000
+# Metadata row with the source fingerprint, levels, resampling and tile format the tiles were
+# rendered with (map_tiler_pyramid.pyramid_params); a resumed run must match it.
+PARAMS_METADATA_NAME = "map_tiler_params"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS images (tile_id TEXT PRIMARY KEY, tile_data BLOB);
+CREATE TABLE IF NOT EXISTS map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT);
+CREATE UNIQUE INDEX IF NOT EXISTS map_index ON map (zoom_level, tile_column, tile_row);
+CREATE INDEX IF NOT EXISTS map_tile_id ON map (tile_id);
+CREATE VIEW IF NOT EXISTS tiles AS
+    SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column, map.tile_row AS tile_row, images.tile_data AS tile_data
+    FROM map JOIN images ON images.tile_id = map.tile_id;
+"""
+
+
+def tile_id(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class MBTilesWriter:
+    # Single writer (the calling process); workers only render and encode.
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.pending = []
+
+    def set_metadata(self, metadata):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", [(name, str(value)) for name, value in metadata.items()])
+
+    def metadata_value(self, name):
+        row = self.connection.execute("SELECT value FROM metadata WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def existing_tiles(self, z):
+        # (x, y) of the tiles of zoom z already in the file, so an interrupted run can resume.
+        return set(self.connection.execute("SELECT tile_column, tile_row FROM map WHERE zoom_level = ?", (z,)))
+
+    def add(self, z, x, y, data):
+        self.pending.append((z, x, y, data))
+        if len(self.pending) >= TILES_PER_TRANSACTION:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows = [(z, x, y, tile_id(data), data) for z, x, y, data in self.pending]
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO images (tile_id, tile_data) VALUES (?, ?)", [(row[3], row[4]) for row in rows])
+            self.connection.executemany("INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)", [row[:4] for row in rows])
+        self.pending = []
+
+    def counts(self):
+        # (tiles, distinct images)
+        tiles = self.connection.execute("SELECT COUNT(*) FROM map").fetchone()[0]
+        images = self.connection.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+        return tiles, images
+
+    def close(self):
+        self.flush()
+        # Fold the write-ahead log back in so the result is a single self-contained file.
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.close()
+
+
+def mbtiles_metadata(input_file, dataset, min_zoom, max_zoom, encoding=pyramid.PNG_ENCODING):
+    metadata = {
+        "name": os.path.splitext(os.path.basename(input_file))[0],
+        "format": encoding.extension,
+        "type": "overlay",
+        "version": "1.1",
+        "description": "Raster profile tiles (gdal2tiles -p raster layout)",
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+    }
+    import map_tiler_srtm
+    try:
+        metadata["bounds"] = ",".join(f"{value:.6f}" for value in map_tiler_srtm.source_bounds_wgs84(dataset))
+    except (ValueError, RuntimeError):
+        pass  # not georeferenced
+    return metadata
+
+
+def render_mbtiles(input_file, output_path, levels="0-16", resampling="average", processes=1, log=print, progress=None, uniform_tiles="write", encoding=pyramid.PNG_ENCODING):
+    # Renders the pyramid into output_path (.mbtiles). Re-running with the same file skips the
+    # tiles already stored. Returns a summary dict.
+    min_zoom, max_zoom = pyramid.parse_zoom_levels(levels)
+    dataset = pyramid.open_source(input_file)
+    pyramid.check_source(dataset)
+    grid = pyramid.TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+
+    writer = MBTilesWriter(output_path)
+    summary = {"rendered": 0, "skipped": 0, **pyramid.new_tile_stats()}
+    total = sum(grid.tile_count(z) for z in range(min_zoom, max_zoom + 1))
+    try:
+        params = pyramid.pyramid_params(input_file, grid, min_zoom, max_zoom, resampling, encoding)
+        if writer.counts()[0]:
+            stored_params = json.loads(writer.metadata_value(PARAMS_METADATA_NAME) or "{}")
+            changed = pyramid.changed_params(stored_params, params)
+            if changed:
+                raise ValueError(f"{output_path} already holds tiles rendered with different settings ({', '.join(changed)}); use the same source and settings to resume it, or a new file.")
+        writer.set_metadata({**mbtiles_metadata(input_file, dataset, min_zoom, max_zoom, encoding), PARAMS_METADATA_NAME: json.dumps(params, sort_keys=True)})
+        for z in range(max_zoom, min_zoom - 1, -1):
+            existing = writer.existing_tiles(z)
+            pending = [(x, y) for x, y in grid.tiles(z) if (x, y) not in existing]
+            summary["skipped"] += grid.tile_count(z) - len(pending)
+            log(f"Zoom {z}: {len(pending)} of {grid.tile_count(z)} tiles to render\n")
+            chunks = [pending[i:i + pyramid.TILES_PER_TASK] for i in range(0, len(pending), pyramid.TILES_PER_TASK)]
+
+            def finished(result):
+                _, encoded, stats = result
+                for x, y, data in encoded:
+                    writer.add(z, x, y, data)
+                pyramid.add_tile_stats(summary, stats)
+                summary["rendered"] += len(encoded) + stats["empty"]
+                if progress is not None and total:
+                    progress((summary["rendered"] + summary["skipped"]) / total)
+
+            if processes <= 1 or len(chunks) <= 1:
+                for chunk in chunks:
+                    finished(pyramid.encode_tiles(input_file, z, chunk, resampling, uniform_tiles, encoding))
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    futures = [pool.submit(pyramid.encode_tiles, input_file, z, chunk, resampling, uniform_tiles, encoding) for chunk in chunks]
+                    try:
+                        for future in as_completed(futures):
+                            finished(future.result())
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+            writer.flush()
+        tiles, images = writer.counts()
+    finally:
+        writer.close()
+
+    summary["tiles"], summary["images"] = tiles, images
+    log(f"Tiles rendered: {summary['rendered']}, already in the file: {summary['skipped']}\n")
+    log(f"{tiles} tiles stored as {images} distinct images in {output_path}\n")
+    pyramid.log_tile_stats(summary, uniform_tiles, log)
+    return summary
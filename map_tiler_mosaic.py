@@ -0,0 +1,142 @@
+import math
+import os
+import subprocess
+import xml.etree.ElementTree as ElementTree
+
+# --- Virtual mosaic input ---
+# Many adjacent sheets are combined into one VRT (an XML file that references the sheets)
+# instead of being merged into a huge intermediate raster. Every conversion reads the VRT
+# as if it were a single file. SheetIndex buckets the sheet footprints on a coarse grid so
+# the built-in renderer can tell in O(1) whether a tile touches any sheet at all.
+
+MOSAIC_EXTENSIONS = ('.tif', '.tiff', '.jpg', '.jpeg', '.png', '.jp2')
+# Target number of index cells along the longer side of the mosaic.
+INDEX_GRID_CELLS = 64
+
+
+def list_mosaic_sources(directory):
+    # Every map file below directory, in a stable order. Outputs of earlier conversions of
+    # the same mosaic (e.g. <name>_mosaic_tiles/, <name>_mosaic_cog.tif) are not sheets.
+    output_prefix = mosaic_name(directory)
+    sources = []
+    for root_dir, dir_names, file_names in os.walk(directory):
+        dir_names[:] = [name for name in dir_names if not name.startswith(output_prefix)]
+        for file_name in file_names:
+            if file_name.lower().endswith(MOSAIC_EXTENSIONS) and not file_name.startswith(output_prefix):
+                sources.append(os.path.join(root_dir, file_name))
+    return sorted(sources)
+
+
+def mosaic_name(input_file):
+    return os.path.basename(os.path.normpath(input_file)) + "_mosaic"
+
+
+def build_mosaic(sources, vrt_path, resampling="average", add_alpha=False, gdalbuildvrt_path=None, env=None, log=print):
+    # Writes the VRT, with the GDAL bindings if they are installed, otherwise with the
+    # gdalbuildvrt tool. An unchanged mosaic keeps its file (and modification time), so a
+    # resumable run over the same sheets still matches its tile manifest.
+    new_path = vrt_path + ".new"
+    log(f"Building virtual mosaic of {len(sources)} sheets: {vrt_path}\n")
+    try:
+        from osgeo import gdal
+    except ImportError:
+        gdal = None
+    if gdal is not None:
+        gdal.UseExceptions()
+        options = gdal.BuildVRTOptions(resampleAlg=resampling, addAlpha=add_alpha)
+        dataset = gdal.BuildVRT(new_path, sources, options=options)
+        if dataset is None:
+            raise RuntimeError("gdal.BuildVRT failed; check that all sheets share the same coordinate system and band layout.")
+        dataset = None
+    else:
+        list_path = vrt_path + ".sources.txt"
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(sources) + "\n")
+        command = [gdalbuildvrt_path or "gdalbuildvrt", "-r", resampling, *(["-addalpha"] if add_alpha else []), "-input_file_list", list_path, new_path]
+        try:
+            completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, shell=os.name == "nt")
+        finally:
+            os.remove(list_path)
+        log(completed.stdout.decode(errors="replace"))
+        if completed.returncode != 0:
+            raise RuntimeError(f"gdalbuildvrt failed with exit code {completed.returncode}.")
+
+    with open(new_path, "rb") as f:
+        new_content = f.read()
+    if os.path.exists(vrt_path):
+        with open(vrt_path, "rb") as f:
+            if f.read() == new_content:
+                os.remove(new_path)
+                log("Virtual mosaic unchanged.\n")
+                return vrt_path
+    os.replace(new_path, vrt_path)
+    return vrt_path
+
+
+def sheet_rectangles(vrt_path):
+    # Pixel rectangles (col0, row0, col1, row1) covered by the sheets of a VRT, read from the
+    # DstRect of the sources of its first band.
+    root = ElementTree.parse(vrt_path).getroot()
+    band = root.find("VRTRasterBand")
+    rectangles = []
+    if band is None:
+        return rectangles
+    for source in band:
+        rect = source.find("DstRect")
+        if rect is None:
+            continue
+        x, y = float(rect.get("xOff", 0)), float(rect.get("yOff", 0))
+        rectangles.append((x, y, x + float(rect.get("xSize", 0)), y + float(rect.get("ySize", 0))))
+    return rectangles
+
+
+class SheetIndex:
+    # Coarse grid of buckets over the mosaic; each bucket lists the sheets overlapping it.
+    def __init__(self, xsize, ysize, rectangles, cells=INDEX_GRID_CELLS):
+        self.cell_size = max(1.0, max(xsize, ysize) / float(cells))
+        self.rectangles = rectangles
+        self.buckets = {}
+        for index, rectangle in enumerate(rectangles):
+            for key in self._keys(rectangle):
+                self.buckets.setdefault(key, []).append(index)
+
+    def _keys(self, window):
+        col0, row0, col1, row1 = window
+        for bx in range(int(math.floor(col0 / self.cell_size)), int(math.ceil(col1 / self.cell_size))):
+            for by in range(int(math.floor(row0 / self.cell_size)), int(math.ceil(row1 / self.cell_size))):
+                yield bx, by
+
+    def sheets_in(self, window):
+        # Indexes of the sheets overlapping the pixel window (col0, row0, col1, row1).
+        col0, row0, col1, row1 = window
+        found = set()
+        for key in self._keys(window):
+            for index in self.buckets.get(key, ()):
+                if index in found:
+                    continue
+                x0, y0, x1, y1 = self.rectangles[index]
+                if x0 < col1 and col0 < x1 and y0 < row1 and row0 < y1:
+                    found.add(index)
+        return found
+
+    def intersects(self, window):
+        col0, row0, col1, row1 = window
+        for key in self._keys(window):
+            for index in self.buckets.get(key, ()):
+                x0, y0, x1, y1 = self.rectangles[index]
+                if x0 < col1 and col0 < x1 and y0 < row1 and row0 < y1:
+                    return True
+        return False
+
+
+def load_sheet_index(vrt_path, xsize, ysize):
+    # SheetIndex of a mosaic VRT, or None for other inputs (or a VRT that is not a mosaic).
+    if not vrt_path.lower().endswith(".vrt"):
+        return None
+    try:
+        rectangles = sheet_rectangles(vrt_path)
+    except (OSError, ElementTree.ParseError):
+        return None
+    if len(rectangles) < 2:
+        return None
+    return SheetIndex(xsize, ysize, rectangles)
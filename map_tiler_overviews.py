@@ -0,0 +1,83 @@
+import os
+
+# --- External overviews ---
+# Builds the overview pyramid of a raster as a sidecar .ovr file, either next to the
+# untouched source or, through a small VRT that points at the source, in a separate cache
+# directory. Nothing is copied. The source is read once, to compute the first (largest)
+# overview level; every further level is computed from the much smaller level before it.
+# osgeo is imported inside the functions, as in map_tiler_pyramid.
+
+
+def ovr_path_for(dataset_path):
+    return dataset_path + ".ovr"
+
+
+def cache_vrt_path(input_file, cache_dir):
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(input_file))[0] + ".vrt")
+
+
+def overview_options(compression, block_size, data_type, bands):
+    # GDAL configuration options for compressed, tiled overviews.
+    import map_tiler_tuning
+    options = {"COMPRESS_OVERVIEW": compression, "GDAL_TIFF_OVR_BLOCKSIZE": str(block_size), "BIGTIFF_OVERVIEW": "IF_SAFER"}
+    if compression in ("DEFLATE", "LZW", "ZSTD") and data_type:
+        options["PREDICTOR_OVERVIEW"] = map_tiler_tuning.predictor_for(data_type)
+    if (bands or 1) > 1:
+        options["INTERLEAVE_OVERVIEW"] = "PIXEL"
+    if compression == "JPEG" and bands == 3 and data_type == "Byte":
+        options["PHOTOMETRIC_OVERVIEW"] = "YCBCR"
+    return options
+
+
+def build_external_overviews(input_file, levels, resampling="average", cache_dir="", compression="DEFLATE", block_size=512, log=print, progress=None):
+    # Writes the .ovr and returns the path of the dataset to open: the source itself, or
+    # the VRT in cache_dir whose overviews are the .ovr next to it.
+    from osgeo import gdal
+    gdal.UseExceptions()
+    if progress is None:
+        progress = lambda fraction: None
+    levels = sorted(int(level) for level in levels)
+
+    dataset_path = input_file
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        dataset_path = cache_vrt_path(input_file, cache_dir)
+        gdal.Translate(dataset_path, os.path.abspath(input_file), format="VRT")
+        log(f"Cache VRT pointing at the source: {dataset_path}\n")
+    ovr_path = ovr_path_for(dataset_path)
+    if os.path.exists(ovr_path):
+        os.remove(ovr_path)  # rebuilt from scratch; adding to it would recompute every level from the source
+        log(f"Replacing existing {ovr_path}\n")
+
+    dataset = gdal.Open(dataset_path, gdal.GA_ReadOnly)
+    first_band = dataset.GetRasterBand(1)
+    config = overview_options(compression, block_size, gdal.GetDataTypeName(first_band.DataType), dataset.RasterCount)
+    for key, value in config.items():
+        gdal.SetThreadLocalConfigOption(key, value)
+    try:
+        # The single pass over the source: all bands of the first level at once.
+        log(f"Level {levels[0]} from the source\n")
+        dataset.BuildOverviews(resampling.upper(), [levels[0]], callback=lambda complete, message, data: progress(complete * 0.8) or 1)
+        if len(levels) > 1:
+            # Create the remaining levels empty; they are filled below, level from level.
+            dataset.BuildOverviews("NONE", levels[1:])
+        dataset = None
+
+        if len(levels) > 1:
+            ovr = gdal.Open(ovr_path, gdal.GA_Update)
+            bands = [ovr.GetRasterBand(i + 1) for i in range(ovr.RasterCount)]
+            steps = len(bands) * (len(levels) - 1)
+            for level_index, level in enumerate(levels[1:]):
+                log(f"Level {level} from level {levels[level_index]}\n")
+                # Band by band, while the previous level's blocks are still in the block cache.
+                for band_index, band in enumerate(bands):
+                    previous = band if level_index == 0 else band.GetOverview(level_index - 1)
+                    step = level_index * len(bands) + band_index
+                    gdal.RegenerateOverview(previous, band.GetOverview(level_index), resampling.upper(),
+                                            callback=lambda complete, message, data, step=step: progress(0.8 + 0.2 * (step + complete) / steps) or 1)
+            ovr = None
+    finally:
+        for key in config:
+            gdal.SetThreadLocalConfigOption(key, None)
+    progress(1.0)
+    return dataset_path
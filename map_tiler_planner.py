@@ -0,0 +1,123 @@
+from dataclasses import dataclass
+
+import map_tiler_pyramid as pyramid
+import map_tiler_tuning
+
+# --- Zoom and overview level planner ---
+# Proposes the levels for a conversion from the input's size and resolution instead of
+# fixed defaults: tiles stop at the native zoom (finer levels only upsample, at four times
+# the tiles per level) and overviews continue down to a thumbnail-sized top level. Also
+# estimates the tile count and output size. The input is read once through
+# map_tiler_tuning.inspect_input, which caches it.
+
+# Overviews are added until the top level fits in this many pixels (as gdaladdo -minsize).
+OVERVIEW_MIN_SIZE = 256
+# Rough compressed size of a tile relative to its raw pixels, per tile format (aerial imagery
+# at the default quality).
+COMPRESSION_RATIOS = {"png": 0.4, "webp-lossless": 0.3, "jpeg": 0.1, "webp": 0.07}
+
+
+@dataclass
+class LevelPlan:
+    width: int
+    height: int
+    bands: int
+    # Pixel size (x, y) in the units of the input's coordinate system, or None.
+    pixel_size: tuple
+    # (minx, miny, maxx, maxy) in the input's coordinate system, or None.
+    extent: tuple
+    file_bytes: int
+    native_zoom: int
+    # In the raster profile zoom 0 already shows the whole input in a single tile.
+    min_zoom: int
+    overview_factors: list
+
+    @property
+    def zoom_levels(self):
+        return f"{self.min_zoom}-{self.native_zoom}"
+
+    @property
+    def overview_levels(self):
+        return " ".join(str(factor) for factor in self.overview_factors)
+
+
+def overview_factors(width, height, min_size=OVERVIEW_MIN_SIZE):
+    # 2, 4, 8, ... until the overview fits in min_size pixels.
+    factors = []
+    factor = 2
+    while max(width, height) / (factor // 2) > min_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def plan_levels(input_file, gdalinfo_path=None, env=None):
+    # LevelPlan for a raster file, or None when its size cannot be read.
+    info = map_tiler_tuning.inspect_input(input_file, gdalinfo_path, env)
+    if not info["width"] or not info["height"]:
+        return None
+    width, height = info["width"], info["height"]
+    pixel_size = extent = None
+    gt = info.get("geotransform")
+    if gt and gt != [0, 1, 0, 0, 0, 1]:
+        pixel_size = (abs(gt[1]), abs(gt[5]))
+        xs = [gt[0], gt[0] + width * gt[1] + height * gt[2]]
+        ys = [gt[3], gt[3] + width * gt[4] + height * gt[5]]
+        extent = (min(xs), min(ys), max(xs), max(ys))
+    return LevelPlan(width, height, info["bands"] or 1, pixel_size, extent, info["file_bytes"],
+                     pyramid.TileGrid(width, height).native_zoom, 0, overview_factors(width, height))
+
+
+def estimate_tiles(plan, levels, tile_format="png"):
+    # (tile count, approximate bytes) of a tiles conversion with the given zoom range.
+    min_zoom, max_zoom = pyramid.parse_zoom_levels(levels)
+    grid = pyramid.TileGrid(plan.width, plan.height)
+    count = sum(grid.tile_count(z) for z in range(min_zoom, max_zoom + 1))
+    channels = min(4, plan.bands + 1)  # plus alpha
+    return count, int(count * pyramid.TILE_SIZE ** 2 * channels * COMPRESSION_RATIOS.get(tile_format, 0.4))
+
+
+def estimate_overviews(plan, levels, overview_mode="copy"):
+    # Approximate bytes written: 1/factor^2 of the input per overview level, at the input's
+    # compression, plus the full resolution copy unless the overviews go to an external .ovr.
+    factors = [int(level) for level in str(levels).split()]
+    overviews = sum(1.0 / factor ** 2 for factor in factors)
+    return int(plan.file_bytes * (overviews if overview_mode == "external" else 1 + overviews))
+
+
+def format_bytes(value):
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024.0
+    return f"{value:.1f} TB"
+
+
+def describe_estimate(plan, conversion_type, levels, tile_format="png", overview_mode="copy"):
+    # One line for the GUI and the console: input size, proposed levels and the estimate.
+    text = f"{plan.width}x{plan.height} px"
+    if plan.pixel_size:
+        text += f", {plan.pixel_size[0]:.6g} per pixel"
+    try:
+        if conversion_type == "tiles":
+            count, size = estimate_tiles(plan, levels, tile_format)
+            text += f"; native zoom {plan.native_zoom}; {count:,} tiles, about {format_bytes(size)}"
+            max_zoom = pyramid.parse_zoom_levels(levels)[1]
+            if max_zoom > plan.native_zoom:
+                text += f" ({max_zoom - plan.native_zoom} level(s) above the native zoom add no detail)"
+        elif conversion_type == "overviews":
+            output = ".ovr" if overview_mode == "external" else "output"
+            text += f"; suggested levels {plan.overview_levels}; {output} about {format_bytes(estimate_overviews(plan, levels, overview_mode))}"
+    except ValueError:
+        text += "; invalid levels"
+    return text
+
+
+def auto_levels(plan, conversion_type):
+    if conversion_type == "tiles":
+        return plan.zoom_levels
+    if conversion_type == "overviews":
+        # Keep at least one level so the overview mode has something to build.
+        return plan.overview_levels or "2"
+    return ""
+
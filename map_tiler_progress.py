@@ -0,0 +1,107 @@
+import re
+import time
+
+# GDAL's terminal progress looks like "0...10...20...30...40...50...60...70...80...90...100 - done."
+PROGRESS_TOKEN = re.compile(r"(?<!\w)(\d{1,3})(\.\.\.| - done)")
+MAX_PENDING_CHARS = 64
+
+
+class ProgressParser:
+    # Turns GDAL progress text into a 0..1 fraction. The text may arrive in arbitrary chunks;
+    # a tool that reports several passes (gdal2tiles: base tiles, then overview tiles) is
+    # tracked as expected_passes consecutive 0..100 runs.
+    def __init__(self, expected_passes=1):
+        self.expected_passes = max(1, expected_passes)
+        self.passes_done = 0
+        self.last_value = None
+        self._pending = ""
+
+    @property
+    def fraction(self):
+        value = self.last_value or 0
+        return min(1.0, (self.passes_done + value / 100.0) / self.expected_passes)
+
+    def feed(self, text):
+        # Returns True when the fraction changed.
+        buffer = self._pending + text
+        changed = False
+        consumed = 0
+        for match in PROGRESS_TOKEN.finditer(buffer):
+            value = int(match.group(1))
+            if value > 100:
+                continue
+            if self.last_value is not None and value < self.last_value:
+                self.passes_done = min(self.expected_passes - 1, self.passes_done + 1)
+            if value != self.last_value:
+                self.last_value = value
+                changed = True
+            consumed = match.end()
+        # Keep the unparsed tail: a number may be split across two chunks.
+        self._pending = buffer[consumed:][-MAX_PENDING_CHARS:]
+        return changed
+
+
+class ProgressTracker:
+    # Overall progress of a conversion made of several stages of equal weight, with an ETA
+    # extrapolated from the elapsed time.
+    def __init__(self, stage_names, callback=None):
+        self.stage_names = list(stage_names)
+        self.callback = callback
+        self.stage_index = 0
+        self.stage_fraction = 0.0
+        self.started = time.monotonic()
+
+    @property
+    def stage_name(self):
+        if self.stage_index < len(self.stage_names):
+            return self.stage_names[self.stage_index]
+        return ""
+
+    @property
+    def fraction(self):
+        if not self.stage_names:
+            return 1.0
+        return min(1.0, (self.stage_index + self.stage_fraction) / len(self.stage_names))
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def eta(self):
+        # Seconds remaining, or None until there is enough progress to extrapolate.
+        fraction = self.fraction
+        if fraction < 0.01:
+            return None
+        return self.elapsed * (1.0 - fraction) / fraction
+
+    def start_stage(self, index):
+        self.stage_index = index
+        self.stage_fraction = 0.0
+        self._notify()
+
+    def update_stage(self, fraction):
+        self.stage_fraction = max(0.0, min(1.0, fraction))
+        self._notify()
+
+    def finish(self):
+        self.stage_index = len(self.stage_names)
+        self.stage_fraction = 0.0
+        self._notify()
+
+    def _notify(self):
+        if self.callback is not None:
+            self.callback(self)
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--"
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
@@ -0,0 +1,1177 @@
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+# --- Built-in tile renderer ---
+# Renders the same "-p raster" layout as gdal2tiles (TMS rows, y=0 at the bottom, partial
+# tiles on the right and top edges) through the GDAL Python bindings, so the pipeline can
+# keep a manifest of finished tiles and write every tile atomically. numpy and osgeo are
+# imported inside the functions that need them to keep "import map_tiler_pyramid" cheap.
+
+TILE_SIZE = 256
+MANIFEST_DIR_NAME = ".manifest"
+# Pixels of the subtree roots, kept in the manifest directory until the levels below them are done.
+ROOTS_DIR_NAME = "roots"
+CHECKPOINT_INTERVAL = 2.0  # seconds between manifest checkpoints
+TILES_PER_TASK = 64
+
+# Resampling names used in the GUI -> GDAL RasterIO resampling constants
+RESAMPLING_ALGORITHMS = {
+    "average": "GRIORA_Average",
+    "nearest": "GRIORA_NearestNeighbour",
+    "bilinear": "GRIORA_Bilinear",
+    "cubic": "GRIORA_Cubic",
+    "cubicspline": "GRIORA_CubicSpline",
+    "lanczos": "GRIORA_Lanczos",
+}
+
+TILE_EXTENSION = "png"
+
+# Tile formats -> (GDAL driver, file extension, MIME type). JPEG has no alpha channel, so
+# transparent areas come out black; WebP keeps the alpha channel.
+TILE_FORMATS = {
+    "png": ("PNG", "png", "image/png"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+    "webp": ("WEBP", "webp", "image/webp"),
+    "webp-lossless": ("WEBP", "webp", "image/webp"),
+}
+DEFAULT_TILE_QUALITY = 75
+# Threads per worker process that encode and write tiles while the next tile is read.
+# GDAL releases the GIL while it reads and encodes, so the two overlap.
+ENCODER_THREADS = 2
+# Encoded-but-unwritten tiles a worker may hold before it waits for the encoder threads.
+MAX_PENDING_WRITES = 32
+
+# Resampling methods whose lower zoom levels can be built from the 2x2 child tiles instead of
+# the source. Other methods have kernels reaching beyond the four children and read every
+# level from the source.
+CHILD_REDUCTIONS = ("average", "nearest")
+# The max zoom is rendered in subtrees (one tile and all its descendants, depth first, so
+# only a few tiles per level are held in memory) spread over the workers, rooted at the first
+# zoom with at least this many tiles; the calling process then reduces their roots further.
+# The split does not depend on the worker count, so a resumed run finds the same subtrees.
+SUBTREE_COUNT = 128
+# Parent tiles reduced per NumPy batch.
+REDUCTION_BATCH = 16
+
+
+@dataclass(frozen=True)
+class TileEncoding:
+    tile_format: str = "png"
+    # 1-100, for "jpeg" and "webp".
+    quality: int = DEFAULT_TILE_QUALITY
+
+    @property
+    def driver(self):
+        return TILE_FORMATS[self.tile_format][0]
+
+    @property
+    def extension(self):
+        return TILE_FORMATS[self.tile_format][1]
+
+    @property
+    def mime_type(self):
+        return TILE_FORMATS[self.tile_format][2]
+
+    def creation_options(self):
+        if self.tile_format == "png":
+            return []
+        if self.tile_format == "webp-lossless":
+            return ["LOSSLESS=TRUE"]
+        return [f"QUALITY={int(self.quality)}"]
+
+    @property
+    def lossy(self):
+        # Decoding a stored tile does not give back the pixels that were encoded.
+        return self.tile_format in ("jpeg", "webp")
+
+    def describe(self):
+        if self.lossy:
+            return f"{self.tile_format} (quality {self.quality})"
+        return self.tile_format
+
+
+PNG_ENCODING = TileEncoding()
+
+# What to do with uniform tiles (one colour, including fully transparent ones):
+# "write" encodes each one like any other tile, "link" hardlinks all tiles of the same colour
+# to one shared file in SHARED_DIR_NAME, "skip" does the same but writes no file at all for
+# fully transparent tiles and lists them in the EmptyTiles index instead (viewers draw a
+# missing tile as transparent).
+UNIFORM_TILE_MODES = ("write", "link", "skip")
+SHARED_DIR_NAME = ".shared"
+EMPTY_DIR_NAME = "empty"
+
+
+def parse_zoom_levels(levels):
+    # "0-16" -> (0, 16), "12" -> (12, 12)
+    parts = str(levels).strip().split("-")
+    if len(parts) not in (1, 2) or not all(part.strip().isdigit() for part in parts):
+        raise ValueError(f"Zoom levels must be a range like '0-16' or a single level, got '{levels}'.")
+    min_zoom, max_zoom = int(parts[0]), int(parts[-1])
+    if min_zoom > max_zoom:
+        raise ValueError(f"Invalid zoom range '{levels}': the first level must not be larger than the last.")
+    return min_zoom, max_zoom
+
+
+class TileGrid:
+    def __init__(self, xsize, ysize, tile_size=TILE_SIZE):
+        self.xsize = xsize
+        self.ysize = ysize
+        self.tile_size = tile_size
+        self.native_zoom = max(0, math.ceil(math.log2(max(xsize, ysize) / float(tile_size))))
+
+    def tile_span(self, z):
+        # Source pixels covered by one tile at zoom z (fractional above the native zoom).
+        return self.tile_size * 2.0 ** (self.native_zoom - z)
+
+    def tile_counts(self, z):
+        span = self.tile_span(z)
+        return max(1, math.ceil(self.xsize / span)), max(1, math.ceil(self.ysize / span))
+
+    def tile_count(self, z):
+        columns, rows = self.tile_counts(z)
+        return columns * rows
+
+    def tiles(self, z):
+        columns, rows = self.tile_counts(z)
+        for x in range(columns):
+            for y in range(rows):
+                yield x, y
+
+    def tile_index(self, z, x, y):
+        return x * self.tile_counts(z)[1] + y
+
+    def tiles_in_window(self, z, window, pad=0):
+        # Tiles of zoom z touching the source pixel window (col0, row0, col1, row1), grown
+        # by pad tile pixels so resampling kernels reaching across tile edges are covered.
+        col0, row0, col1, row1 = window
+        span = self.tile_span(z)
+        pad_pixels = pad * span / self.tile_size
+        columns, rows = self.tile_counts(z)
+        x0 = max(0, int(math.floor((col0 - pad_pixels) / span)))
+        x1 = min(columns - 1, int(math.ceil((col1 + pad_pixels) / span)) - 1)
+        y0 = max(0, int(math.floor((self.ysize - row1 - pad_pixels) / span)))
+        y1 = min(rows - 1, int(math.ceil((self.ysize - row0 + pad_pixels) / span)) - 1)
+        return {(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)}
+
+    def tile_window(self, z, x, y):
+        # Returns (rx, ry, rxsize, rysize, wx, wy, wxsize, wysize): the source window
+        # and where it lands inside the tile.
+        span = self.tile_span(z)
+        rx = x * span
+        rxsize = min(span, self.xsize - rx)
+        rysize = min(span, self.ysize - y * span)
+        ry = self.ysize - y * span - rysize
+        wxsize = max(1, int(round(rxsize / span * self.tile_size)))
+        wysize = max(1, int(round(rysize / span * self.tile_size)))
+        rx0, ry0 = int(math.floor(rx)), int(math.floor(ry))
+        rx1 = min(self.xsize, max(rx0 + 1, int(math.ceil(rx + rxsize))))
+        ry1 = min(self.ysize, max(ry0 + 1, int(math.ceil(ry + rysize))))
+        return rx0, ry0, rx1 - rx0, ry1 - ry0, 0, self.tile_size - wysize, wxsize, wysize
+
+
+def tile_path(output_dir, z, x, y, extension=TILE_EXTENSION):
+    return os.path.join(output_dir, str(z), str(x), f"{y}.{extension}")
+
+
+def write_file_atomic(path, data):
+    # Readers (and a resumed run) never see a half-written tile: the file only gets
+    # its final name once it is complete.
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def is_valid_tile(path):
+    # Cheap structural check of an encoded tile (catches truncated or empty files).
+    try:
+        size = os.path.getsize(path)
+        if size < 16:
+            return False
+        with open(path, "rb") as f:
+            head = f.read(12)
+            f.seek(-12, os.SEEK_END)
+            tail = f.read(12)
+    except OSError:
+        return False
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return tail.endswith(b"IEND\xaeB`\x82")
+    if head.startswith(b"\xff\xd8"):
+        return tail.endswith(b"\xff\xd9")
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return int.from_bytes(head[4:8], "little") + 8 == size
+    return False
+
+
+class TileBitmaps:
+    # One bitmap per zoom level, <z>.bitmap: bit x * rows + y (least significant bit first)
+    # stands for tile (x, y) of the zoom's grid. Bitmaps are rewritten atomically.
+    def __init__(self, directory, grid):
+        self.directory = directory
+        self.grid = grid
+        self.bitmaps = {}
+        self.dirty = False
+
+    def load_bitmaps(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".bitmap"):
+                z = int(name[:-len(".bitmap")])
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    self.bitmaps[z] = bytearray(f.read())
+
+    def write_bitmaps(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for z, bitmap in self.bitmaps.items():
+            write_file_atomic(os.path.join(self.directory, f"{z}.bitmap"), bytes(bitmap))
+
+    def _bitmap(self, z):
+        if z not in self.bitmaps:
+            self.bitmaps[z] = bytearray((self.grid.tile_count(z) + 7) // 8)
+        return self.bitmaps[z]
+
+    def is_set(self, z, x, y):
+        index = self.grid.tile_index(z, x, y)
+        return bool(self._bitmap(z)[index >> 3] & (1 << (index & 7)))
+
+    def set(self, z, x, y, value=True):
+        index = self.grid.tile_index(z, x, y)
+        bitmap = self._bitmap(z)
+        byte = bitmap[index >> 3] | (1 << (index & 7)) if value else bitmap[index >> 3] & ~(1 << (index & 7))
+        if byte != bitmap[index >> 3]:
+            bitmap[index >> 3] = byte
+            self.dirty = True
+
+    def count(self, z):
+        return sum(bin(byte).count("1") for byte in self._bitmap(z))
+
+    def tiles_set(self, z):
+        rows = self.grid.tile_counts(z)[1]
+        for byte_index, byte in enumerate(self._bitmap(z)):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield divmod(byte_index * 8 + bit, rows)
+
+
+class EmptyTiles(TileBitmaps):
+    # Tiles the "skip" uniform tile mode left out because they are fully transparent, kept in
+    # .shared/empty/ with an index.json that describes the grid, so a missing tile file can
+    # be told apart from one that failed to render.
+    def __init__(self, output_dir, grid):
+        super().__init__(os.path.join(output_dir, SHARED_DIR_NAME, EMPTY_DIR_NAME), grid)
+        if os.path.isdir(self.directory):
+            self.load_bitmaps()
+
+    def add(self, stats):
+        # Moves the (z, x, y) list of skipped tiles out of a task's statistics into the bitmaps.
+        for z, x, y in stats.pop("empty_tiles", ()):
+            self.set(z, x, y)
+
+    def clear(self, z, tiles):
+        # Tiles about to be rendered again.
+        for x, y in tiles:
+            self.set(z, x, y, False)
+
+    def checkpoint(self):
+        if not self.dirty:
+            return
+        index = {
+            "tile_size": self.grid.tile_size,
+            "bit_order": "bit x * rows + y of <z>.bitmap, least significant bit of each byte first",
+            "zoom_levels": {str(z): list(self.grid.tile_counts(z)) for z in sorted(self.bitmaps)},
+        }
+        self.write_bitmaps()
+        write_file_atomic(os.path.join(self.directory, "index.json"), json.dumps(index, indent=2).encode("utf-8"))
+        self.dirty = False
+
+
+class TileArrays:
+    # Decoded tile pixels as .npy files, one per tile: the exact input for reducing their
+    # parents later, where a stored JPEG or WebP tile would come back with its encoding losses.
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, z, x, y):
+        return os.path.join(self.directory, f"{z}_{x}_{y}.npy")
+
+    def save(self, z, x, y, tile):
+        import numpy as np
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(z, x, y)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            np.save(f, tile)
+        os.replace(tmp_path, path)
+
+    def load(self, z, x, y):
+        # None when the tile was not kept.
+        import numpy as np
+        try:
+            return np.load(self.path(z, x, y))
+        except (OSError, ValueError):
+            return None
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class TileManifest(TileBitmaps):
+    # A bitmap of finished tiles per zoom level plus a JSON header with the parameters the
+    # pyramid was rendered with, and the index of empty tiles. Both are rewritten at
+    # checkpoints; tiles finished after the last checkpoint are adopted on resume because
+    # they were also written atomically.
+    def __init__(self, output_dir, grid, params):
+        super().__init__(os.path.join(output_dir, MANIFEST_DIR_NAME), grid)
+        self.params = params
+        self.empty = EmptyTiles(output_dir, grid)
+        self.arrays = TileArrays(os.path.join(self.directory, ROOTS_DIR_NAME))
+
+    def load(self, ignore_keys=()):
+        # ignore_keys lists parameters allowed to differ (e.g. the source version on an update).
+        header_path = os.path.join(self.directory, "manifest.json")
+        if not os.path.exists(header_path):
+            return False
+        with open(header_path, "r", encoding="utf-8") as f:
+            stored_params = json.load(f)
+        changed = changed_params(stored_params, self.params, ignore_keys)
+        if changed:
+            raise ValueError(f"Existing tile manifest was written with different settings ({', '.join(changed)}). Use a new output directory or delete {self.directory}.")
+        self.load_bitmaps()
+        return True
+
+    def is_done(self, z, x, y):
+        return self.is_set(z, x, y)
+
+    def mark_done(self, z, x, y):
+        self.set(z, x, y)
+
+    def done_count(self, z):
+        return self.count(z)
+
+    def checkpoint(self):
+        # The empty tiles first: a tile the manifest calls done is then always on disk or listed.
+        self.empty.checkpoint()
+        if not self.dirty and os.path.exists(os.path.join(self.directory, "manifest.json")):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        write_file_atomic(os.path.join(self.directory, "manifest.json"), json.dumps(self.params, indent=2, sort_keys=True).encode("utf-8"))
+        self.write_bitmaps()
+        self.dirty = False
+
+
+# --- Tile rendering (runs in worker processes) ---
+
+_worker_datasets = {}
+_worker_sheet_indexes = {}
+
+
+def open_source(input_file):
+    from osgeo import gdal
+    gdal.UseExceptions()
+    dataset = _worker_datasets.get(input_file)
+    if dataset is None:
+        dataset = gdal.Open(input_file, gdal.GA_ReadOnly)
+        _worker_datasets[input_file] = dataset
+    return dataset
+
+
+def sheet_index(input_file, dataset):
+    # Footprint index of a virtual mosaic's sheets (None for ordinary inputs), cached per worker.
+    if input_file not in _worker_sheet_indexes:
+        import map_tiler_mosaic
+        _worker_sheet_indexes[input_file] = map_tiler_mosaic.load_sheet_index(input_file, dataset.RasterXSize, dataset.RasterYSize)
+    return _worker_sheet_indexes[input_file]
+
+
+def check_source(dataset):
+    from osgeo import gdal
+    band = dataset.GetRasterBand(1)
+    if band.DataType != gdal.GDT_Byte:
+        raise ValueError(f"The built-in tile renderer needs 8-bit input, got {gdal.GetDataTypeName(band.DataType)}. Convert it first (e.g. gdal_translate -ot Byte -scale).")
+
+
+def read_tile_array(dataset, grid, z, x, y, resampling, sheets=None):
+    # Returns a (bands, tile_size, tile_size) uint8 array whose last band is alpha.
+    # sheets, the SheetIndex of a mosaic, lets tiles in gaps between sheets skip the read.
+    import numpy as np
+    from osgeo import gdal
+
+    rx, ry, rxsize, rysize, wx, wy, wxsize, wysize = grid.tile_window(z, x, y)
+    resample_alg = getattr(gdal, RESAMPLING_ALGORITHMS.get(resampling, "GRIORA_Average"))
+
+    bands = [dataset.GetRasterBand(i + 1) for i in range(dataset.RasterCount)]
+    alpha_band = None
+    if bands[-1].GetColorInterpretation() == gdal.GCI_AlphaBand:
+        alpha_band = bands.pop()
+    mask_band = alpha_band or bands[0].GetMaskBand()
+
+    def read(band, alg):
+        return band.ReadAsArray(rx, ry, rxsize, rysize, buf_xsize=wxsize, buf_ysize=wysize, resample_alg=alg)
+
+    color_table = bands[0].GetColorTable() if len(bands) == 1 else None
+    if sheets is not None and not sheets.intersects((rx, ry, rx + rxsize, ry + rysize)):
+        return np.zeros((4 if color_table is not None else len(bands) + 1, grid.tile_size, grid.tile_size), dtype=np.uint8)
+    if color_table is not None:
+        # Paletted input: expand to RGB(A) with a lookup table, like gdal2tiles' VRT expansion.
+        lut = np.array([color_table.GetColorEntry(i) if i < color_table.GetCount() else (0, 0, 0, 0) for i in range(256)], dtype=np.uint8)
+        data = lut[read(bands[0], gdal.GRIORA_NearestNeighbour)][:, :, :3].transpose(2, 0, 1)
+    else:
+        data = np.stack([read(band, resample_alg) for band in bands])
+
+    tile = np.zeros((data.shape[0] + 1, grid.tile_size, grid.tile_size), dtype=np.uint8)
+    tile[:-1, wy:wy + wysize, wx:wx + wxsize] = data
+    tile[-1, wy:wy + wysize, wx:wx + wxsize] = read(mask_band, resample_alg)
+    return tile
+
+
+def encode_tile(tile, encoding=PNG_ENCODING):
+    from osgeo import gdal
+    if encoding.driver == "JPEG":
+        tile = tile[:-1]  # no alpha channel
+    elif encoding.driver == "WEBP" and tile.shape[0] == 2:
+        tile = tile[[0, 0, 0, 1]]  # WebP needs RGB(A): grey + alpha -> RGBA
+    bands, height, width = tile.shape
+    mem = gdal.GetDriverByName("MEM").Create("", width, height, bands, gdal.GDT_Byte)
+    for i in range(bands):
+        mem.GetRasterBand(i + 1).WriteArray(tile[i])
+    if bands in (2, 4):
+        mem.GetRasterBand(bands).SetColorInterpretation(gdal.GCI_AlphaBand)
+    vsi_path = f"/vsimem/map_tiler_{os.getpid()}_{threading.get_ident()}_{id(tile)}.{encoding.extension}"
+    gdal.GetDriverByName(encoding.driver).CreateCopy(vsi_path, mem, strict=0, options=encoding.creation_options())
+    try:
+        f = gdal.VSIFOpenL(vsi_path, "rb")
+        gdal.VSIFSeekL(f, 0, os.SEEK_END)
+        size = gdal.VSIFTellL(f)
+        gdal.VSIFSeekL(f, 0, os.SEEK_SET)
+        data = gdal.VSIFReadL(1, size, f)
+        gdal.VSIFCloseL(f)
+    finally:
+        gdal.Unlink(vsi_path)
+    return data
+
+
+# --- Uniform tiles ---
+
+_encoded_uniform_tiles = {}
+
+
+def uniform_color(tile):
+    # The tile's single colour as a tuple (all zeros when fully transparent), or None.
+    # Checked on the rendered array, before the far more expensive encoding.
+    if not tile[-1].any():
+        return (0,) * tile.shape[0]
+    first = tile[:, :1, :1]
+    if not (tile == first).all():
+        return None
+    return tuple(int(value) for value in first.ravel())
+
+
+def encode_uniform_tile(tile, color, encoding=PNG_ENCODING):
+    # Each worker encodes every distinct colour once.
+    data = _encoded_uniform_tiles.get((color, encoding))
+    if data is None:
+        if not color[-1]:
+            tile[:] = 0  # the colour under alpha 0 does not matter
+        data = encode_tile(tile, encoding)
+        _encoded_uniform_tiles[(color, encoding)] = data
+    return data
+
+
+def new_tile_stats():
+    return {"shared": 0, "empty": 0, "bytes_avoided": 0}
+
+
+def add_tile_stats(total, stats):
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+
+def store_uniform_tile(output_dir, path, tile, color, uniform_tiles, stats, encoding=PNG_ENCODING):
+    # Returns True when the tile was left out as empty.
+    data = encode_uniform_tile(tile, color, encoding)
+    if uniform_tiles == "skip" and not color[-1]:
+        # A file left over from an earlier version of the source must not show through.
+        if os.path.exists(path):
+            os.remove(path)
+        stats["empty"] += 1
+        stats["bytes_avoided"] += len(data)
+        return True
+
+    shared_path = os.path.join(output_dir, SHARED_DIR_NAME, "".join(f"{value:02x}" for value in color) + "." + encoding.extension)
+    if not os.path.exists(shared_path):
+        os.makedirs(os.path.dirname(shared_path), exist_ok=True)
+        write_file_atomic(shared_path, data)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Link under a temporary name and rename, so the tile appears atomically like any other.
+    # A later write of this tile replaces the link; the shared file is never modified.
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        os.link(shared_path, tmp_path)
+    except OSError:
+        # No hardlinks on this filesystem (e.g. FAT32/exFAT drives): write a normal file.
+        write_file_atomic(path, data)
+        return
+    os.replace(tmp_path, path)
+    stats["shared"] += 1
+    stats["bytes_avoided"] += len(data)
+
+
+def encode_and_write(path, tile, encoding):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_file_atomic(path, encode_tile(tile, encoding))
+
+
+def store_tile(output_dir, z, x, y, tile, uniform_tiles, stats, encoding, encoder, writes):
+    # Writes a rendered tile: uniform tiles directly, others on the encoder threads (their
+    # futures are appended to writes, and the oldest is waited for once too many are queued).
+    # Empty tiles left out are listed in stats["empty_tiles"] for the EmptyTiles index.
+    path = tile_path(output_dir, z, x, y, encoding.extension)
+    color = uniform_color(tile) if uniform_tiles != "write" else None
+    if color is not None:
+        if store_uniform_tile(output_dir, path, tile, color, uniform_tiles, stats, encoding):
+            stats.setdefault("empty_tiles", []).append((z, x, y))
+        return
+    writes.append(encoder.submit(encode_and_write, path, tile, encoding))
+    while len(writes) > MAX_PENDING_WRITES:
+        writes.popleft().result()
+
+
+def render_tiles(input_file, output_dir, z, tiles, resampling, uniform_tiles="write", encoding=PNG_ENCODING):
+    # Worker task: render, encode and atomically write a chunk of tiles of one zoom level.
+    # Returns (z, tiles, stats) with the counts of shared and skipped uniform tiles.
+    dataset = open_source(input_file)
+    grid = TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+    sheets = sheet_index(input_file, dataset)
+    stats = new_tile_stats()
+    with ThreadPoolExecutor(max_workers=ENCODER_THREADS) as encoder:
+        writes = deque()
+        for x, y in tiles:
+            tile = read_tile_array(dataset, grid, z, x, y, resampling, sheets)
+            store_tile(output_dir, z, x, y, tile, uniform_tiles, stats, encoding, encoder, writes)
+        for write in writes:
+            write.result()
+    return z, tiles, stats
+
+
+# --- Lower zoom levels from child tiles ---
+
+def reduce_children(children, resampling):
+    # (n, bands, 2 * size, 2 * size) uint8 blocks of four child tiles -> (n, bands, size, size)
+    # parent tiles. "nearest" takes the pixel GDAL's nearest neighbour picks at a factor of 2;
+    # "average" weights the colours by alpha, so transparent pixels do not darken the edges.
+    # Transparent pixels come out black either way, so it does not matter whether the
+    # children were rendered in memory or decoded from their files.
+    import numpy as np
+    if resampling == "nearest":
+        parents = np.ascontiguousarray(children[:, :, 1::2, 1::2])
+        parents[:, :-1] *= parents[:, -1:] > 0
+        return parents
+    n, bands, height, width = children.shape
+    blocks = children.reshape(n, bands, height // 2, 2, width // 2, 2).astype(np.uint32)
+    alpha = blocks[:, -1:]
+    weight = alpha.sum(axis=(3, 5))
+    parents = np.empty((n, bands, height // 2, width // 2), dtype=np.uint8)
+    parents[:, :-1] = ((blocks[:, :-1] * alpha).sum(axis=(3, 5)) + weight // 2) // np.maximum(weight, 1)
+    parents[:, -1:] = (weight + 2) // 4
+    return parents
+
+
+def child_block(grid, z, x, y, children):
+    # Places the child tiles of (z, x, y), a dict {(x, y): array} at zoom z + 1, into one
+    # (bands, 2 * size, 2 * size) array. Children outside the grid stay transparent.
+    import numpy as np
+    size = grid.tile_size
+    bands = next(iter(children.values())).shape[0]
+    block = np.zeros((bands, 2 * size, 2 * size), dtype=np.uint8)
+    for dx in (0, 1):
+        for dy in (0, 1):
+            child = children.get((2 * x + dx, 2 * y + dy))
+            if child is not None:
+                # y counts up from the bottom: the dy=1 children are the upper half.
+                block[:, (1 - dy) * size:(2 - dy) * size, dx * size:(dx + 1) * size] = child
+    return block
+
+
+def tile_band_count(dataset):
+    # Bands of the arrays read_tile_array returns for this source (colour bands + alpha).
+    from osgeo import gdal
+    count = dataset.RasterCount
+    if count > 1 and dataset.GetRasterBand(count).GetColorInterpretation() == gdal.GCI_AlphaBand:
+        count -= 1
+    if count == 1 and dataset.GetRasterBand(1).GetColorTable() is not None:
+        return 4
+    return count + 1
+
+
+def load_tile_array(path, bands, tile_size=TILE_SIZE):
+    # Decodes a stored tile into the (bands, size, size) layout of read_tile_array; a missing
+    # tile is transparent. JPEG tiles have no alpha band and are read back as opaque.
+    import numpy as np
+    from osgeo import gdal
+    tile = np.zeros((bands, tile_size, tile_size), dtype=np.uint8)
+    if not os.path.exists(path):
+        return tile
+    data = gdal.Open(path, gdal.GA_ReadOnly).ReadAsArray()
+    if data.ndim == 2:
+        data = data[None]
+    if data.shape[0] == bands:
+        return data
+    if data.shape[0] == bands - 1:
+        tile[:-1] = data
+        tile[-1] = 255
+        return tile
+    if bands == 2 and data.shape[0] == 4:
+        return data[[0, 3]]  # grey + alpha, stored as RGBA WebP
+    raise ValueError(f"{path} has {data.shape[0]} bands, expected {bands}.")
+
+
+def reduce_stored_tiles(dataset, grid, output_dir, z, tiles, resampling, manifest, uniform_tiles="write", stats=None, encoding=PNG_ENCODING, on_rendered=None, arrays=None):
+    # Rebuilds tiles of zoom z from their child tiles stored at z + 1, marking them done in
+    # the manifest. With arrays (a TileArrays), children kept there are used instead of their
+    # decoded files and the new tiles are kept there too. Returns the number of tiles written.
+    import numpy as np
+    bands = tile_band_count(dataset)
+    stats = new_tile_stats() if stats is None else stats
+    rendered = 0
+    with ThreadPoolExecutor(max_workers=ENCODER_THREADS) as encoder:
+        writes = deque()
+        for i in range(0, len(tiles), REDUCTION_BATCH):
+            batch = tiles[i:i + REDUCTION_BATCH]
+            blocks = []
+            for x, y in batch:
+                children = {}
+                for cx, cy in child_tiles(grid, z, x, y):
+                    child = arrays.load(z + 1, cx, cy) if arrays is not None else None
+                    children[(cx, cy)] = child if child is not None else load_tile_array(tile_path(output_dir, z + 1, cx, cy, encoding.extension), bands, grid.tile_size)
+                blocks.append(child_block(grid, z, x, y, children))
+            for (x, y), tile in zip(batch, reduce_children(np.stack(blocks), resampling)):
+                if arrays is not None:
+                    arrays.save(z, x, y, tile)
+                store_tile(output_dir, z, x, y, tile, uniform_tiles, stats, encoding, encoder, writes)
+                if manifest is not None:
+                    manifest.mark_done(z, x, y)
+            rendered += len(batch)
+            if on_rendered is not None:
+                on_rendered(rendered)
+        for write in writes:
+            write.result()
+    if manifest is not None:
+        manifest.empty.add(stats)
+    return rendered
+
+
+def child_tiles(grid, z, x, y):
+    columns, rows = grid.tile_counts(z + 1)
+    return [(cx, cy) for cx in (2 * x, 2 * x + 1) for cy in (2 * y, 2 * y + 1) if cx < columns and cy < rows]
+
+
+def subtree_tiles(grid, z, x, y, max_zoom):
+    # Every tile of the subtree rooted at (z, x, y), level by level down to max_zoom.
+    tiles = {}
+    for level in range(z, max_zoom + 1):
+        columns, rows = grid.tile_counts(level)
+        scale = 2 ** (level - z)
+        tiles[level] = [(tx, ty) for tx in range(x * scale, min(columns, (x + 1) * scale)) for ty in range(y * scale, min(rows, (y + 1) * scale))]
+    return tiles
+
+
+def render_subtree(input_file, output_dir, z, x, y, max_zoom, resampling, uniform_tiles="write", encoding=PNG_ENCODING, return_root=False, done=()):
+    # Worker task: renders the max zoom tiles below (z, x, y) from the source and every tile
+    # above them from its four children, depth first. Tiles listed in done (as (z, x, y)) are
+    # still computed for their parents but not written again. The root is written only once
+    # every other tile of the subtree is on disk, so a root on disk means a finished subtree.
+    # Returns ((z, x, y), stats, root tile array or None).
+    done = {tuple(tile) for tile in done}
+    dataset = open_source(input_file)
+    grid = TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+    sheets = sheet_index(input_file, dataset)
+    stats = new_tile_stats()
+
+    with ThreadPoolExecutor(max_workers=ENCODER_THREADS) as encoder:
+        writes = deque()
+
+        def build(level, tx, ty):
+            if level == max_zoom:
+                tile = read_tile_array(dataset, grid, level, tx, ty, resampling, sheets)
+            else:
+                children = {(cx, cy): build(level + 1, cx, cy) for cx, cy in child_tiles(grid, level, tx, ty)}
+                tile = reduce_children(child_block(grid, level, tx, ty, children)[None], resampling)[0]
+            if (level, tx, ty) in done:
+                return tile
+            if level == z:
+                for write in writes:
+                    write.result()
+                writes.clear()
+            store_tile(output_dir, level, tx, ty, tile, uniform_tiles, stats, encoding, encoder, writes)
+            return tile
+
+        root = build(z, x, y)
+        for write in writes:
+            write.result()
+    return (z, x, y), stats, root if return_root else None
+
+
+def encode_tiles(input_file, z, tiles, resampling, uniform_tiles="write", encoding=PNG_ENCODING):
+    # Worker task for single-file containers: render and encode a chunk of tiles and return
+    # (z, [(x, y, data), ...], stats) so the calling process can write them to the container.
+    # Uniform tiles are encoded once per colour; in "skip" mode fully transparent tiles are left out.
+    dataset = open_source(input_file)
+    grid = TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+    sheets = sheet_index(input_file, dataset)
+    stats = new_tile_stats()
+    encoded = []
+    with ThreadPoolExecutor(max_workers=ENCODER_THREADS) as encoder:
+        for x, y in tiles:
+            tile = read_tile_array(dataset, grid, z, x, y, resampling, sheets)
+            color = uniform_color(tile) if uniform_tiles != "write" else None
+            if color is None:
+                encoded.append((x, y, encoder.submit(encode_tile, tile, encoding)))
+                continue
+            data = encode_uniform_tile(tile, color, encoding)
+            if uniform_tiles == "skip" and not color[-1]:
+                stats["empty"] += 1
+                stats["bytes_avoided"] += len(data)
+            else:
+                # Stored once by the container's content-addressed images table.
+                stats["shared"] += 1
+                encoded.append((x, y, data))
+        encoded = [(x, y, data if isinstance(data, bytes) else data.result()) for x, y, data in encoded]
+    return z, encoded, stats
+
+
+# --- Pyramid driver (runs in the calling process) ---
+
+def adopt_finished_tiles(output_dir, manifest, z, extension=TILE_EXTENSION):
+    # Marks tiles that are on disk and valid but missing from the manifest (finished after
+    # the last checkpoint) and removes leftovers of interrupted writes. Skipped tiles in the
+    # empty index count as finished too. Returns the count adopted.
+    adopted = 0
+    for x, y in manifest.empty.tiles_set(z):
+        if not manifest.is_done(z, x, y):
+            manifest.mark_done(z, x, y)
+            adopted += 1
+    zoom_dir = os.path.join(output_dir, str(z))
+    if not os.path.isdir(zoom_dir):
+        return adopted
+    columns, rows = manifest.grid.tile_counts(z)
+    for x_entry in os.scandir(zoom_dir):
+        if not x_entry.is_dir() or not x_entry.name.isdigit() or int(x_entry.name) >= columns:
+            continue
+        x = int(x_entry.name)
+        for tile_entry in os.scandir(x_entry.path):
+            name = tile_entry.name
+            if ".tmp-" in name:
+                os.remove(tile_entry.path)
+                continue
+            stem, _, file_extension = name.partition(".")
+            if file_extension != extension or not stem.isdigit() or int(stem) >= rows:
+                continue
+            y = int(stem)
+            if manifest.is_done(z, x, y):
+                continue
+            if is_valid_tile(tile_entry.path):
+                manifest.mark_done(z, x, y)
+                adopted += 1
+            else:
+                os.remove(tile_entry.path)
+    return adopted
+
+
+def holds_tiles(output_dir):
+    # True when output_dir has zoom level folders or uniform tiles from an earlier run.
+    if not os.path.isdir(output_dir):
+        return False
+    return any(entry.is_dir() and (entry.name.isdigit() or entry.name == SHARED_DIR_NAME) for entry in os.scandir(output_dir))
+
+
+def open_manifest(output_dir, grid, params, log=print):
+    # The manifest of the run being resumed, or a new one. Tiles on disk are only adopted
+    # when a manifest vouches for the settings they were rendered with, so a folder holding
+    # tiles but no manifest (from gdal2tiles, or a run without it) is refused. A new manifest
+    # is written before the first tile, so an interrupted run always leaves one behind.
+    manifest = TileManifest(output_dir, grid, params)
+    if manifest.load():
+        log(f"Resuming from tile manifest in {manifest.directory}\n")
+        return manifest
+    if holds_tiles(output_dir):
+        raise ValueError(f"{output_dir} already holds tiles but no tile manifest, so they cannot be checked against these settings (e.g. they were written by gdal2tiles). Use a new output directory or delete them.")
+    os.makedirs(output_dir, exist_ok=True)
+    manifest.checkpoint()
+    return manifest
+
+
+def render_pyramid(input_file, output_dir, levels="0-16", resampling="average", processes=1, log=print, progress=None, uniform_tiles="write", encoding=PNG_ENCODING):
+    # Renders (or resumes) the pyramid. Returns a summary dict.
+    # progress, if given, is called with the finished fraction of all tiles.
+    min_zoom, max_zoom = parse_zoom_levels(levels)
+    if max_zoom > min_zoom and resampling in CHILD_REDUCTIONS:
+        return render_pyramid_from_children(input_file, output_dir, min_zoom, max_zoom, resampling, processes, log, progress, uniform_tiles, encoding)
+    if max_zoom > min_zoom:
+        log(f"'{resampling}' resampling cannot be built from child tiles; every zoom level is read from the source.\n")
+    dataset = open_source(input_file)
+    check_source(dataset)
+    grid = TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+
+    manifest = open_manifest(output_dir, grid, pyramid_params(input_file, grid, min_zoom, max_zoom, resampling, encoding), log)
+
+    summary = {"rendered": 0, "skipped": 0, "adopted": 0, **new_tile_stats()}
+    total = sum(grid.tile_count(z) for z in range(min_zoom, max_zoom + 1))
+    report = progress_reporter(progress, total, lambda: summary["rendered"] + summary["skipped"])
+    for z in range(max_zoom, min_zoom - 1, -1):
+        summary["adopted"] += adopt_finished_tiles(output_dir, manifest, z, encoding.extension)
+        pending = [(x, y) for x, y in grid.tiles(z) if not manifest.is_done(z, x, y)]
+        summary["skipped"] += grid.tile_count(z) - len(pending)
+        log(f"Zoom {z}: {len(pending)} of {grid.tile_count(z)} tiles to render\n")
+        summary["rendered"] += render_tile_set(input_file, output_dir, z, pending, resampling, processes, manifest, report, uniform_tiles, summary, encoding)
+        manifest.checkpoint()
+
+    write_tilemapresource(output_dir, dataset, grid, min_zoom, max_zoom, encoding)
+    log(f"Tiles rendered: {summary['rendered']}, already finished: {summary['skipped']} (adopted from disk: {summary['adopted']})\n")
+    log_tile_stats(summary, uniform_tiles, log)
+    return summary
+
+
+def render_pyramid_from_children(input_file, output_dir, min_zoom, max_zoom, resampling, processes=1, log=print, progress=None, uniform_tiles="write", encoding=PNG_ENCODING):
+    # Like render_pyramid, but only max_zoom is read from the source: workers render subtrees
+    # rooted at root_zoom, and the levels below root_zoom are reduced here from the subtree
+    # roots. A subtree writes its root last, so a finished root means a finished subtree; the
+    # roots' pixels are kept in the manifest directory until the lower levels are done, so a
+    # resumed run reduces exactly the same pixels as an uninterrupted one.
+    import numpy as np
+    dataset = open_source(input_file)
+    check_source(dataset)
+    grid = TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+
+    manifest = open_manifest(output_dir, grid, pyramid_params(input_file, grid, min_zoom, max_zoom, resampling, encoding), log)
+
+    summary = {"rendered": 0, "skipped": 0, "adopted": 0, **new_tile_stats()}
+    for z in range(max_zoom, min_zoom - 1, -1):
+        summary["adopted"] += adopt_finished_tiles(output_dir, manifest, z, encoding.extension)
+    total = sum(grid.tile_count(z) for z in range(min_zoom, max_zoom + 1))
+    report = progress_reporter(progress, total, lambda: 0)
+
+    root_zoom = subtree_root_zoom(grid, min_zoom, max_zoom)
+    lower_pending = any(not manifest.is_done(z, x, y) for z in range(min_zoom, root_zoom) for x, y in grid.tiles(z))
+    log(f"Zoom {max_zoom}: read from the source; zoom {min_zoom}-{max_zoom - 1}: built from child tiles ({resampling})\n")
+
+    roots = list(grid.tiles(root_zoom))
+    root_tiles = {}
+    if lower_pending:
+        for x, y in roots:
+            if manifest.is_done(root_zoom, x, y):
+                root = manifest.arrays.load(root_zoom, x, y)
+                if root is not None:
+                    root_tiles[(x, y)] = root
+    # Subtrees with tiles left to write, and finished ones whose root pixels were not kept
+    # (the run stopped between writing the root and keeping it): those are computed again
+    # without writing anything.
+    pending = [(x, y) for x, y in roots if not manifest.is_done(root_zoom, x, y) or (lower_pending and (x, y) not in root_tiles)]
+    pending_roots = set(pending)
+    finished_tiles = {}
+    for x, y in roots:
+        subtree = [(level, tx, ty) for level, tiles in subtree_tiles(grid, root_zoom, x, y, max_zoom).items() for tx, ty in tiles]
+        if manifest.is_done(root_zoom, x, y):
+            # All of it is on disk, though only the tiles with a file were adopted.
+            for tile in subtree:
+                manifest.mark_done(*tile)
+        else:
+            subtree = [tile for tile in subtree if manifest.is_done(*tile)]
+        if (x, y) in pending_roots:
+            finished_tiles[(x, y)] = subtree
+        summary["skipped"] += len(subtree)
+    subtree_size = {(x, y): sum(len(tiles) for tiles in subtree_tiles(grid, root_zoom, x, y, max_zoom).values()) for x, y in pending}
+    log(f"Zoom {root_zoom}-{max_zoom}: {len(pending)} of {len(roots)} subtrees to render\n")
+
+    last_checkpoint = time.monotonic()
+
+    def finished(result):
+        nonlocal last_checkpoint
+        (_, x, y), stats, root = result
+        manifest.empty.add(stats)
+        add_tile_stats(summary, stats)
+        for level, tiles in subtree_tiles(grid, root_zoom, x, y, max_zoom).items():
+            for tx, ty in tiles:
+                manifest.mark_done(level, tx, ty)
+        summary["rendered"] += subtree_size[(x, y)] - len(finished_tiles[(x, y)])
+        if root is not None:
+            manifest.arrays.save(root_zoom, x, y, root)
+            root_tiles[(x, y)] = root
+        if report is not None:
+            report(summary["rendered"] + summary["skipped"])
+        if time.monotonic() - last_checkpoint > CHECKPOINT_INTERVAL:
+            manifest.checkpoint()
+            last_checkpoint = time.monotonic()
+
+    args = (max_zoom, resampling, uniform_tiles, encoding, lower_pending)
+    if processes <= 1 or len(pending) <= 1:
+        for x, y in pending:
+            finished(render_subtree(input_file, output_dir, root_zoom, x, y, *args, finished_tiles[(x, y)]))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(render_subtree, input_file, output_dir, root_zoom, x, y, *args, finished_tiles[(x, y)]) for x, y in pending]
+            try:
+                for future in as_completed(futures):
+                    finished(future.result())
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                manifest.checkpoint()
+                raise
+    manifest.checkpoint()
+
+    # The levels below root_zoom, level by level from the tiles of the level above.
+    with ThreadPoolExecutor(max_workers=ENCODER_THREADS) as encoder:
+        writes = deque()
+        children = root_tiles
+        for z in range(root_zoom - 1, min_zoom - 1, -1):
+            if not lower_pending:
+                break
+            tiles = list(grid.tiles(z))
+            parents = {}
+            for i in range(0, len(tiles), REDUCTION_BATCH):
+                batch = tiles[i:i + REDUCTION_BATCH]
+                reduced = reduce_children(np.stack([child_block(grid, z, x, y, children) for x, y in batch]), resampling)
+                for (x, y), tile in zip(batch, reduced):
+                    parents[(x, y)] = tile
+                    if manifest.is_done(z, x, y):
+                        summary["skipped"] += 1
+                        continue
+                    store_tile(output_dir, z, x, y, tile, uniform_tiles, summary, encoding, encoder, writes)
+                    manifest.mark_done(z, x, y)
+                    summary["rendered"] += 1
+            children = parents
+            if report is not None:
+                report(summary["rendered"] + summary["skipped"])
+        for write in writes:
+            write.result()
+        manifest.empty.add(summary)
+    if not lower_pending:
+        summary["skipped"] += sum(grid.tile_count(z) for z in range(min_zoom, root_zoom))
+    manifest.checkpoint()
+    manifest.arrays.clear()
+
+    write_tilemapresource(output_dir, dataset, grid, min_zoom, max_zoom, encoding)
+    log(f"Tiles rendered: {summary['rendered']}, already finished: {summary['skipped']} (adopted from disk: {summary['adopted']})\n")
+    log_tile_stats(summary, uniform_tiles, log)
+    return summary
+
+
+def subtree_root_zoom(grid, min_zoom, max_zoom):
+    root_zoom = min_zoom
+    while root_zoom < max_zoom and grid.tile_count(root_zoom) < SUBTREE_COUNT:
+        root_zoom += 1
+    return root_zoom
+
+
+def log_tile_stats(summary, uniform_tiles, log):
+    if uniform_tiles != "write":
+        log(f"Uniform tiles shared: {summary['shared']}, empty tiles skipped: {summary['empty']}, bytes avoided: {summary['bytes_avoided']:,}\n")
+
+
+def changed_params(stored_params, params, ignore_keys=()):
+    return sorted(key for key in set(stored_params) | set(params) if stored_params.get(key) != params.get(key) and key not in ignore_keys)
+
+
+def pyramid_params(input_file, grid, min_zoom, max_zoom, resampling, encoding=PNG_ENCODING):
+    stat = os.stat(input_file)
+    return {
+        "input_file": os.path.abspath(input_file),
+        "input_size": stat.st_size,
+        "input_mtime": int(stat.st_mtime),
+        "raster_size": [grid.xsize, grid.ysize],
+        "levels": [min_zoom, max_zoom],
+        "resampling": resampling,
+        "tile_size": grid.tile_size,
+        "tile_format": encoding.describe(),
+    }
+
+
+# --- Incremental updates ---
+
+SOURCE_VERSION_KEYS = ("input_file", "input_size", "input_mtime")
+CHANGE_SCAN_ROWS = 256
+DIRTY_TILE_PADDING = 4  # tile pixels; covers the widest resampling kernel (lanczos)
+
+
+def find_changed_window(previous_file, input_file):
+    # Compares two versions of a raster strip by strip and returns the pixel window
+    # (col0, row0, col1, row1) enclosing every changed pixel, or None if nothing changed.
+    import numpy as np
+    from osgeo import gdal
+    gdal.UseExceptions()
+    previous = gdal.Open(previous_file, gdal.GA_ReadOnly)
+    current = gdal.Open(input_file, gdal.GA_ReadOnly)
+    if (previous.RasterXSize, previous.RasterYSize, previous.RasterCount) != (current.RasterXSize, current.RasterYSize, current.RasterCount) \
+            or previous.GetGeoTransform() != current.GetGeoTransform():
+        raise ValueError("The previous and the new source differ in size, band count or georeferencing; an incremental update is not possible, re-tile the whole map.")
+
+    xsize, ysize = current.RasterXSize, current.RasterYSize
+    bounds = None
+    for row in range(0, ysize, CHANGE_SCAN_ROWS):
+        rows = min(CHANGE_SCAN_ROWS, ysize - row)
+        changed = np.zeros((rows, xsize), dtype=bool)
+        for i in range(1, current.RasterCount + 1):
+            changed |= previous.GetRasterBand(i).ReadAsArray(0, row, xsize, rows) != current.GetRasterBand(i).ReadAsArray(0, row, xsize, rows)
+        if not changed.any():
+            continue
+        changed_rows = np.flatnonzero(changed.any(axis=1))
+        changed_cols = np.flatnonzero(changed.any(axis=0))
+        window = (int(changed_cols[0]), row + int(changed_rows[0]), int(changed_cols[-1]) + 1, row + int(changed_rows[-1]) + 1)
+        if bounds is None:
+            bounds = window
+        else:
+            bounds = (min(bounds[0], window[0]), min(bounds[1], window[1]), max(bounds[2], window[2]), max(bounds[3], window[3]))
+    return bounds
+
+
+def bbox_to_window(dataset, bbox):
+    # Georeferenced (minx, miny, maxx, maxy) -> clipped pixel window of a north-up raster.
+    gt = dataset.GetGeoTransform()
+    minx, miny, maxx, maxy = bbox
+    cols = sorted(((minx - gt[0]) / gt[1], (maxx - gt[0]) / gt[1]))
+    rows = sorted(((maxy - gt[3]) / gt[5], (miny - gt[3]) / gt[5]))
+    col0 = max(0, int(math.floor(cols[0])))
+    row0 = max(0, int(math.floor(rows[0])))
+    col1 = min(dataset.RasterXSize, int(math.ceil(cols[1])))
+    row1 = min(dataset.RasterYSize, int(math.ceil(rows[1])))
+    if col0 >= col1 or row0 >= row1:
+        return None
+    return col0, row0, col1, row1
+
+
+def dirty_tiles(grid, window, min_zoom, max_zoom):
+    # {zoom: set of tiles} touching the changed window at max_zoom, plus all their ancestors.
+    tiles = {max_zoom: grid.tiles_in_window(max_zoom, window, DIRTY_TILE_PADDING)}
+    for z in range(max_zoom - 1, min_zoom - 1, -1):
+        tiles[z] = {(x // 2, y // 2) for x, y in tiles[z + 1]} | grid.tiles_in_window(z, window, DIRTY_TILE_PADDING)
+    return tiles
+
+
+def update_pyramid(input_file, output_dir, levels="0-16", resampling="average", processes=1, previous_file=None, dirty_bbox=None, log=print, progress=None, uniform_tiles="write", encoding=PNG_ENCODING):
+    # Re-renders only the tiles of an existing pyramid touched by a change in the source.
+    # The change is given as the previous source version or as a georeferenced bounding box.
+    # With CHILD_REDUCTIONS resampling, the lower zooms were built from child tiles, so their
+    # dirty tiles are rebuilt the same way from the stored children, level by level. Lossy
+    # tiles decode to other pixels than were encoded, so those are read from the source.
+    min_zoom, max_zoom = parse_zoom_levels(levels)
+    if not os.path.isdir(output_dir):
+        raise ValueError(f"No previous pyramid found in {output_dir}.")
+    dataset = open_source(input_file)
+    check_source(dataset)
+    grid = TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+
+    if dirty_bbox is not None:
+        window = bbox_to_window(dataset, dirty_bbox)
+    elif previous_file:
+        log(f"Comparing {previous_file} with {input_file}...\n")
+        window = find_changed_window(previous_file, input_file)
+    else:
+        raise ValueError("An incremental update needs the previous source file or a dirty bounding box.")
+
+    summary = {"rendered": 0, "total": sum(grid.tile_count(z) for z in range(min_zoom, max_zoom + 1)), **new_tile_stats()}
+    if window is None:
+        log("No changed pixels found; the pyramid is up to date.\n")
+        return summary
+    log(f"Changed pixel window: columns {window[0]}-{window[2]}, rows {window[1]}-{window[3]}\n")
+
+    manifest = TileManifest(output_dir, grid, pyramid_params(input_file, grid, min_zoom, max_zoom, resampling, encoding))
+    manifest.load(ignore_keys=SOURCE_VERSION_KEYS)
+    tiles_by_zoom = dirty_tiles(grid, window, min_zoom, max_zoom)
+    report = progress_reporter(progress, sum(len(tiles) for tiles in tiles_by_zoom.values()), lambda: summary["rendered"])
+    for z, tiles in sorted(tiles_by_zoom.items(), reverse=True):
+        # A changed tile may no longer be empty; store_tile records it again if it still is.
+        manifest.empty.clear(z, tiles)
+        if z < max_zoom and resampling in CHILD_REDUCTIONS and not encoding.lossy:
+            log(f"Zoom {z}: rebuilding {len(tiles)} of {grid.tile_count(z)} tiles from their child tiles\n")
+            summary["rendered"] += reduce_stored_tiles(dataset, grid, output_dir, z, sorted(tiles), resampling, manifest, uniform_tiles, summary, encoding, report)
+            continue
+        log(f"Zoom {z}: re-rendering {len(tiles)} of {grid.tile_count(z)} tiles\n")
+        summary["rendered"] += render_tile_set(input_file, output_dir, z, sorted(tiles), resampling, processes, manifest, report, uniform_tiles, summary, encoding)
+    manifest.dirty = True
+    manifest.checkpoint()
+    log(f"Tiles re-rendered: {summary['rendered']} of {summary['total']}\n")
+    log_tile_stats(summary, uniform_tiles, log)
+    return summary
+
+
+def progress_reporter(progress, total, done_before):
+    # Adapts a fraction callback to render_tile_set's per-zoom count of rendered tiles.
+    if progress is None or total == 0:
+        return None
+    return lambda rendered: progress((done_before() + rendered) / total)
+
+
+def render_tile_set(input_file, output_dir, z, tiles, resampling, processes, manifest, on_rendered=None, uniform_tiles="write", stats=None, encoding=PNG_ENCODING):
+    # Renders tiles of zoom z, marking them done in the manifest; uniform tile counts are
+    # added to stats. Returns the number of tiles rendered.
+    chunks = [tiles[i:i + TILES_PER_TASK] for i in range(0, len(tiles), TILES_PER_TASK)]
+    last_checkpoint = time.monotonic()
+    rendered = 0
+
+    def finished(result):
+        nonlocal last_checkpoint, rendered
+        _, chunk, chunk_stats = result
+        manifest.empty.add(chunk_stats)
+        if stats is not None:
+            add_tile_stats(stats, chunk_stats)
+        for x, y in chunk:
+            manifest.mark_done(z, x, y)
+        rendered += len(chunk)
+        if on_rendered is not None:
+            on_rendered(rendered)
+        if time.monotonic() - last_checkpoint > CHECKPOINT_INTERVAL:
+            manifest.checkpoint()
+            last_checkpoint = time.monotonic()
+
+    if processes <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            finished(render_tiles(input_file, output_dir, z, chunk, resampling, uniform_tiles, encoding))
+        return rendered
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(render_tiles, input_file, output_dir, z, chunk, resampling, uniform_tiles, encoding) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                finished(future.result())
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            manifest.checkpoint()
+            raise
+    return rendered
+
+
+def write_tilemapresource(output_dir, dataset, grid, min_zoom, max_zoom, encoding=PNG_ENCODING):
+    # Minimal TMS description of the raster profile, as written by gdal2tiles.
+    gt = dataset.GetGeoTransform()
+    minx, maxy = gt[0], gt[3]
+    maxx = gt[0] + grid.xsize * gt[1]
+    miny = gt[3] + grid.ysize * gt[5]
+    tile_sets = "\n".join(
+        f'      <TileSet href="{z}" units-per-pixel="{abs(gt[1]) * 2 ** (grid.native_zoom - z):.14f}" order="{z}"/>'
+        for z in range(min_zoom, max_zoom + 1)
+    )
+    xml = f"""<?xml version="1.0" encoding="utf-8"?>
+<TileMap version="1.0.0" tilemapservice="http://tms.osgeo.org/1.0.0">
+  <Title>{os.path.basename(output_dir)}</Title>
+  <Abstract></Abstract>
+  <SRS></SRS>
+  <BoundingBox minx="{min(minx, maxx):.14f}" miny="{min(miny, maxy):.14f}" maxx="{max(minx, maxx):.14f}" maxy="{max(miny, maxy):.14f}"/>
+  <Origin x="{min(minx, maxx):.14f}" y="{min(miny, maxy):.14f}"/>
+  <TileFormat width="{grid.tile_size}" height="{grid.tile_size}" mime-type="{encoding.mime_type}" extension="{encoding.extension}"/>
+  <TileSets profile="raster">
+{tile_sets}
+  </TileSets>
+</TileMap>
+"""
+    write_file_atomic(os.path.join(output_dir, "tilemapresource.xml"), xml.encode("utf-8"))
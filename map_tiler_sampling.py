@@ -0,0 +1,311 @@
+import json
+import os
+import threading
+import time
+
+# --- Resource sampling ---
+# Samples the CPU use, memory (RSS), disk reads and writes, open file descriptors and state
+# of a stage's processes at a fixed interval, so a slow conversion shows whether it was
+# bound by the CPU, waiting for the disk or swapping. A tool stage is sampled as the tool's
+# process and every process it starts, a stage on the warm GDAL pool as the worker running
+# it. An action stage shares this process with whatever else it runs (e.g. other jobs of
+# the batch scheduler), so it is sampled as this process and all its workers and marked
+# process-wide.
+# psutil is used when it is installed; on Linux /proc is read directly otherwise. Each
+# sample is classified, and a stage's bottleneck is the state most of its samples were in.
+
+DEFAULT_INTERVAL = 0.5
+COLUMNS = ("t", "cpu", "rss", "read", "write", "fds", "procs", "iowait", "swap", "state")
+# A process counts as active in an interval when it used this share of a core.
+ACTIVE_CPU = 0.05
+# The active processes used at least this share of a core each on average.
+CPU_BOUND = 0.75
+# System-wide I/O wait, in cores, that marks an interval as waiting on the disk when the
+# stage's processes moved data in it (a process in disk sleep always does).
+IO_WAIT_CORES = 0.5
+SWAP_BYTES_PER_SECOND = 1024 * 1024
+STATES = ("cpu", "io", "swap", "wait")
+STATE_PHRASES = {"cpu": "CPU-bound", "io": "I/O wait", "swap": "swapping", "wait": "waiting (neither CPU nor disk)"}
+
+
+def samples_path_for(output_path):
+    return os.path.normpath(output_path) + ".samples.json"
+
+
+def descendants(root, parents):
+    # root and every process below it, from {pid: parent pid}.
+    children = {}
+    for pid, parent in parents.items():
+        children.setdefault(parent, []).append(pid)
+    tree, pending = [], [root]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, ()))
+    return tree
+
+
+class ProcReader:
+    # Linux /proc. Readings are (cpu seconds, rss, read bytes, write bytes, fds, in disk sleep).
+    def __init__(self):
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+
+    @staticmethod
+    def read(path):
+        with open(path, encoding="ascii", errors="replace") as f:
+            return f.read()
+
+    def stat(self, pid):
+        # (state, parent pid, cpu seconds, rss bytes); the command name may contain spaces.
+        text = self.read(f"/proc/{pid}/stat")
+        fields = text[text.rindex(")") + 2:].split()
+        return fields[0], int(fields[1]), (int(fields[11]) + int(fields[12])) / self.ticks, int(fields[21]) * self.page_size
+
+    def io(self, pid):
+        counters = {}
+        try:
+            for line in self.read(f"/proc/{pid}/io").splitlines():
+                key, _, value = line.partition(":")
+                counters[key] = int(value)
+        except (OSError, ValueError):  # another user's process, or no I/O accounting
+            pass
+        return counters.get("read_bytes", 0), counters.get("write_bytes", 0)
+
+    def processes(self, root):
+        stats = {}
+        for name in os.listdir("/proc"):
+            if name.isdigit():
+                try:
+                    stats[int(name)] = self.stat(name)
+                except (OSError, ValueError, IndexError):  # exited during the scan
+                    pass
+        readings = {}
+        for pid in descendants(root, {pid: stat[1] for pid, stat in stats.items()}):
+            if pid not in stats:
+                continue
+            state, _, cpu, rss = stats[pid]
+            try:
+                fds = len(os.listdir(f"/proc/{pid}/fd"))
+            except OSError:
+                fds = 0
+            readings[pid] = (cpu, rss, *self.io(pid), fds, state == "D")
+        return readings
+
+    def system(self):
+        # (CPU seconds, I/O wait seconds, bytes swapped in and out), all cores, since boot.
+        ticks = [int(value) for value in self.read("/proc/stat").split("\n", 1)[0].split()[1:9]]
+        swapped = 0
+        for line in self.read("/proc/vmstat").splitlines():
+            key, _, value = line.partition(" ")
+            if key in ("pswpin", "pswpout"):
+                swapped += int(value) * self.page_size
+        return sum(ticks) / self.ticks, ticks[4] / self.ticks, swapped
+
+
+class PsutilReader:
+    # The same readings through psutil (Linux, macOS and Windows).
+    def __init__(self, psutil):
+        self.psutil = psutil
+
+    def processes(self, root):
+        psutil = self.psutil
+        try:
+            root_process = psutil.Process(root)
+            tree = [root_process, *root_process.children(recursive=True)]
+        except psutil.Error:
+            return {}
+        readings = {}
+        for process in tree:
+            try:
+                with process.oneshot():
+                    times = process.cpu_times()
+                    io = process.io_counters() if hasattr(process, "io_counters") else None
+                    fds = process.num_fds() if hasattr(process, "num_fds") else process.num_handles()
+                    readings[process.pid] = (times.user + times.system, process.memory_info().rss,
+                                             io.read_bytes if io else 0, io.write_bytes if io else 0,
+                                             fds, process.status() == psutil.STATUS_DISK_SLEEP)
+            except psutil.Error:
+                pass
+        return readings
+
+    def system(self):
+        times = self.psutil.cpu_times()
+        # Guest time is already part of user time.
+        total = sum(times) - getattr(times, "guest", 0.0) - getattr(times, "guest_nice", 0.0)
+        swap = self.psutil.swap_memory()
+        return total, getattr(times, "iowait", 0.0), swap.sin + swap.sout
+
+
+def open_reader():
+    # PsutilReader, ProcReader, or None where neither is available.
+    try:
+        import psutil
+        return PsutilReader(psutil)
+    except ImportError:
+        pass
+    if os.path.isfile("/proc/stat"):
+        return ProcReader()
+    return None
+
+
+def classify(cpu, active, cpu_count, iowait, moved_bytes, disk_wait, swap_rate):
+    if swap_rate >= SWAP_BYTES_PER_SECOND:
+        return "swap"
+    if active and cpu / min(active, cpu_count) >= CPU_BOUND:
+        return "cpu"
+    if disk_wait or (iowait >= IO_WAIT_CORES and moved_bytes):
+        return "io"
+    return "wait"
+
+
+class StageSampler:
+    # Samples a process tree in a background thread from start() to stop(); rows follow COLUMNS.
+    # With process_wide, the tree is this process's; otherwise nothing is sampled until the
+    # stage's own process is attached.
+    def __init__(self, name, interval=DEFAULT_INTERVAL, reader=None, process_wide=True):
+        self.name = name
+        self.interval = max(0.05, float(interval))
+        self.reader = reader or open_reader()
+        self.cpu_count = os.cpu_count() or 1
+        self.rows = []
+        self.process_wide = process_wide
+        self._pid = os.getpid() if process_wide else None
+        # Readings a process's deltas start from when it was attached after it started.
+        self._baseline = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        # Readings of the previous sample, for the per-interval deltas.
+        self._processes = None
+        self._system = None
+        self._time = None
+
+    def start(self):
+        self._started = time.monotonic()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name=f"sampler {self.name}", daemon=True)
+        self._thread.start()
+
+    def attach(self, pid, new_process=True):
+        # Follows pid instead of this process: the tool just started, or (not new_process) a
+        # pool worker whose CPU time and I/O so far belong to earlier tasks.
+        try:
+            baseline = {} if new_process else self.reader.processes(pid)
+        except OSError:
+            baseline = {}
+        with self._lock:
+            self._pid = pid
+            self._baseline = baseline
+            self.process_wide = False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.summary()
+
+    def sample(self):
+        now = time.monotonic()
+        with self._lock:
+            root = self._pid
+            baseline, self._baseline = self._baseline, {}
+        try:
+            processes = self.reader.processes(root) if root is not None else {}
+            system = self.reader.system()
+        except OSError:
+            return
+        previous, previous_system, previous_time = self._processes, self._system, self._time
+        self._processes, self._system, self._time = processes, system, now
+        if previous is None or root is None or now <= previous_time:
+            return
+        elapsed = now - previous_time
+
+        # Processes that appeared since the last sample count from zero (or from their
+        # baseline); those that exited in between lose their last interval.
+        cpu = read_bytes = write_bytes = 0
+        active = 0
+        for pid, reading in processes.items():
+            before = previous.get(pid) or baseline.get(pid) or (0, 0, 0, 0, 0, False)
+            process_cpu = max(0.0, reading[0] - before[0])
+            cpu += process_cpu
+            active += process_cpu >= ACTIVE_CPU * elapsed
+            read_bytes += max(0, reading[2] - before[2])
+            write_bytes += max(0, reading[3] - before[3])
+        cpu /= elapsed
+        iowait = max(0.0, system[1] - previous_system[1]) / elapsed
+        swapped = max(0, system[2] - previous_system[2])
+        disk_wait = any(reading[5] for reading in processes.values())
+        state = classify(cpu, active, self.cpu_count, iowait, read_bytes + write_bytes, disk_wait, swapped / elapsed)
+        self.rows.append([round(now - self._started, 2), round(cpu, 2), sum(reading[1] for reading in processes.values()),
+                          read_bytes, write_bytes, sum(reading[4] for reading in processes.values()), len(processes),
+                          round(iowait, 2), swapped, state])
+
+    def summary(self):
+        # Share of samples per state and totals, or None when the stage ended before the first interval.
+        rows = self.rows
+        if not rows:
+            return None
+        states = {state: round(sum(row[-1] == state for row in rows) / len(rows), 3) for state in STATES}
+        return {
+            "samples": len(rows),
+            "interval": self.interval,
+            "states": states,
+            "bottleneck": max(STATES, key=states.get),
+            "mean_cpu": round(sum(row[1] for row in rows) / len(rows), 2),
+            "peak_rss": max(row[2] for row in rows),
+            "read_bytes": sum(row[3] for row in rows),
+            "write_bytes": sum(row[4] for row in rows),
+            "max_fds": max(row[5] for row in rows),
+            "max_processes": max(row[6] for row in rows),
+            "swap_bytes": sum(row[8] for row in rows),
+            "process_wide": self.process_wide,
+        }
+
+
+def scope_note(summary):
+    # Marks numbers that include everything else this process ran at the same time.
+    return " [process-wide: includes any other job running at the same time]" if summary.get("process_wide") else ""
+
+
+def describe_stage(name, summary):
+    if summary is None:
+        return f"{name}: too short to sample"
+    bottleneck = summary["bottleneck"]
+    return (f"{summary['states'][bottleneck]:.0%} of time {STATE_PHRASES[bottleneck]} in {name} "
+            f"(mean CPU {summary['mean_cpu']:.2f} cores, peak RSS {summary['peak_rss'] / 1024 ** 2:,.0f} MB, "
+            f"read {summary['read_bytes'] / 1024 ** 2:,.0f} MB, written {summary['write_bytes'] / 1024 ** 2:,.0f} MB, "
+            f"up to {summary['max_fds']} open files){scope_note(summary)}")
+
+
+def describe_run(stages):
+    # Summary lines for the log: every sampled stage, then the bottleneck of the slowest one.
+    sampled = [stage for stage in stages if stage.resources is not None]
+    lines = [describe_stage(stage.name, stage.resources) for stage in stages if stage.returncode is not None]
+    if sampled:
+        slowest = max(sampled, key=lambda stage: stage.wall_time)
+        total = sum(stage.wall_time for stage in stages) or 1.0
+        bottleneck = slowest.resources["bottleneck"]
+        lines.append(f"Bottleneck: {slowest.resources['states'][bottleneck]:.0%} of time {STATE_PHRASES[bottleneck]} in "
+                     f"{slowest.name} ({slowest.wall_time / total:.0%} of the run){scope_note(slowest.resources)}")
+    return lines
+
+
+def write_samples(path, stages, interval):
+    # The time series of every sampled stage, one compact row per sample.
+    series = {
+        "interval": interval,
+        "columns": list(COLUMNS),
+        "stages": [{"name": stage.name, "wall_time": round(stage.wall_time, 3), "summary": stage.resources, "rows": stage.samples}
+                   for stage in stages if stage.samples is not None],
+    }
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(series, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return path
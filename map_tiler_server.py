@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import map_tiler_pyramid as pyramid
+
+# --- On-demand tile server ---
+# Serves z/x/y tiles straight from a GeoTIFF (ideally one with internal overviews, as written
+# by the "overviews" mode) instead of pre-rendering the whole pyramid. Each request reads only
+# the tile's source window; GDAL picks the overview level matching the tile's zoom by itself.
+# Encoded tiles are kept in a bounded in-memory LRU, optionally backed by an on-disk cache.
+# The tile layout is that of the tiles mode (gdal2tiles -p raster); rows are TMS (y=0 at the
+# bottom) under /{z}/{x}/{y}.png and XYZ (y=0 at the top) under /xyz/{z}/{x}/{y}.png (with
+# the extension of the chosen tile format: .png, .jpg or .webp).
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+TILE_URL = re.compile(r"^/(xyz/)?(\d+)/(\d+)/(\d+)\.(\w+)$")
+
+
+class TileCache:
+    # LRU of encoded tiles bounded by their total size, with an optional disk tier below it.
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, disk_dir="", extension=pyramid.TILE_EXTENSION):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.extension = extension
+        self._tiles = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return data
+        if self.disk_dir:
+            try:
+                with open(pyramid.tile_path(self.disk_dir, *key, self.extension), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, data)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self.disk_dir:
+            path = pyramid.tile_path(self.disk_dir, *key, self.extension)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pyramid.write_file_atomic(path, data)
+
+    def _remember(self, key, data):
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._tiles[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"tiles": len(self._tiles), "bytes": self._bytes, "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+class TileSource:
+    # Renders tiles of one raster. GDAL datasets must not be shared between threads, so every
+    # worker thread opens its own handle.
+    def __init__(self, input_file, resampling="average", encoding=pyramid.PNG_ENCODING):
+        from osgeo import gdal
+        gdal.UseExceptions()
+        self.input_file = input_file
+        self.resampling = resampling
+        self.encoding = encoding
+        dataset = gdal.Open(input_file, gdal.GA_ReadOnly)
+        pyramid.check_source(dataset)
+        self.grid = pyramid.TileGrid(dataset.RasterXSize, dataset.RasterYSize)
+        self.overview_count = dataset.GetRasterBand(1).GetOverviewCount()
+        self.sheets = pyramid.sheet_index(input_file, dataset)
+        self._local = threading.local()
+
+    def dataset(self):
+        from osgeo import gdal
+        dataset = getattr(self._local, "dataset", None)
+        if dataset is None:
+            dataset = gdal.Open(self.input_file, gdal.GA_ReadOnly)
+            self._local.dataset = dataset
+        return dataset
+
+    def has_tile(self, z, x, y):
+        if z < 0 or z > self.grid.native_zoom:
+            return False
+        columns, rows = self.grid.tile_counts(z)
+        return 0 <= x < columns and 0 <= y < rows
+
+    def render(self, z, x, y):
+        return pyramid.encode_tile(pyramid.read_tile_array(self.dataset(), self.grid, z, x, y, self.resampling, self.sheets), self.encoding)
+
+    def disk_cache_key(self):
+        # Separates the disk cache of different source versions and settings.
+        stat = os.stat(self.input_file)
+        text = f"{os.path.abspath(self.input_file)}|{stat.st_size}|{stat.st_mtime_ns}|{self.resampling}|{self.encoding.describe()}"
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class PooledHTTPServer(HTTPServer):
+    # Handles requests on a fixed pool of worker threads (instead of a thread per request),
+    # which also bounds the number of open GDAL dataset handles.
+    def __init__(self, address, handler, workers):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile-worker")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    server_version = "MapTilerServer/1.0"
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path in ("/", "/metadata.json"):
+            self.send_bytes(200, "application/json", json.dumps(self.server.metadata, indent=2).encode("utf-8"))
+            return
+        match = TILE_URL.match(path)
+        if not match:
+            self.send_error(404, "Unknown path")
+            return
+        xyz, z, x, y = match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4))
+        source = self.server.source
+        if match.group(5) != source.encoding.extension:
+            self.send_error(404, f"Tiles are served as .{source.encoding.extension}")
+            return
+        if xyz and source.has_tile(z, x, 0):
+            y = source.grid.tile_counts(z)[1] - 1 - y
+        if not source.has_tile(z, x, y):
+            self.send_error(404, "Tile outside the raster")
+            return
+
+        cache = self.server.cache
+        data = cache.get((z, x, y))
+        if data is None:
+            try:
+                data = source.render(z, x, y)
+            except Exception as e:
+                self.send_error(500, f"Could not render tile: {e}")
+                return
+            cache.put((z, x, y), data)
+        self.send_bytes(200, source.encoding.mime_type, data)
+
+    def send_bytes(self, status, content_type, data):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "max-age=3600")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(input_file, host=DEFAULT_HOST, port=DEFAULT_PORT, resampling="average", workers=None, cache_bytes=DEFAULT_CACHE_BYTES, disk_cache_dir="", verbose=False, encoding=pyramid.PNG_ENCODING):
+    source = TileSource(input_file, resampling, encoding)
+    if disk_cache_dir:
+        disk_cache_dir = os.path.join(disk_cache_dir, source.disk_cache_key())
+    server = PooledHTTPServer((host, port), TileRequestHandler, workers or os.cpu_count() or 1)
+    server.source = source
+    server.cache = TileCache(cache_bytes, disk_cache_dir, encoding.extension)
+    server.verbose = verbose
+    base_url = f"http://{host}:{server.server_address[1]}"
+    server.metadata = {
+        "source": os.path.abspath(input_file),
+        "width": source.grid.xsize,
+        "height": source.grid.ysize,
+        "tile_size": source.grid.tile_size,
+        "minzoom": 0,
+        "maxzoom": source.grid.native_zoom,
+        "overviews": source.overview_count,
+        "format": encoding.describe(),
+        "tms": base_url + "/{z}/{x}/{y}." + encoding.extension,
+        "xyz": base_url + "/xyz/{z}/{x}/{y}." + encoding.extension,
+    }
+    return server
+
+
+def serve(input_file, host=DEFAULT_HOST, port=DEFAULT_PORT, resampling="average", workers=None, cache_bytes=DEFAULT_CACHE_BYTES, disk_cache_dir="", verbose=False, log=print, encoding=pyramid.PNG_ENCODING):
+    # Runs until interrupted (Ctrl+C).
+    server = create_server(input_file, host, port, resampling, workers, cache_bytes, disk_cache_dir, verbose, encoding)
+    if not server.source.overview_count:
+        log("[WARNING] The input has no overviews; low zoom levels read the full resolution data. Build them first with the overviews mode.\n")
+    log(f"Serving {input_file} (zoom 0-{server.source.grid.native_zoom})\n")
+    log(f"  TMS tiles: {server.metadata['tms']}\n  XYZ tiles: {server.metadata['xyz']}\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log(f"Tile cache: {json.dumps(server.cache.stats())}\n")
@@ -0,0 +1,283 @@
+import math
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# --- SRTMHGT cell splitter ---
+# An .hgt file holds exactly one 1x1 degree cell, named after its south-west corner
+# (e.g. N32E034.hgt). A larger DTM is split into every cell it covers: each cell is warped
+# onto the standard SRTM grid in EPSG:4326 and written by the SRTMHGT driver, one cell per
+# worker process. osgeo and numpy are imported inside the functions, as in map_tiler_pyramid.
+#
+# Every cell goes through the same preprocessing, streamed in blocks of rows so memory
+# stays under a fixed cap whatever the size of the DTM: GDAL's warper reprojects the DTM
+# onto the cell grid on demand (reading the source a window at a time), then each block
+# optionally has its voids filled, is rounded to whole metres and clamped to the Int16 range.
+# Unless a resolution is given, a DTM that already has 1201x1201 or 3601x3601 samples
+# keeps its grid; any other DTM is warped to 3 arc-seconds.
+
+# Arc-seconds -> samples per cell edge. Neighbouring cells share their edge rows/columns.
+SRTM_GRID_SIZES = {3: 1201, 1: 3601}
+DEFAULT_RESOLUTION = 3
+HGT_NODATA = -32768
+# Points sampled along each edge of the source when projecting its footprint to lat/lon.
+FOOTPRINT_EDGE_POINTS = 21
+# SRTM samples sit on the degree lines, so an .hgt footprint reaches half a sample into its
+# neighbours; overlaps up to half a 3 arc-second sample (in degrees) do not count as covering them.
+EDGE_TOLERANCE = 0.5 / 1200
+# Bounds within this many degrees of a degree line count as on it, so the rounding error of
+# the footprint and the tolerance never tips a cell edge into the neighbouring cell.
+EDGE_EPSILON = 1e-9
+# Elevations are clamped to the Int16 range; -32768 is reserved for voids.
+HGT_MIN, HGT_MAX = -32767, 32767
+# Voids are filled from the nearest data to their left and right and above and below when
+# both sides are at most this many samples away; larger holes (and areas outside the DTM)
+# stay voids. Blocks are read with this many extra rows above and below.
+VOID_FILL_DISTANCE = 32
+DEFAULT_MEMORY_MB = 256
+# Working memory per cell sample of a block (the float block plus the fill's temporaries).
+BYTES_PER_SAMPLE = 96
+
+
+def cell_name(lat, lon):
+    return f"{'N' if lat >= 0 else 'S'}{abs(lat):02d}{'E' if lon >= 0 else 'W'}{abs(lon):03d}"
+
+
+def source_bounds_wgs84(dataset):
+    # (min_lon, min_lat, max_lon, max_lat) of the dataset's footprint.
+    from osgeo import osr
+    gt = dataset.GetGeoTransform()
+    width, height = dataset.RasterXSize, dataset.RasterYSize
+    steps = [i / (FOOTPRINT_EDGE_POINTS - 1) for i in range(FOOTPRINT_EDGE_POINTS)]
+    pixels = [(s * width, 0) for s in steps] + [(s * width, height) for s in steps]
+    pixels += [(0, s * height) for s in steps] + [(width, s * height) for s in steps]
+    points = [(gt[0] + px * gt[1] + py * gt[2], gt[3] + px * gt[4] + py * gt[5]) for px, py in pixels]
+
+    source_srs = dataset.GetSpatialRef()
+    if source_srs is None:
+        raise ValueError("The input DTM has no coordinate system; SRTMHGT cells need georeferenced input.")
+    wgs84 = osr.SpatialReference()
+    wgs84.ImportFromEPSG(4326)
+    if not source_srs.IsSame(wgs84):
+        for srs in (source_srs, wgs84):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        transform = osr.CoordinateTransformation(source_srs, wgs84)
+        points = [transform.TransformPoint(x, y)[:2] for x, y in points]
+    lons = [x for x, _ in points]
+    lats = [y for _, y in points]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def covered_cells(input_file):
+    # [(lat, lon), ...] of the south-west corners of every cell the input overlaps.
+    from osgeo import gdal
+    gdal.UseExceptions()
+    dataset = gdal.Open(input_file, gdal.GA_ReadOnly)
+    return cells_in_bounds(*source_bounds_wgs84(dataset))
+
+
+def cell_range(low, high):
+    # Degree cells [first, last + 1) that the span low..high reaches into. A span ending on a
+    # degree line, or past it by at most EDGE_TOLERANCE, does not reach into the next cell.
+    first = math.floor(low + EDGE_TOLERANCE + EDGE_EPSILON)
+    end = math.ceil(high - EDGE_TOLERANCE - EDGE_EPSILON)
+    return range(first, max(first + 1, end))
+
+
+def cells_in_bounds(min_lon, min_lat, max_lon, max_lat):
+    return [(lat, lon) for lat in cell_range(min_lat, max_lat) for lon in cell_range(min_lon, max_lon)
+            if -90 <= lat < 90 and -180 <= lon < 180]
+
+
+def native_resolution(input_file):
+    # The resolution whose cell size the input already has, or None.
+    from osgeo import gdal
+    gdal.UseExceptions()
+    dataset = gdal.Open(input_file, gdal.GA_ReadOnly)
+    if dataset.RasterXSize != dataset.RasterYSize:
+        return None
+    return next((resolution for resolution, size in SRTM_GRID_SIZES.items() if size == dataset.RasterXSize), None)
+
+
+def resolve_resolution(input_file, resolution):
+    # None picks the input's own grid, or DEFAULT_RESOLUTION for any other size.
+    if resolution is None:
+        resolution = native_resolution(input_file) or DEFAULT_RESOLUTION
+    if resolution not in SRTM_GRID_SIZES:
+        raise ValueError(f"SRTMHGT resolution must be one of {sorted(SRTM_GRID_SIZES)} arc-seconds.")
+    return resolution
+
+
+def nearest_valid(values, valid, axis, reverse):
+    # For every sample, the value of and distance to the nearest valid sample before it
+    # along axis (after it when reverse); distance is inf where there is none.
+    import numpy as np
+    values = np.moveaxis(values, axis, -1)
+    valid = np.moveaxis(valid, axis, -1)
+    if reverse:
+        values, valid = values[..., ::-1], valid[..., ::-1]
+    positions = np.arange(values.shape[-1])
+    index = np.maximum.accumulate(np.where(valid, positions, -1), axis=-1)
+    distance = np.where(index >= 0, positions - index, np.inf).astype(np.float32)
+    nearest = np.take_along_axis(values, np.maximum(index, 0), axis=-1)
+    if reverse:
+        nearest, distance = nearest[..., ::-1], distance[..., ::-1]
+    return np.moveaxis(nearest, -1, axis), np.moveaxis(distance, -1, axis)
+
+
+def fill_voids(values, valid, max_distance=VOID_FILL_DISTANCE):
+    # Fills each void from the nearest valid samples on both sides of it, along the row and
+    # along the column, weighted by inverse distance. Only voids enclosed on at least one
+    # axis within max_distance are filled, so the DTM's outline is not extended.
+    # Returns (values, valid) with the filled samples.
+    import numpy as np
+    total = np.zeros(values.shape, dtype=np.float32)
+    weights = np.zeros(values.shape, dtype=np.float32)
+    voids = ~valid
+    for axis in (0, 1):
+        before, before_distance = nearest_valid(values, valid, axis, reverse=False)
+        after, after_distance = nearest_valid(values, valid, axis, reverse=True)
+        enclosed = voids & (before_distance <= max_distance) & (after_distance <= max_distance)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            before_weight = np.where(enclosed, 1.0 / before_distance, 0).astype(np.float32)
+            after_weight = np.where(enclosed, 1.0 / after_distance, 0).astype(np.float32)
+        total += np.where(enclosed, before * before_weight + after * after_weight, 0)
+        weights += before_weight + after_weight
+    filled = voids & (weights > 0)
+    values = values.copy()
+    values[filled] = total[filled] / weights[filled]
+    return values, valid | filled
+
+
+def preprocess_cell(input_file, lat, lon, grid_size, resampling="bilinear", fill=False, memory_mb=DEFAULT_MEMORY_MB, progress=None):
+    # Warps the DTM onto the SRTM grid of one cell and returns it as an Int16 MEM dataset
+    # ready for the SRTMHGT driver, or None when the cell holds no data.
+    import numpy as np
+    from osgeo import gdal
+    gdal.UseExceptions()
+    memory = max(16, int(memory_mb)) * 1024 * 1024
+
+    # SRTM samples sit on the degree lines, so the cell's pixels extend half a sample past them.
+    half_pixel = 0.5 / (grid_size - 1)
+    source = gdal.Open(input_file, gdal.GA_ReadOnly)
+    source_nodata = source.GetRasterBand(1).GetNoDataValue()
+    # A virtual warped dataset: reading a block warps just that block from the source.
+    warped = gdal.Warp(
+        "", source, format="VRT",
+        outputBounds=(lon - half_pixel, lat - half_pixel, lon + 1 + half_pixel, lat + 1 + half_pixel),
+        width=grid_size, height=grid_size, dstSRS="EPSG:4326",
+        outputType=gdal.GDT_Float32, resampleAlg=resampling,
+        srcNodata=source_nodata, dstNodata=HGT_NODATA, warpMemoryLimit=memory // 4,
+    )
+    warped_band = warped.GetRasterBand(1)
+    cell = gdal.GetDriverByName("MEM").Create("", grid_size, grid_size, 1, gdal.GDT_Int16)
+    cell.SetGeoTransform(warped.GetGeoTransform())
+    cell.SetProjection(warped.GetProjection())
+    cell_band = cell.GetRasterBand(1)
+    cell_band.SetNoDataValue(HGT_NODATA)
+
+    halo = VOID_FILL_DISTANCE if fill else 0
+    block_rows = max(VOID_FILL_DISTANCE, memory // 2 // (grid_size * BYTES_PER_SAMPLE) - 2 * halo)
+    has_data = False
+    for row in range(0, grid_size, block_rows):
+        rows = min(block_rows, grid_size - row)
+        top, bottom = max(0, row - halo), min(grid_size, row + rows + halo)
+        values = warped_band.ReadAsArray(0, top, grid_size, bottom - top).astype(np.float32)
+        valid = np.isfinite(values) & (values != HGT_NODATA)
+        if fill and not valid.all():
+            values, valid = fill_voids(values, valid)
+        values, valid = values[row - top:row - top + rows], valid[row - top:row - top + rows]
+        block = np.clip(np.rint(np.where(valid, values, 0)), HGT_MIN, HGT_MAX).astype(np.int16)
+        block[~valid] = HGT_NODATA
+        has_data = has_data or bool(valid.any())
+        cell_band.WriteArray(block, 0, row)
+        if progress is not None:
+            progress((row + rows) / grid_size)
+    return cell if has_data else None
+
+
+def write_hgt(cell, output_path):
+    # The driver derives the cell from the file name, so write under the final name in a
+    # private directory and move the finished file into place.
+    from osgeo import gdal
+    name = os.path.basename(output_path)
+    temp_dir = os.path.join(os.path.dirname(os.path.abspath(output_path)), f".tmp-{os.getpid()}")
+    os.makedirs(temp_dir, exist_ok=True)
+    try:
+        gdal.GetDriverByName("SRTMHGT").CreateCopy(os.path.join(temp_dir, name), cell)
+        os.replace(os.path.join(temp_dir, name), output_path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def write_cell(input_file, output_dir, lat, lon, grid_size, resampling, fill=False, memory_mb=DEFAULT_MEMORY_MB):
+    # Worker task: preprocesses one cell and writes its .hgt. Returns the file name, or None
+    # when the cell holds no data.
+    cell = preprocess_cell(input_file, lat, lon, grid_size, resampling, fill, memory_mb)
+    if cell is None:
+        return None
+    name = cell_name(lat, lon) + ".hgt"
+    write_hgt(cell, os.path.join(output_dir, name))
+    return name
+
+
+def convert_to_hgt(input_file, output_path, resolution=None, resampling="bilinear", fill=False, memory_mb=DEFAULT_MEMORY_MB, log=print, progress=None):
+    # Writes a DTM that lies within one cell as a single .hgt file.
+    resolution = resolve_resolution(input_file, resolution)
+    cells = covered_cells(input_file)
+    if len(cells) != 1:
+        raise ValueError(f"The DTM covers {len(cells)} 1x1 degree cells, but an .hgt file holds one; use 'Split into 1x1 degree .hgt cells'.")
+    lat, lon = cells[0]
+    grid_size = SRTM_GRID_SIZES[resolution]
+    log(f"Preprocessing cell {cell_name(lat, lon)} ({grid_size}x{grid_size}, {'voids filled, ' if fill else ''}memory cap {memory_mb} MB)\n")
+    cell = preprocess_cell(input_file, lat, lon, grid_size, resampling, fill, memory_mb, progress)
+    if cell is None:
+        raise ValueError(f"The DTM holds no elevation data in cell {cell_name(lat, lon)}.")
+    write_hgt(cell, output_path)
+    log(f"{output_path} written\n")
+
+
+def split_to_hgt(input_file, output_dir, resolution=None, resampling="bilinear", processes=1, log=print, progress=None, fill=False, memory_mb=DEFAULT_MEMORY_MB):
+    # Writes one .hgt per covered cell into output_dir. Returns a summary dict.
+    resolution = resolve_resolution(input_file, resolution)
+    grid_size = SRTM_GRID_SIZES[resolution]
+    cells = covered_cells(input_file)
+    os.makedirs(output_dir, exist_ok=True)
+    log(f"Input covers {len(cells)} cell(s); writing {grid_size}x{grid_size} .hgt files to {output_dir}\n")
+
+    summary = {"written": 0, "empty": 0, "cells": len(cells)}
+    # The memory cap holds for the whole run, so it is shared by the workers.
+    workers = max(1, min(processes, len(cells)))
+    cell_memory_mb = max(16, memory_mb // workers)
+
+    def finished(lat, lon, name):
+        if name is None:
+            summary["empty"] += 1
+            log(f"{cell_name(lat, lon)}: no data, skipped\n")
+        else:
+            summary["written"] += 1
+            log(f"{name} written\n")
+        if progress is not None:
+            progress((summary["written"] + summary["empty"]) / len(cells))
+
+    try:
+        if processes <= 1 or len(cells) <= 1:
+            for lat, lon in cells:
+                finished(lat, lon, write_cell(input_file, output_dir, lat, lon, grid_size, resampling, fill, cell_memory_mb))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(write_cell, input_file, output_dir, lat, lon, grid_size, resampling, fill, cell_memory_mb): (lat, lon) for lat, lon in cells}
+                try:
+                    for future in as_completed(futures):
+                        finished(*futures[future], future.result())
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+    finally:
+        for entry in os.scandir(output_dir):
+            if entry.is_dir() and entry.name.startswith(".tmp-"):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    log(f"SRTMHGT cells written: {summary['written']}, skipped (no data): {summary['empty']}\n")
+    return summary
@@ -0,0 +1,249 @@
+import ctypes
+import json
+import os
+import subprocess
+from dataclasses import asdict, dataclass, field
+
+# --- GDAL tuning profiles ---
+# Picks the GDAL block cache size, worker thread count and GeoTIFF creation options for a
+# conversion from the input (size, data type, bands) and the host (RAM, cores). Named
+# profiles saved in PROFILES_FILE override the automatic choice field by field.
+# Everything here is stdlib; osgeo is used to inspect the input when it is installed,
+# otherwise the bundled gdalinfo is asked for its JSON description.
+
+PROFILES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tuning_profiles.json")
+# "auto" chooses the settings; "none" passes nothing but GDAL_DATA (the original behaviour).
+BUILTIN_PROFILES = ("auto", "none")
+
+MIN_CACHE_MB = 64
+MAX_CACHE_MB = 16384
+# inspect_input results by (path, size, mtime), so a file is only read once per process.
+_input_info_cache = {}
+
+BYTES_PER_SAMPLE = {"Byte": 1, "Int8": 1, "UInt16": 2, "Int16": 2, "UInt32": 4, "Int32": 4, "Float32": 4, "Float64": 8, "CInt16": 4, "CInt32": 8, "CFloat32": 8, "CFloat64": 16}
+
+
+@dataclass
+class TuningProfile:
+    name: str = "auto"
+    # GDAL_CACHEMAX in megabytes, for every GDAL process of the conversion.
+    cache_mb: int = None
+    # GDAL_NUM_THREADS: a number or "ALL_CPUS".
+    num_threads: str = None
+    # -co options for GeoTIFFs written by gdal_translate (the copy of the "overviews" mode).
+    creation_options: dict = field(default_factory=dict)
+    # Other GDAL configuration options, passed as environment variables (e.g. COMPRESS_OVERVIEW).
+    config_options: dict = field(default_factory=dict)
+
+    def environment(self):
+        env = dict(self.config_options)
+        if self.cache_mb:
+            env["GDAL_CACHEMAX"] = str(int(self.cache_mb))
+        if self.num_threads:
+            env["GDAL_NUM_THREADS"] = str(self.num_threads)
+        return env
+
+    def creation_args(self):
+        args = []
+        for key, value in self.creation_options.items():
+            args += ["-co", f"{key}={value}"]
+        return args
+
+    def describe(self):
+        parts = [f"{key}={value}" for key, value in self.environment().items()]
+        parts += [f"-co {key}={value}" for key, value in self.creation_options.items()]
+        return f"Tuning profile '{self.name}': " + (", ".join(parts) or "GDAL defaults")
+
+
+# --- Host and input inspection ---
+
+def host_memory_bytes():
+    # Total physical memory, or None when it cannot be determined.
+    if hasattr(os, "sysconf"):
+        try:
+            return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError):
+            return None
+    if os.name == "nt":
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullTotalPhys
+    return None
+
+
+def host_resources():
+    return {"cpu_count": os.cpu_count() or 1, "memory_bytes": host_memory_bytes()}
+
+
+def inspect_input(input_file, gdalinfo_path=None, env=None):
+    # {"file_bytes", "width", "height", "bands", "data_type", "geotransform"}; raster fields
+    # are None when neither the GDAL bindings nor gdalinfo can read the file.
+    stat = os.stat(input_file)
+    key = (os.path.abspath(input_file), stat.st_size, stat.st_mtime_ns)
+    if key not in _input_info_cache:
+        info = read_input_info(input_file, gdalinfo_path, env)
+        info["file_bytes"] = stat.st_size
+        if info["width"] is None:
+            return info  # not cached: gdalinfo may only be missing for now
+        _input_info_cache[key] = info
+    return dict(_input_info_cache[key])
+
+
+def read_input_info(input_file, gdalinfo_path=None, env=None):
+    info = {"file_bytes": None, "width": None, "height": None, "bands": None, "data_type": None, "geotransform": None}
+    try:
+        from osgeo import gdal
+        gdal.UseExceptions()
+        dataset = gdal.Open(input_file, gdal.GA_ReadOnly)
+        info.update(width=dataset.RasterXSize, height=dataset.RasterYSize, bands=dataset.RasterCount,
+                    data_type=gdal.GetDataTypeName(dataset.GetRasterBand(1).DataType),
+                    geotransform=list(dataset.GetGeoTransform(can_return_null=True) or []) or None)
+        return info
+    except ImportError:
+        pass
+    except RuntimeError:
+        return info
+    if gdalinfo_path:
+        try:
+            output = subprocess.run([gdalinfo_path, "-json", input_file], capture_output=True, env=env, timeout=60, check=True).stdout
+            description = json.loads(output)
+            bands = description.get("bands") or [{}]
+            info.update(width=description["size"][0], height=description["size"][1], bands=len(description.get("bands", [])),
+                        data_type=bands[0].get("type"), geotransform=description.get("geoTransform"))
+        except (OSError, ValueError, KeyError, subprocess.SubprocessError):
+            pass
+    return info
+
+
+def inspect_spec_input(spec, gdalinfo_path=None, env=None):
+    # Like inspect_input; a mosaic counts the bytes of all sheets and takes its band layout
+    # from the first one.
+    import map_tiler_mosaic
+    if spec.input_files:
+        sheets = list(spec.input_files)
+    elif os.path.isdir(spec.input_file):
+        sheets = map_tiler_mosaic.list_mosaic_sources(spec.input_file)
+    else:
+        return inspect_input(spec.input_file, gdalinfo_path, env)
+    if not sheets:
+        return {"file_bytes": 0, "width": None, "height": None, "bands": None, "data_type": None, "geotransform": None}
+    info = inspect_input(sheets[0], gdalinfo_path, env)
+    info.update(file_bytes=sum(os.path.getsize(sheet) for sheet in sheets), width=None, height=None, geotransform=None)
+    return info
+
+
+# --- Automatic choice ---
+
+def clamp_cache_mb(value_mb):
+    return int(max(MIN_CACHE_MB, min(MAX_CACHE_MB, value_mb)))
+
+
+def predictor_for(data_type):
+    # Horizontal differencing for integers, floating point predictor for floats.
+    if data_type in ("Float32", "Float64"):
+        return "3"
+    return "2"
+
+
+def auto_profile(spec, info, host):
+    cpu_count = host["cpu_count"]
+    memory_mb = (host["memory_bytes"] or 8 * 1024 ** 3) / 1024 ** 2
+    profile = TuningProfile("auto")
+
+    if spec.conversion_type == "tiles":
+        # Every tile worker is its own GDAL process with its own block cache: share a quarter
+        # of the RAM between them and leave the cores to the workers.
+        processes = int(spec.processes) if str(spec.processes).isdigit() else 1
+        profile.cache_mb = clamp_cache_mb(memory_mb * 0.25 / max(1, processes))
+        profile.num_threads = str(max(1, cpu_count // max(1, processes)))
+    elif spec.conversion_type == "overviews":
+        # gdaladdo re-reads the full resolution data once per level; a cache large enough to
+        # hold it (up to 40% of RAM) saves most of those reads.
+        raster_bytes = raster_size_bytes(info) or info["file_bytes"]
+        profile.cache_mb = clamp_cache_mb(min(memory_mb * 0.4, raster_bytes / 1024 ** 2 * 1.1))
+        profile.num_threads = "ALL_CPUS"
+        if spec.overview_mode == "copy":
+            predictor = predictor_for(info["data_type"])
+            profile.creation_options = {"TILED": "YES", "BLOCKXSIZE": "512", "BLOCKYSIZE": "512", "COMPRESS": "DEFLATE", "PREDICTOR": predictor, "BIGTIFF": "IF_SAFER", "NUM_THREADS": "ALL_CPUS"}
+            profile.config_options = {"COMPRESS_OVERVIEW": "DEFLATE", "PREDICTOR_OVERVIEW": predictor, "BIGTIFF_OVERVIEW": "IF_SAFER"}
+            if (info["bands"] or 1) > 1:
+                profile.creation_options["INTERLEAVE"] = "PIXEL"
+                profile.config_options["INTERLEAVE_OVERVIEW"] = "PIXEL"
+    else:
+        profile.cache_mb = clamp_cache_mb(memory_mb * 0.1)
+        profile.num_threads = "ALL_CPUS"
+    return profile
+
+
+def raster_size_bytes(info):
+    if not info["width"] or not info["height"]:
+        return None
+    return info["width"] * info["height"] * (info["bands"] or 1) * BYTES_PER_SAMPLE.get(info["data_type"], 1)
+
+
+# --- Saved profiles ---
+
+def load_profiles(path=PROFILES_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {name: TuningProfile(name=name, **{key: value for key, value in values.items() if key != "name"}) for name, values in data.items()}
+
+
+def save_profile(profile, path=PROFILES_FILE):
+    if profile.name in BUILTIN_PROFILES:
+        raise ValueError(f"'{profile.name}' is a built-in profile name.")
+    profiles = load_profiles(path)
+    profiles[profile.name] = profile
+    write_profiles(profiles, path)
+
+
+def delete_profile(name, path=PROFILES_FILE):
+    profiles = load_profiles(path)
+    if profiles.pop(name, None) is None:
+        raise ValueError(f"No saved tuning profile named '{name}'.")
+    write_profiles(profiles, path)
+
+
+def write_profiles(profiles, path):
+    data = {name: {key: value for key, value in asdict(profile).items() if key != "name"} for name, profile in sorted(profiles.items())}
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def profile_names(path=PROFILES_FILE):
+    try:
+        return list(BUILTIN_PROFILES) + sorted(load_profiles(path))
+    except (OSError, ValueError):
+        return list(BUILTIN_PROFILES)
+
+
+def resolve_profile(spec, gdalinfo_path=None, env=None, path=PROFILES_FILE):
+    # The profile for spec.tuning: None for "none", the automatic choice for "auto", and for a
+    # saved profile the automatic choice with the saved profile's settings on top.
+    if spec.tuning == "none":
+        return None
+    profile = auto_profile(spec, inspect_spec_input(spec, gdalinfo_path, env), host_resources())
+    if spec.tuning == "auto":
+        return profile
+    saved = load_profiles(path).get(spec.tuning)
+    if saved is None:
+        raise ValueError(f"No saved tuning profile named '{spec.tuning}'.")
+    profile.name = saved.name
+    profile.cache_mb = saved.cache_mb or profile.cache_mb
+    profile.num_threads = saved.num_threads or profile.num_threads
+    profile.creation_options.update(saved.creation_options)
+    profile.config_options.update(saved.config_options)
+    return profile
@@ -0,0 +1,185 @@
+import dataclasses
+import json
+import os
+import threading
+import time
+
+from map_tiler_jobs import Job, JobScheduler, run_job, RUNNING, DONE, FAILED
+
+# --- Watch folders ---
+# Polls one or more directories and converts every new map file that lands in them with a
+# fixed conversion spec, through the batch JobScheduler. A file is only picked up once its
+# size and modification time have stayed the same for `settle` seconds, so files that are
+# still being copied in are left alone. Finished files are recorded in a JSON state file
+# (keyed by path, size and modification time), so a restart does not redo them and a file
+# that is replaced by a new version is converted again.
+
+WATCH_EXTENSIONS = ('.tif', '.tiff', '.jpg', '.jpeg', '.png', '.jp2')
+# Outputs of the conversions themselves, written next to the input by default.
+OUTPUT_SUFFIXES = ('_with_overviews.tif', '_cog.tif')
+DEFAULT_INTERVAL = 5.0
+DEFAULT_SETTLE = 10.0
+
+
+def default_state_file(directories, spec):
+    base_dir = spec.output_dir or directories[0]
+    return os.path.join(base_dir, f".map_tiler_watch_{spec.conversion_type}.json")
+
+
+class ProcessedRecord:
+    # Persistent {path: {"size", "mtime_ns", "state", "output_path", "message", "finished_at"}}.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def matches(self, path, signature, include_failed=True):
+        # True when this version of the file was already converted (or failed, if include_failed).
+        with self._lock:
+            entry = self.entries.get(path)
+        if entry is None or (entry["size"], entry["mtime_ns"]) != signature:
+            return False
+        return entry["state"] == DONE or include_failed
+
+    def is_output(self, path):
+        with self._lock:
+            return any(entry.get("output_path") == path for entry in self.entries.values())
+
+    def add(self, path, signature, job):
+        with self._lock:
+            self.entries[path] = {"size": signature[0], "mtime_ns": signature[1], "state": job.state,
+                                  "output_path": os.path.abspath(job.output_path) if job.output_path else "",
+                                  "message": job.message, "finished_at": job.finished_at}
+            self._write()
+
+    def _write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class FolderWatcher:
+    def __init__(self, directories, spec, state_file="", max_jobs=2, interval=DEFAULT_INTERVAL, settle=DEFAULT_SETTLE,
+                 retry_failed=False, write_report=True, log=print, tool_log=None):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.spec = spec
+        self.interval = max(0.1, float(interval))
+        self.settle = max(0.0, float(settle))
+        self.retry_failed = retry_failed
+        self.write_report = write_report
+        self.log = log
+        # Receives the tools' output, prefixed with the file name; None drops it.
+        self.tool_log = tool_log
+        self.record = ProcessedRecord(state_file or default_state_file(self.directories, spec))
+        self.scheduler = JobScheduler(self.run_job, max_jobs=max_jobs, on_change=self.on_job_change)
+
+        # path -> (signature, time first seen with that signature)
+        self._candidates = {}
+        # path -> signature of the version queued or running
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def list_files(self):
+        files = []
+        for directory in self.directories:
+            try:
+                names = os.listdir(directory)
+            except OSError as e:
+                self.log(f"Cannot read {directory}: {e}\n")
+                continue
+            for name in names:
+                lower = name.lower()
+                if name.startswith(".") or not lower.endswith(WATCH_EXTENSIONS) or lower.endswith(OUTPUT_SUFFIXES):
+                    continue
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    files.append(path)
+        return sorted(files)
+
+    def scan(self):
+        # One polling pass: queues every file that has settled and is not yet converted.
+        # Returns the number of jobs queued.
+        now = time.monotonic()
+        seen = set()
+        queued = 0
+        for path in self.list_files():
+            seen.add(path)
+            try:
+                signature = file_signature(path)
+            except OSError:  # deleted or renamed since the listing
+                continue
+            with self._lock:
+                if self._active.get(path) == signature:
+                    continue
+            if self.record.matches(path, signature, include_failed=not self.retry_failed) or self.record.is_output(path):
+                self._candidates.pop(path, None)
+                continue
+            previous = self._candidates.get(path)
+            if previous is None or previous[0] != signature:
+                self._candidates[path] = (signature, now)
+                continue
+            if now - previous[1] < self.settle:
+                continue
+            del self._candidates[path]
+            self.queue(path, signature)
+            queued += 1
+        for path in list(self._candidates):
+            if path not in seen:
+                del self._candidates[path]
+        return queued
+
+    def queue(self, path, signature):
+        spec = dataclasses.replace(self.spec, input_file=path)
+        job = Job(spec)
+        job.signature = signature
+        with self._lock:
+            self._active[path] = signature
+        self.log(f"Queued {path}\n")
+        self.scheduler.add(job)
+
+    def run_job(self, job):
+        name = os.path.basename(job.input_file)
+        tool_log = None if self.tool_log is None else (lambda text: self.tool_log(f"[{name}] {text}"))
+        return run_job(job, log=tool_log, write_report=self.write_report)
+
+    def on_job_change(self, job):
+        if job.state == RUNNING:
+            self.log(f"Converting {job.input_file}\n")
+        elif job.state in (DONE, FAILED):
+            self.record.add(job.input_file, job.signature, job)
+            with self._lock:
+                if self._active.get(job.input_file) == job.signature:
+                    del self._active[job.input_file]
+            status = "Done" if job.state == DONE else "FAILED"
+            self.log(f"{status} ({job.elapsed:.1f}s): {job.input_file}\n    {job.message}\n")
+
+    def run(self):
+        # Polls until stop() is called. Queued files are dropped; follow with wait_for_running()
+        # to let the running conversions finish.
+        self.log(f"Watching {', '.join(self.directories)} for {self.spec.conversion_type} "
+                 f"(state: {self.record.path}); stop with Ctrl+C\n")
+        self.scheduler.start()
+        try:
+            while not self._stop.is_set():
+                self.scan()
+                self._stop.wait(self.interval)
+        finally:
+            self.scheduler.stop()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_for_running(self):
+        while self.scheduler.counts()[RUNNING]:
+            time.sleep(0.2)
@@ -0,0 +1,86 @@
+import types
+
+import pytest
+
+import map_tiler_distributed as distributed
+import map_tiler_pyramid as pyramid
+
+
+@pytest.fixture
+def small_units(monkeypatch):
+    monkeypatch.setattr(distributed, "TARGET_UNITS", 20)
+    monkeypatch.setattr(distributed, "BLOCK_TILES", 2)
+
+
+def unit_tiles(grid, unit, max_zoom):
+    # (z, x, y) of every tile a unit writes.
+    if unit["kind"] == "subtree":
+        levels = pyramid.subtree_tiles(grid, unit["z"], unit["x"], unit["y"], max_zoom)
+        return {(z, x, y) for z, tiles in levels.items() for x, y in tiles}
+    return {(unit["z"], x, y) for x in range(unit["x0"], unit["x1"]) for y in range(unit["y0"], unit["y1"])}
+
+
+def test_every_tile_written_once(small_units):
+    grid = pyramid.TileGrid(1500, 1100)
+    units = distributed.plan_units(grid, 0, 4, "average")
+    written = [tile for unit in units for tile in unit_tiles(grid, unit, 4)]
+    assert len(written) == len(set(written)) == sum(grid.tile_count(z) for z in range(5))
+    assert sum(unit["tiles"] for unit in units) == len(written)
+
+
+def test_subtrees_root_at_first_zoom_with_enough_tiles(small_units):
+    grid = pyramid.TileGrid(1500, 1100)
+    units = distributed.plan_units(grid, 0, 4, "average")
+    subtrees = [unit for unit in units if unit["kind"] == "subtree"]
+    assert {unit["z"] for unit in subtrees} == {3}
+    assert len(subtrees) == grid.tile_count(3)
+    assert {unit["kind"] for unit in units if unit["kind"] != "subtree"} == {"reduce"}
+
+
+def test_reduce_units_wait_for_the_units_writing_their_children(small_units):
+    grid = pyramid.TileGrid(1500, 1100)
+    units = distributed.plan_units(grid, 0, 4, "average")
+    writers = {}
+    for unit in units:
+        for tile in unit_tiles(grid, unit, 4):
+            writers[tile] = unit["id"]
+    position = {unit["id"]: i for i, unit in enumerate(units)}
+    for unit in units:
+        if unit["kind"] != "reduce":
+            continue
+        children = {writers[(unit["z"] + 1, cx, cy)] for z, x, y in unit_tiles(grid, unit, 4) for cx, cy in pyramid.child_tiles(grid, z, x, y)}
+        assert set(unit["after"]) == children
+        assert all(position[unit_id] < position[unit["id"]] for unit_id in unit["after"])
+
+
+def test_other_resampling_plans_independent_blocks(small_units):
+    grid = pyramid.TileGrid(1500, 1100)
+    units = distributed.plan_units(grid, 0, 4, "bilinear")
+    assert {unit["kind"] for unit in units} == {"block"}
+    assert not any("after" in unit for unit in units)
+    assert sum(unit["tiles"] for unit in units) == sum(grid.tile_count(z) for z in range(5))
+
+
+def test_single_level_plans_blocks():
+    grid = pyramid.TileGrid(1500, 1100)
+    units = distributed.plan_units(grid, 4, 4, "average")
+    assert {unit["kind"] for unit in units} == {"block"}
+
+
+def test_subtree_tile_count():
+    grid = pyramid.TileGrid(1500, 1100)
+    # The top-right corner of zoom 3 has one partial column and row below it at zoom 4.
+    assert distributed.subtree_tile_count(grid, 3, 5, 4, 4) == 1 + 2
+    assert distributed.subtree_tile_count(grid, 3, 0, 0, 4) == 1 + 4
+
+
+def test_blocked_units_follow_failures(small_units):
+    grid = pyramid.TileGrid(1500, 1100)
+    units = distributed.plan_units(grid, 0, 4, "average")
+    failed = units[0]["id"]
+    state = types.SimpleNamespace(done=set(), given_up=lambda unit_id: unit_id == failed)
+    blocked = distributed.blocked_units(units, state)
+    assert failed in blocked
+    # Every reduce unit above the failed subtree, down to zoom 0.
+    assert "b0_0_0" in blocked
+    assert not any(unit["id"] in blocked for unit in units if unit["kind"] == "subtree" and unit["id"] != failed)
@@ -0,0 +1,76 @@
+import threading
+
+import map_tiler_log
+
+
+def test_drain_returns_text_in_order():
+    spool = map_tiler_log.LogSpool()
+    spool.write("one\n")
+    spool.write("two\n")
+    assert spool.drain() == "one\ntwo\n"
+    assert spool.drain() == ""
+
+
+def test_drain_is_bounded():
+    spool = map_tiler_log.LogSpool()
+    spool.write("a" * 10)
+    spool.write("b" * 10)
+    assert spool.drain(max_chars=15) == "a" * 10 + "b" * 5
+    assert spool.drain(max_chars=15) == "b" * 5
+
+
+def test_pending_text_is_bounded():
+    spool = map_tiler_log.LogSpool(max_pending_chars=100)
+    for i in range(50):
+        spool.write(f"line {i:04d}\n")  # 10 chars each
+    assert spool.dropped_lines == 40
+    text = spool.drain()
+    assert text.startswith("[... 40 lines not shown ...]\n")
+    assert text.endswith("line 0049\n")
+    assert text.count("\n") == 11
+    # The note is only given once per batch of dropped lines.
+    spool.write("more\n")
+    assert spool.drain() == "more\n"
+    assert spool.dropped_lines == 40
+
+
+def test_a_single_long_chunk_is_kept():
+    spool = map_tiler_log.LogSpool(max_pending_chars=10)
+    spool.write("x" * 50)
+    assert spool.dropped_lines == 0
+    assert spool.drain(max_chars=100) == "x" * 50
+
+
+def test_clear_discards_pending_text():
+    spool = map_tiler_log.LogSpool(max_pending_chars=10)
+    spool.write("0123456789\n")
+    spool.write("abc\n")
+    spool.clear()
+    assert spool.drain() == ""
+
+
+def test_log_file_gets_everything(tmp_path):
+    log_path = tmp_path / "logs" / "run.log"
+    spool = map_tiler_log.LogSpool(max_pending_chars=20)
+    spool.open(str(log_path))
+    for i in range(10):
+        spool.write(f"line {i}\n")
+    spool.close()
+    assert log_path.read_text(encoding="utf-8") == "".join(f"line {i}\n" for i in range(10))
+    assert str(log_path) in spool.drain()
+
+
+def test_concurrent_writers():
+    spool = map_tiler_log.LogSpool()
+    writers = [threading.Thread(target=lambda: [spool.write("x\n") for _ in range(1000)]) for _ in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    text = ""
+    while True:
+        chunk = spool.drain(max_chars=1000)
+        if not chunk:
+            break
+        text += chunk
+    assert text == "x\n" * 4000
@@ -0,0 +1,80 @@
+import pytest
+
+import map_tiler_progress as progress
+
+
+def test_parses_gdal_progress():
+    parser = progress.ProgressParser()
+    assert parser.feed("Input file size is 100, 100\n0...10...20")
+    assert parser.fraction == pytest.approx(0.1)
+    assert parser.feed("...30...40...50...60...70...80...90...100 - done.\n")
+    assert parser.fraction == 1.0
+
+
+def test_number_split_across_chunks():
+    parser = progress.ProgressParser()
+    parser.feed("0...10...2")
+    assert parser.fraction == pytest.approx(0.1)
+    assert parser.feed("0...")
+    assert parser.fraction == pytest.approx(0.2)
+
+
+def test_other_numbers_are_ignored():
+    parser = progress.ProgressParser()
+    assert not parser.feed("Input file size is 4096, 4096\nCreating output file that is 2048P x 2048L.\n")
+    assert not parser.feed("Band 1 Block=256x256 Type=Byte\n")
+    assert parser.fraction == 0.0
+    assert not parser.feed("250...")  # not a percentage
+
+
+def test_repeated_value_is_no_change():
+    parser = progress.ProgressParser()
+    assert parser.feed("40...")
+    assert not parser.feed("40...")
+
+
+def test_several_passes():
+    parser = progress.ProgressParser(expected_passes=2)
+    parser.feed("0...10...20...30...40...50...60...70...80...90...100 - done.\n")
+    assert parser.fraction == pytest.approx(0.5)
+    parser.feed("Generating Overview Tiles:\n0...10...20...30...40...50...")
+    assert parser.fraction == pytest.approx(0.75)
+    parser.feed("...60...70...80...90...100 - done.\n")
+    assert parser.fraction == 1.0
+
+
+def test_extra_passes_do_not_overflow():
+    # An unexpected extra pass is tracked as the last pass again, never past 1.
+    parser = progress.ProgressParser(expected_passes=2)
+    parser.feed("0...100 - done.\n0...100 - done.\n0...100 - done.\n")
+    assert parser.passes_done == 1
+    assert parser.fraction == 1.0
+
+
+def test_pending_text_is_bounded():
+    parser = progress.ProgressParser()
+    parser.feed("x" * 10000)
+    assert len(parser._pending) <= progress.MAX_PENDING_CHARS
+
+
+def test_tracker_fraction_and_eta():
+    updates = []
+    tracker = progress.ProgressTracker(["copy", "overviews"], updates.append)
+    assert tracker.eta is None
+    tracker.start_stage(1)
+    tracker.update_stage(0.5)
+    assert tracker.stage_name == "overviews"
+    assert tracker.fraction == pytest.approx(0.75)
+    assert tracker.eta is not None and tracker.eta >= 0
+    tracker.update_stage(2.0)
+    assert tracker.fraction == 1.0
+    tracker.finish()
+    assert tracker.stage_name == ""
+    assert len(updates) == 4
+
+
+def test_format_duration():
+    assert progress.format_duration(None) == "--"
+    assert progress.format_duration(42.4) == "42s"
+    assert progress.format_duration(125) == "2m 05s"
+    assert progress.format_duration(3 * 3600 + 7 * 60) == "3h 07m"
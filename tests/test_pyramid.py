@@ -0,0 +1,216 @@
+import json
+import os
+
+import pytest
+
+import map_tiler_pyramid as pyramid
+
+
+def test_tile_grid_counts():
+    grid = pyramid.TileGrid(1500, 1100)
+    assert grid.native_zoom == 3
+    assert [grid.tile_counts(z) for z in range(5)] == [(1, 1), (2, 2), (3, 3), (6, 5), (12, 9)]
+    assert grid.tile_span(3) == 256
+    assert grid.tile_span(4) == 128
+    assert len(list(grid.tiles(3))) == grid.tile_count(3) == 30
+
+
+def test_tile_grid_small_raster():
+    grid = pyramid.TileGrid(100, 40)
+    assert grid.native_zoom == 0
+    assert grid.tile_counts(0) == (1, 1)
+
+
+def test_tile_index_is_column_major():
+    grid = pyramid.TileGrid(1500, 1100)
+    rows = grid.tile_counts(3)[1]
+    assert [grid.tile_index(3, x, y) for x, y in grid.tiles(3)] == list(range(grid.tile_count(3)))
+    assert grid.tile_index(3, 2, 1) == 2 * rows + 1
+
+
+def test_tiles_in_window_counts_rows_from_the_bottom():
+    grid = pyramid.TileGrid(1024, 1024)
+    # The top-left source pixel lies in the top row of tiles, which is TMS row rows - 1.
+    assert grid.tiles_in_window(2, (0, 0, 1, 1)) == {(0, 3)}
+    assert grid.tiles_in_window(2, (255, 0, 257, 1)) == {(0, 3), (1, 3)}
+    assert grid.tiles_in_window(0, (0, 0, 1024, 1024)) == {(0, 0)}
+
+
+def test_tile_window_of_partial_edge_tile():
+    grid = pyramid.TileGrid(300, 300)
+    assert grid.native_zoom == 1
+    # Tile (1, 1) is the top-right corner: 44 x 44 source pixels at the top of the raster.
+    rx, ry, rxsize, rysize, wx, wy, wxsize, wysize = grid.tile_window(1, 1, 1)
+    assert (rx, ry, rxsize, rysize) == (256, 0, 44, 44)
+    assert (wxsize, wysize) == (44, 44)
+
+
+def test_bitmaps_set_and_clear(tmp_path):
+    grid = pyramid.TileGrid(1500, 1100)
+    bitmaps = pyramid.TileBitmaps(str(tmp_path), grid)
+    assert not bitmaps.is_set(4, 11, 8)
+    bitmaps.set(4, 11, 8)
+    bitmaps.set(4, 0, 0)
+    assert bitmaps.dirty
+    assert bitmaps.is_set(4, 11, 8) and bitmaps.is_set(4, 0, 0)
+    assert not bitmaps.is_set(4, 10, 8)
+    assert bitmaps.count(4) == 2
+    assert sorted(bitmaps.tiles_set(4)) == [(0, 0), (11, 8)]
+    bitmaps.set(4, 0, 0, False)
+    assert sorted(bitmaps.tiles_set(4)) == [(11, 8)]
+
+
+def test_bitmaps_unchanged_set_is_not_dirty(tmp_path):
+    bitmaps = pyramid.TileBitmaps(str(tmp_path), pyramid.TileGrid(1500, 1100))
+    bitmaps.set(2, 1, 1, False)
+    assert not bitmaps.dirty
+
+
+def test_bitmap_layout(tmp_path):
+    grid = pyramid.TileGrid(1500, 1100)
+    bitmaps = pyramid.TileBitmaps(str(tmp_path), grid)
+    bitmaps.set(3, 1, 3)  # index 1 * 5 + 3 = 8: bit 0 of byte 1
+    bitmaps.write_bitmaps()
+    with open(tmp_path / "3.bitmap", "rb") as f:
+        assert f.read() == bytes([0, 1, 0, 0])
+
+
+def test_bitmaps_round_trip(tmp_path):
+    grid = pyramid.TileGrid(1500, 1100)
+    bitmaps = pyramid.TileBitmaps(str(tmp_path), grid)
+    for x, y in [(0, 0), (5, 4), (3, 2)]:
+        bitmaps.set(3, x, y)
+    bitmaps.set(0, 0, 0)
+    bitmaps.write_bitmaps()
+    loaded = pyramid.TileBitmaps(str(tmp_path), grid)
+    loaded.load_bitmaps()
+    assert sorted(loaded.tiles_set(3)) == [(0, 0), (3, 2), (5, 4)]
+    assert list(loaded.tiles_set(0)) == [(0, 0)]
+
+
+def test_empty_tiles_index(tmp_path):
+    grid = pyramid.TileGrid(1500, 1100)
+    empty = pyramid.EmptyTiles(str(tmp_path), grid)
+    stats = pyramid.new_tile_stats()
+    stats["empty_tiles"] = [(4, 1, 2), (4, 3, 3)]
+    empty.add(stats)
+    assert "empty_tiles" not in stats
+    empty.clear(4, [(3, 3)])
+    empty.checkpoint()
+    with open(os.path.join(empty.directory, "index.json"), encoding="utf-8") as f:
+        assert json.load(f)["zoom_levels"] == {"4": [12, 9]}
+    assert list(pyramid.EmptyTiles(str(tmp_path), grid).tiles_set(4)) == [(1, 2)]
+
+
+def manifest_params(tmp_path, **changes):
+    source = tmp_path / "source.tif"
+    source.write_bytes(b"x")
+    grid = pyramid.TileGrid(1500, 1100)
+    params = pyramid.pyramid_params(str(source), grid, 0, 4, "average")
+    return grid, {**params, **changes}
+
+
+def test_manifest_checkpoint_and_resume(tmp_path):
+    output_dir = str(tmp_path / "tiles")
+    grid, params = manifest_params(tmp_path)
+    manifest = pyramid.open_manifest(output_dir, grid, params, log=lambda text: None)
+    assert os.path.exists(os.path.join(manifest.directory, "manifest.json"))
+    manifest.mark_done(4, 2, 3)
+    manifest.checkpoint()
+    resumed = pyramid.open_manifest(output_dir, grid, params, log=lambda text: None)
+    assert resumed.is_done(4, 2, 3)
+    assert resumed.done_count(4) == 1
+
+
+def test_manifest_refuses_other_settings(tmp_path):
+    output_dir = str(tmp_path / "tiles")
+    grid, params = manifest_params(tmp_path)
+    pyramid.open_manifest(output_dir, grid, params, log=lambda text: None)
+    with pytest.raises(ValueError, match="resampling"):
+        pyramid.open_manifest(output_dir, grid, {**params, "resampling": "nearest"}, log=lambda text: None)
+
+
+def test_manifest_refuses_tiles_without_one(tmp_path):
+    output_dir = tmp_path / "tiles"
+    (output_dir / "0" / "0").mkdir(parents=True)
+    grid, params = manifest_params(tmp_path)
+    with pytest.raises(ValueError, match="no tile manifest"):
+        pyramid.open_manifest(str(output_dir), grid, params, log=lambda text: None)
+
+
+def test_changed_params_ignores_keys():
+    stored = {"input_size": 1, "levels": [0, 4], "resampling": "average"}
+    params = {"input_size": 2, "levels": [0, 5], "resampling": "average", "tile_size": 256}
+    assert pyramid.changed_params(stored, params) == ["input_size", "levels", "tile_size"]
+    assert pyramid.changed_params(stored, params, ("input_size",)) == ["levels", "tile_size"]
+
+
+def test_reduce_children_average_weights_by_alpha():
+    np = pytest.importorskip("numpy")
+    block = np.zeros((1, 2, 4, 4), dtype=np.uint8)
+    block[0, 0] = [[10, 30, 200, 200], [50, 70, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
+    block[0, 1] = [[255, 255, 255, 255], [255, 255, 0, 0], [0, 0, 0, 0], [255, 0, 0, 0]]
+    parents = pyramid.reduce_children(block, "average")
+    assert parents.shape == (1, 2, 2, 2)
+    assert parents.dtype == np.uint8
+    # Fully opaque: the plain mean. Half transparent: only the opaque pixels count for the
+    # colour. Fully transparent: black.
+    assert parents[0, 0].tolist() == [[40, 200], [0, 0]]
+    assert parents[0, 1].tolist() == [[255, 128], [64, 0]]
+
+
+def test_reduce_children_average_rounds():
+    np = pytest.importorskip("numpy")
+    block = np.full((1, 2, 2, 2), 255, dtype=np.uint8)
+    block[0, 0] = [[1, 2], [2, 2]]
+    assert pyramid.reduce_children(block, "average")[0, 0, 0, 0] == 2
+
+
+def test_reduce_children_nearest_matches_gdal_pick():
+    np = pytest.importorskip("numpy")
+    block = np.arange(2 * 4 * 4, dtype=np.uint8).reshape(1, 2, 4, 4)
+    block[0, 1] = 255
+    block[0, 1, 3, 3] = 0
+    parents = pyramid.reduce_children(block, "nearest")
+    assert parents[0, 1].tolist() == [[255, 255], [255, 0]]
+    # The odd rows and columns; under a transparent pixel the colour is black.
+    assert parents[0, 0].tolist() == [[5, 7], [13, 0]]
+
+
+def test_child_block_places_children_tms_order():
+    np = pytest.importorskip("numpy")
+    grid = pyramid.TileGrid(4, 4, tile_size=2)
+    assert grid.tile_counts(1) == (2, 2)
+    children = {(cx, cy): np.full((1, 2, 2), 10 * cx + cy + 1, dtype=np.uint8) for cx, cy in pyramid.child_tiles(grid, 0, 0, 0)}
+    block = pyramid.child_block(grid, 0, 0, 0, children)
+    # y counts up from the bottom, so the y=1 children are the top half of the block.
+    assert block[0, ::2, ::2].tolist() == [[2, 12], [1, 11]]
+
+
+def test_child_block_edge_children_stay_transparent():
+    np = pytest.importorskip("numpy")
+    grid = pyramid.TileGrid(6, 4, tile_size=2)
+    # Zoom 1 has 2 x 1 tiles; the children of (1, 0) at zoom 2 are cut off at the top.
+    assert grid.tile_counts(2) == (3, 2)
+    assert pyramid.child_tiles(grid, 1, 1, 0) == [(2, 0), (2, 1)]
+    children = {tile: np.full((2, 2, 2), 255, dtype=np.uint8) for tile in pyramid.child_tiles(grid, 1, 1, 0)}
+    block = pyramid.child_block(grid, 1, 1, 0, children)
+    assert block[1, :, :2].all() and not block[1, :, 2:].any()
+
+
+def test_tile_arrays_round_trip(tmp_path):
+    np = pytest.importorskip("numpy")
+    arrays = pyramid.TileArrays(str(tmp_path / "arrays"))
+    assert arrays.load(3, 1, 2) is None
+    tile = np.arange(2 * 4 * 4, dtype=np.uint8).reshape(2, 4, 4)
+    arrays.save(3, 1, 2, tile)
+    assert np.array_equal(arrays.load(3, 1, 2), tile)
+    arrays.clear()
+    assert arrays.load(3, 1, 2) is None
+
+
+def test_lossy_encodings():
+    assert pyramid.TileEncoding("jpeg").lossy
+    assert pyramid.TileEncoding("webp").lossy
+    assert not pyramid.TileEncoding("webp-lossless").lossy
+    assert not pyramid.PNG_ENCODING.lossy
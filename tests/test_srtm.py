@@ -0,0 +1,41 @@
+import pytest
+
+import map_tiler_srtm as srtm
+
+
+def hgt_bounds(lat, lon, grid_size):
+    # Footprint of an HGT cell as GDAL reports it: samples on the degree lines, so the pixel
+    # edges reach half a sample past them, and the far edge is a sum of float pixel sizes.
+    pixel = 1.0 / (grid_size - 1)
+    west, north = lon - pixel / 2, lat + 1 + pixel / 2
+    return west, north - grid_size * pixel, west + grid_size * pixel, north
+
+
+@pytest.mark.parametrize("grid_size", sorted(srtm.SRTM_GRID_SIZES.values()))
+def test_hgt_cell_maps_to_itself(grid_size):
+    for lat in range(-90, 90):
+        for lon in (-180, -91, -1, 0, 7, 179):
+            assert srtm.cells_in_bounds(*hgt_bounds(lat, lon, grid_size)) == [(lat, lon)]
+
+
+def test_cell_range_on_degree_lines():
+    assert srtm.cell_range(10.0, 11.0) == range(10, 11)
+    assert srtm.cell_range(10.0, 12.0) == range(10, 12)
+    # Float sums landing a hair either side of the line.
+    assert srtm.cell_range(10.000000000001, 10.999999999999) == range(10, 11)
+    assert srtm.cell_range(9.999999999999, 11.000000000001) == range(10, 11)
+
+
+def test_cell_range_past_the_tolerance():
+    reach = 2 * srtm.EDGE_TOLERANCE
+    assert srtm.cell_range(10.0 - reach, 11.0 + reach) == range(9, 12)
+
+
+def test_cell_range_inside_one_cell():
+    assert srtm.cell_range(10.2, 10.4) == range(10, 11)
+    assert srtm.cell_range(-0.4, -0.2) == range(-1, 0)
+
+
+def test_cells_in_bounds_spans_and_clips():
+    assert srtm.cells_in_bounds(-1.5, 44.5, 1.5, 45.5) == [(44, -2), (44, -1), (44, 0), (44, 1), (45, -2), (45, -1), (45, 0), (45, 1)]
+    assert srtm.cells_in_bounds(179.5, 89.5, 181.0, 91.0) == [(89, 179)]